@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import threading
+import tracemalloc
+
+from game import WerewolfGame
+from llm_backends import MockBackend
+from events import NullSink
+from config import GameConfig
+from simulate import ensure_prompt_templates
+
+# 默认的基准文件，--save-baseline 和 --compare 不指定文件时使用
+DEFAULT_BASELINE_PATH = os.path.join("game_records", "benchmark_baseline.json")
+
+# 默认测试的人数
+DEFAULT_SIZES = (9, 12, 16, 20, 25, 30)
+
+# 计时的游戏阶段，对应 WerewolfGame 的方法
+TIMED_PHASES = ("night_phase", "player_speak", "voting_phase")
+
+# 组装提示时调用的玩家方法，渲染模板和拼接记忆文本的耗时都计入提示组装时间
+PROMPT_METHODS = ("_format_prompt", "get_public_memory_text", "get_private_memory_text")
+
+# 与基准比较的指标，值为 True 表示越大越好
+COMPARED_METRICS = {
+    "games_per_sec": True,
+    "night_phase": False,
+    "player_speak": False,
+    "voting_phase": False,
+    "prompt_assembly": False,
+    "peak_memory_kb": False
+}
+
+# 确定性的指标，相同设置下与基准不同说明游戏逻辑或提示发生了变化
+EXACT_METRICS = ("calls_per_game", "prompt_tokens_per_game")
+
+# 每多少名玩家配置一组预言家、女巫、猎人、守卫和白痴
+PLAYERS_PER_SPECIAL_GROUP = 40
+
+def build_roles(players_count):
+    """
+    按人数生成角色：约三分之一为狼人，每40名玩家一组预言家、女巫、猎人、守卫和白痴（至少一组），其余为村民
+    """
+    groups = max(1, players_count // PLAYERS_PER_SPECIAL_GROUP)
+    werewolves_count = max(2, players_count // 3)
+    roles = ["werewolf"] * werewolves_count + ["seer", "witch", "hunter", "guard", "idiot"] * groups
+    roles += ["villager"] * (players_count - len(roles))
+    config = GameConfig({
+        "game_settings": {"players_count": players_count},
+        "players": [{"role": role} for role in roles]
+    })
+    return [(name, role) for name, role, _ in config.role_setup()]
+
+class PhaseTimer:
+    """替换游戏和玩家实例上的方法，累计每个阶段和提示组装的耗时，不修改游戏代码"""
+    
+    def __init__(self):
+        self.totals = {}  # 键为计时项的名称，值为累计秒数
+        self._active = threading.local()  # 当前线程正在计时的提示组装方法，嵌套调用只计一次
+        self._lock = threading.Lock()
+    
+    def wrap_game(self, game):
+        """为游戏的各阶段方法计时"""
+        for name in TIMED_PHASES:
+            setattr(game, name, self._timed(name, getattr(game, name)))
+        for player in game.players.values():
+            for name in PROMPT_METHODS:
+                setattr(player, name, self._timed("prompt_assembly", getattr(player, name), exclusive=True))
+    
+    def _timed(self, key, fn, exclusive=False):
+        def _wrapper(*args, **kwargs):
+            if exclusive and getattr(self._active, "depth", 0):
+                return fn(*args, **kwargs)
+            if exclusive:
+                self._active.depth = 1
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                if exclusive:
+                    self._active.depth = 0
+                with self._lock:
+                    self.totals[key] = self.totals.get(key, 0.0) + elapsed
+        return _wrapper
+
+def create_game(players_count, seed, options):
+    """创建一局使用模拟后端、不输出事件的游戏"""
+    game = WerewolfGame(
+        backend=MockBackend(seed=seed, latency=options["latency"]),
+        event_sink=NullSink(),
+        seed=seed,
+        max_rounds=options["max_rounds"],
+        parallel_voting=options["parallel_voting"],
+        concurrent_night=options["concurrent_night"],
+        concurrent_speech=options["concurrent_speech"],
+        reflection=options["reflection"],
+        prompt_layout=options["prompt_layout"],
+        wolf_decision=options["wolf_decision"]
+    )
+    for name, role in build_roles(players_count):
+        game.add_player(name, role)
+    return game
+
+def run_setup(players_count, games, options, base_seed=0):
+    """
+    对一种人数依次运行多局游戏，返回该人数的测量结果
+    
+    计时的对局不开启内存追踪，另外运行一局开启 tracemalloc 的游戏测量峰值内存。
+    
+    Returns:
+        dict: 每秒局数、每局各阶段和提示组装的平均耗时（秒）、每局平均调用数和提示token数、峰值内存（KB）
+    """
+    timer = PhaseTimer()
+    calls = 0
+    prompt_tokens = 0
+    days = 0
+    start = time.perf_counter()
+    for game_index in range(games):
+        game = create_game(players_count, base_seed + game_index, options)
+        timer.wrap_game(game)
+        game.start_game()
+        calls += game.get_call_stats()["calls"]
+        prompt_tokens += game.metrics.summary()["total"].get("prompt_tokens", 0)
+        days += game.day_count
+    elapsed = time.perf_counter() - start
+    
+    tracemalloc.start()
+    try:
+        create_game(players_count, base_seed, options).start_game()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    
+    result = {
+        "players": players_count,
+        "games": games,
+        "games_per_sec": round(games / elapsed, 3) if elapsed > 0 else None,
+        "days_per_game": round(days / games, 2),
+        "calls_per_game": round(calls / games, 2),
+        "prompt_tokens_per_game": round(prompt_tokens / games, 1),
+        "peak_memory_kb": round(peak / 1024, 1)
+    }
+    for name in TIMED_PHASES + ("prompt_assembly",):
+        result[name] = round(timer.totals.get(name, 0.0) / games, 6)
+    return result
+
+def run_benchmark(sizes, games, options, base_seed=0):
+    """运行所有人数的基准测试，返回可以写入基准文件的结果"""
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "options": dict(options, base_seed=base_seed, games=games),
+        "setups": [run_setup(size, games, options, base_seed) for size in sizes]
+    }
+
+def compare_results(baseline, current, tolerance):
+    """
+    与基准比较，返回发现的问题列表
+    
+    计时和内存指标变差超过 tolerance（比例）时视为退化；确定性的指标与基准不同时视为变化。
+    设置不同的结果之间不能比较。
+    """
+    if baseline["options"] != current["options"]:
+        return [f"基准的设置 {baseline['options']} 与本次的设置 {current['options']} 不同，无法比较"]
+    
+    problems = []
+    baseline_setups = {setup["players"]: setup for setup in baseline["setups"]}
+    for setup in current["setups"]:
+        base = baseline_setups.get(setup["players"])
+        if base is None:
+            continue
+        for name, higher_is_better in COMPARED_METRICS.items():
+            old, new = base.get(name), setup.get(name)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                problems.append(f"{setup['players']}人局 {name}: {old} -> {new}（{change:+.1%}）")
+        for name in EXACT_METRICS:
+            if base.get(name) != setup.get(name):
+                problems.append(f"{setup['players']}人局 {name}: {base.get(name)} -> {setup.get(name)}（与基准不同）")
+    return problems
+
+def print_results(results):
+    """输出每种人数的测量结果，阶段耗时为每局的平均值"""
+    for setup in results["setups"]:
+        print(
+            f"{setup['players']}人局: {setup['games_per_sec']} 局/秒，每局 {setup['days_per_game']} 天、"
+            f"{setup['calls_per_game']} 次调用；夜晚 {setup['night_phase'] * 1000:.2f}ms，"
+            f"发言 {setup['player_speak'] * 1000:.2f}ms，投票 {setup['voting_phase'] * 1000:.2f}ms，"
+            f"提示组装 {setup['prompt_assembly'] * 1000:.2f}ms；峰值内存 {setup['peak_memory_kb']}KB"
+        )
+
+def main():
+    """基准测试入口"""
+    parser = argparse.ArgumentParser(description='狼人杀游戏引擎基准测试')
+    parser.add_argument('--sizes', help='逗号分隔的玩家人数，默认为 9,12,16,20,25,30')
+    parser.add_argument('--games', type=int, default=5, help='每种人数计时的对局数')
+    parser.add_argument('--seed', type=int, default=0, help='起始随机种子，第i局使用 seed + i')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟后端每次请求的固定延迟，单位秒，默认为0只测量引擎开销')
+    parser.add_argument('--max-rounds', type=int, default=20, help='每局的最大天数')
+    parser.add_argument('--parallel-voting', action='store_true', help='同时收集所有玩家的投票')
+    parser.add_argument('--concurrent-night', action='store_true', help='夜晚互不依赖的角色行动并发执行')
+    parser.add_argument('--concurrent-speech', action='store_true', help='白天所有玩家基于同一份游戏记录同时发言')
+    parser.add_argument('--reflection', choices=WerewolfGame.REFLECTION_POLICIES, default='each', help='夜晚思考方式')
+    parser.add_argument('--prompt-layout', choices=WerewolfGame.PROMPT_LAYOUTS, default='inline', help='提示布局')
+    parser.add_argument('--wolf-decision', choices=WerewolfGame.WOLF_DECISIONS, default='leader', help='狼人的夜晚决策方式')
+    parser.add_argument('--output', metavar='PATH', help='把测量结果以JSON格式写入该文件')
+    parser.add_argument('--save-baseline', nargs='?', const=DEFAULT_BASELINE_PATH, metavar='PATH',
+                        help=f'把测量结果保存为基准，不指定文件时使用 {DEFAULT_BASELINE_PATH}')
+    parser.add_argument('--compare', nargs='?', const=DEFAULT_BASELINE_PATH, metavar='PATH',
+                        help='与基准比较，有退化时以状态码1退出')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='计时和内存指标允许变差的比例')
+    args = parser.parse_args()
+    
+    sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else list(DEFAULT_SIZES)
+    options = {
+        "latency": args.latency,
+        "max_rounds": args.max_rounds,
+        "parallel_voting": args.parallel_voting,
+        "concurrent_night": args.concurrent_night,
+        "concurrent_speech": args.concurrent_speech,
+        "reflection": args.reflection,
+        "prompt_layout": args.prompt_layout,
+        "wolf_decision": args.wolf_decision
+    }
+    
+    ensure_prompt_templates()
+    results = run_benchmark(sizes, args.games, options, args.seed)
+    print_results(results)
+    
+    for path in (args.output, args.save_baseline):
+        if path:
+            directory = os.path.dirname(os.path.abspath(path))
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f"\n测量结果已写入 {path}")
+    
+    if args.compare:
+        try:
+            with open(args.compare, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"错误：无法读取基准文件: {e}", file=sys.stderr)
+            return 1
+        problems = compare_results(baseline, results, args.tolerance)
+        if problems:
+            print(f"\n与基准 {args.compare} 相比:")
+            for problem in problems:
+                print(f"- {problem}")
+            return 1
+        print(f"\n与基准 {args.compare} 相比没有退化")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,119 @@
+import os
+import json
+import time
+
+class CheckpointWriter:
+    """
+    在每个阶段结束时把游戏状态追加写入JSONL检查点文件
+    
+    第一条记录是完整状态，之后的记录只包含新增的记忆条目和其他较小的状态，
+    记忆被裁剪过时才重新写入该记忆的完整内容。每条记录写入后立即 fsync，
+    进程崩溃时最多丢失正在写入的最后一行，继续写入前会把它截掉。
+    """
+    
+    def __init__(self, path):
+        """
+        Args:
+            path (str): 检查点文件路径，已存在时截掉不完整的最后一行后在末尾继续追加
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        if os.path.exists(path):
+            _truncate_partial_line(path)
+        
+        self.path = path
+        self._markers = {}  # 每份记忆上次保存时的状态，键与记录中 "memory" 的键相同
+        self._file = open(path, "a", encoding="utf-8")
+    
+    def save(self, game):
+        """追加一条检查点记录"""
+        memories = {"public": game.public_log}
+        for name, player in game.players.items():
+            memories[f"private:{name}"] = player.private_memory
+        
+        record = {
+            "type": "delta" if self._markers else "full",
+            "time": time.time(),
+            "game": game.get_state(),
+            "players": {name: player.get_state() for name, player in game.players.items()},
+            "memory": {key: self._memory_delta(key, store) for key, store in memories.items()}
+        }
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    
+    def _memory_delta(self, key, store):
+        """返回一份记忆自上次保存以来的变化"""
+        snapshot = store.snapshot()
+        appended, dropped, summarized = snapshot["counts"]
+        marker = (appended, len(snapshot["pinned"]), dropped + summarized)
+        previous = self._markers.get(key)
+        self._markers[key] = marker
+        
+        if previous is not None and marker[1:] == previous[1:]:
+            # 没有新的固定记忆也没有被裁剪过，只需要写入新增的条目
+            new_count = appended - previous[0]
+            return {"append": snapshot["entries"][len(snapshot["entries"]) - new_count:] if new_count else [],
+                    "counts": snapshot["counts"]}
+        return {"full": snapshot}
+    
+    def close(self):
+        """关闭检查点文件"""
+        if not self._file.closed:
+            self._file.close()
+
+def _truncate_partial_line(path):
+    """把文件截断到最后一个完整的行，否则下一条记录会接在写了一半的行后面，之后的记录都无法读取"""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            f.seek(start)
+            index = f.read(position - start).rfind(b"\n")
+            if index >= 0:
+                position = start + index + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+def load_checkpoint(path):
+    """
+    读取检查点文件，依次应用所有记录，返回最新的游戏状态
+    
+    Returns:
+        dict: 包含 game、players 和 memory（每份记忆的完整状态）的字典
+    """
+    state = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 写入中途崩溃留下的不完整的最后一行
+                break
+            
+            if record["type"] == "full" or state is None:
+                state = {"game": None, "players": {}, "memory": {}}
+            state["game"] = record["game"]
+            state["players"] = record["players"]
+            for key, delta in record["memory"].items():
+                if "full" in delta:
+                    state["memory"][key] = delta["full"]
+                else:
+                    memory = state["memory"][key]
+                    memory["entries"].extend(delta["append"])
+                    memory["counts"] = delta["counts"]
+    
+    if state is None:
+        raise ValueError(f"检查点文件 {path} 中没有有效的记录")
+    return state
+
+def find_latest_checkpoint(directory):
+    """返回目录中最近修改的检查点文件，没有时返回None"""
+    if not os.path.isdir(directory):
+        return None
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".jsonl")]
+    return max(paths, key=os.path.getmtime) if paths else None
\ No newline at end of file
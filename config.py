@@ -0,0 +1,276 @@
+import os
+import json
+import random
+import itertools
+
+# 默认的配置文件
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "game_config.json")
+
+# 配置文件中表示未填写API密钥的占位符
+API_KEY_PLACEHOLDER = "your_api_key_here"
+
+# 支持的角色
+ROLE_NAMES = ("villager", "werewolf", "witch", "seer", "guard", "hunter", "idiot")
+
+# 按人数生成角色时的特殊角色，格式为 (角色, game_settings 中的开关, 默认是否启用)
+SPECIAL_ROLES = (
+    ("seer", "seer_enabled", True),
+    ("witch", "witch_enabled", True),
+    ("hunter", "hunter_enabled", False),
+    ("guard", "guard_enabled", False),
+    ("idiot", "idiot_enabled", False)
+)
+
+class ConfigError(ValueError):
+    """配置不合法，errors 列出发现的所有问题"""
+    
+    def __init__(self, errors, path=None):
+        self.errors = list(errors)
+        source = f"配置文件 {path}" if path else "配置"
+        super().__init__(f"{source}不合法:\n" + "\n".join(f"- {error}" for error in self.errors))
+
+class GameConfig:
+    """
+    校验后的游戏配置，格式与 game_config.json 相同
+    
+    角色可以在 players 中逐个指定，也可以由 game_settings 中的人数、狼人数和特殊角色开关生成。
+    sweeps 的每个键是 game_settings 的一个字段，值是候选值列表，expand_sweeps 按所有组合生成多份配置。
+    """
+    
+    def __init__(self, data, path=None):
+        """
+        Args:
+            data (dict): 配置内容
+            path (str): 配置文件路径，只用于错误信息
+        
+        Raises:
+            ConfigError: 配置不合法
+        """
+        self.data = data
+        self.path = path
+        errors = []
+        if not isinstance(data, dict):
+            raise ConfigError(["配置必须是JSON对象"], path)
+        
+        settings = self._get_section(data, "game_settings", errors)
+        llm_settings = self._get_section(data, "llm_settings", errors)
+        
+        # 游戏设置
+        self.max_rounds = self._get_int(settings, "max_rounds", errors, minimum=1, default=None)
+        self.seed = self._get_int(settings, "seed", errors, default=None)
+        self.shuffle_roles = self._get_bool(settings, "shuffle_roles", errors, default=False)
+        
+        # 模型设置
+        api_key = llm_settings.get("api_key")
+        self.api_key = api_key if api_key and api_key != API_KEY_PLACEHOLDER else None
+        self.api_base = llm_settings.get("api_base")
+        self.model = llm_settings.get("model")
+        self.temperature = self._get_number(llm_settings, "temperature", errors, minimum=0, maximum=2, default=0.7)
+        self.max_tokens = self._get_int(llm_settings, "max_tokens", errors, minimum=1, default=500)
+        self.timeout = self._get_number(llm_settings, "timeout", errors, minimum=0, default=None)
+        self.available_models = llm_settings.get("available_models", [])
+        if not isinstance(self.available_models, list) or not all(isinstance(m, str) for m in self.available_models):
+            errors.append("llm_settings.available_models 必须是模型名称的列表")
+            self.available_models = []
+        if self.model is not None and self.available_models and self.model not in self.available_models:
+            errors.append(f"llm_settings.model {self.model} 不在 available_models 中")
+        
+        # 玩家和角色
+        self.players = self._parse_players(data.get("players", []), settings, errors)
+        
+        self.sweeps = data.get("sweeps", {})
+        if not isinstance(self.sweeps, dict) or not all(isinstance(v, list) and v for v in self.sweeps.values()):
+            errors.append("sweeps 必须是对象，每个值是非空的候选值列表")
+            self.sweeps = {}
+        
+        if errors:
+            raise ConfigError(errors, path)
+    
+    def _parse_players(self, players, settings, errors):
+        """校验玩家列表和角色配置，返回每个座位的 {"name", "role", "model"}"""
+        if not isinstance(players, list) or not all(isinstance(p, dict) for p in players):
+            errors.append("players 必须是对象的列表")
+            return []
+        
+        players_count = self._get_int(settings, "players_count", errors, minimum=3, default=len(players) or None)
+        if players_count is None:
+            errors.append("需要在 game_settings.players_count 中指定人数或在 players 中列出玩家")
+            return []
+        if len(players) > players_count:
+            errors.append(f"players 中有 {len(players)} 名玩家，超过了 players_count ({players_count})")
+            return []
+        
+        # 未列出的座位使用默认名称
+        seats = []
+        for i in range(players_count):
+            player = players[i] if i < len(players) else {}
+            seats.append({
+                "name": player.get("name") or f"玩家{i + 1}",
+                "role": player.get("role"),
+                "model": player.get("model")
+            })
+            api_key = player.get("api_key")
+            if api_key and api_key not in (API_KEY_PLACEHOLDER, self.api_key):
+                errors.append(f"玩家 {seats[-1]['name']}: 暂不支持为单个玩家设置API密钥，请使用 llm_settings.api_key")
+        
+        names = [seat["name"] for seat in seats]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            errors.append(f"玩家名称重复: {', '.join(duplicates)}")
+        
+        for seat in seats:
+            if seat["model"] is not None and self.available_models and seat["model"] not in self.available_models:
+                errors.append(f"玩家 {seat['name']} 的模型 {seat['model']} 不在 available_models 中")
+        
+        # 角色在 players 中逐个指定时必须为所有玩家指定，否则按人数生成
+        explicit = [seat["role"] for seat in seats if seat["role"] is not None]
+        if explicit:
+            if len(explicit) != len(seats):
+                errors.append("players 中只有部分玩家指定了角色，需要为所有玩家指定角色或都不指定")
+                return seats
+            if self.shuffle_roles:
+                errors.append("players 中指定了角色时不能使用 shuffle_roles")
+            roles = [role.lower() for role in explicit]
+        else:
+            roles = self._generate_roles(settings, players_count, errors)
+            if roles is None:
+                return seats
+        
+        unknown = sorted({role for role in roles if role not in ROLE_NAMES})
+        if unknown:
+            errors.append(f"不支持的角色类型: {', '.join(unknown)}")
+        werewolves = roles.count("werewolf")
+        if werewolves == 0:
+            errors.append("至少需要一名狼人")
+        elif werewolves >= len(roles) - werewolves:
+            errors.append(f"狼人数量 ({werewolves}) 必须少于好人数量 ({len(roles) - werewolves})，否则游戏开始即结束")
+        
+        for seat, role in zip(seats, roles):
+            seat["role"] = role
+        return seats
+    
+    def _generate_roles(self, settings, players_count, errors):
+        """按狼人数和特殊角色开关生成角色列表，其余座位为村民"""
+        werewolves_count = self._get_int(settings, "werewolves_count", errors, minimum=1, default=None)
+        if werewolves_count is None:
+            errors.append("没有在 players 中指定角色时需要 game_settings.werewolves_count")
+            return None
+        
+        roles = ["werewolf"] * werewolves_count
+        for role, flag, default in SPECIAL_ROLES:
+            if self._get_bool(settings, flag, errors, default=default):
+                roles.append(role)
+        if len(roles) > players_count:
+            errors.append(f"狼人和特殊角色共 {len(roles)} 名，超过了 players_count ({players_count})")
+            return None
+        return roles + ["villager"] * (players_count - len(roles))
+    
+    def _get_section(self, data, key, errors):
+        section = data.get(key, {})
+        if not isinstance(section, dict):
+            errors.append(f"{key} 必须是对象")
+            return {}
+        return section
+    
+    def _get_int(self, section, key, errors, minimum=None, default=None):
+        value = section.get(key, default)
+        if value is None:
+            return default
+        if isinstance(value, bool) or not isinstance(value, int):
+            errors.append(f"{key} 必须是整数")
+            return default
+        if minimum is not None and value < minimum:
+            errors.append(f"{key} 不能小于 {minimum}")
+            return default
+        return value
+    
+    def _get_number(self, section, key, errors, minimum=None, maximum=None, default=None):
+        value = section.get(key, default)
+        if value is None:
+            return default
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            errors.append(f"{key} 必须是数字")
+            return default
+        if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+            errors.append(f"{key} 必须在 {minimum} 到 {maximum if maximum is not None else '无穷大'} 之间")
+            return default
+        return value
+    
+    def _get_bool(self, section, key, errors, default=False):
+        value = section.get(key, default)
+        if not isinstance(value, bool):
+            errors.append(f"{key} 必须是 true 或 false")
+            return default
+        return value
+    
+    def role_setup(self, seed=None):
+        """
+        返回每个座位的 (玩家名称, 角色, 模型)，模型为None表示使用游戏的默认模型
+        
+        Args:
+            seed (int): shuffle_roles 为True时打乱角色的随机种子，None表示使用配置中的种子
+        """
+        roles = [seat["role"] for seat in self.players]
+        if self.shuffle_roles:
+            random.Random(self.seed if seed is None else seed).shuffle(roles)
+        return [(seat["name"], role, seat["model"]) for seat, role in zip(self.players, roles)]
+    
+    def add_players(self, game, seed=None):
+        """按配置向游戏添加所有玩家"""
+        for name, role, model_name in self.role_setup(seed):
+            game.add_player(name, role, model_name)
+    
+    def llm_options(self):
+        """返回传给 WerewolfGame 的 llm_options"""
+        return {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "timeout": self.timeout,
+            "api_base": self.api_base
+        }
+    
+    def expand_sweeps(self):
+        """
+        按 sweeps 中所有候选值的组合生成多份配置，没有 sweeps 时只返回自身
+        
+        sweeps 中的 players_count 小于 players 的长度时，该组合只使用 players 中的前几名玩家。
+        
+        Returns:
+            tuple: (variants, skipped)，variants 为 (组合名称, GameConfig) 列表，
+                skipped 为不合法组合的 (组合名称, ConfigError) 列表
+        """
+        if not self.sweeps:
+            return [("default", self)], []
+        
+        variants = []
+        skipped = []
+        keys = list(self.sweeps)
+        for values in itertools.product(*(self.sweeps[key] for key in keys)):
+            overrides = dict(zip(keys, values))
+            label = ",".join(f"{key}={value}" for key, value in overrides.items())
+            data = dict(self.data)
+            data["game_settings"] = {**self.data.get("game_settings", {}), **overrides}
+            data["sweeps"] = {}
+            if "players_count" in overrides and isinstance(overrides["players_count"], int):
+                # 人数较少的组合只使用 players 中的前几名玩家
+                data["players"] = list(self.data.get("players", []))[:overrides["players_count"]]
+            try:
+                variants.append((label, GameConfig(data, self.path)))
+            except ConfigError as e:
+                skipped.append((label, e))
+        return variants, skipped
+
+def load_config(path=DEFAULT_CONFIG_PATH):
+    """
+    读取并校验配置文件
+    
+    Raises:
+        OSError: 文件无法读取
+        ConfigError: 文件不是合法的JSON或配置不合法
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ConfigError([f"不是合法的JSON: {e}"], path) from e
+    return GameConfig(data, path)
\ No newline at end of file
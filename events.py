@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import threading
+
+# 事件类型
+GAME_START = "game_start"
+PHASE_START = "phase_start"
+ACTION = "action"
+KILL = "kill"
+VOTE = "vote"
+SPEECH = "speech"
+SPEECH_DELTA = "speech_delta"
+REVEAL = "reveal"
+ANNOUNCEMENT = "announcement"
+ROUND_LIMIT = "round_limit"
+GAME_END = "game_end"
+
+class GameEvent:
+    """游戏事件，创建后不再修改"""
+    
+    def __init__(self, seq, event_type, day, data, timestamp=None):
+        self.seq = seq  # 事件序号，从0开始递增
+        self.type = event_type  # 事件类型，见本模块的常量
+        self.day = day  # 事件发生的天数
+        self.data = data  # 事件内容
+        self.timestamp = timestamp or time.time()
+    
+    def to_dict(self):
+        """转换为可以序列化为JSON的字典"""
+        return {"seq": self.seq, "type": self.type, "day": self.day, "timestamp": self.timestamp, **self.data}
+
+class NullSink:
+    """丢弃所有事件，用于不需要任何输出的批量运行"""
+    
+    def write(self, event):
+        pass
+    
+    def close(self):
+        pass
+
+class ConsoleSink:
+    """把事件渲染为可读文本输出到控制台"""
+    
+    def __init__(self, live=False):
+        """
+        Args:
+            live (bool): 是否在发言生成过程中逐段输出（需要游戏开启 live_speech），否则发言结束后一次输出
+        """
+        self.live = live
+        self._live_speaker = None  # 正在逐段输出发言的玩家
+        self._live_done = set()  # 已经逐段输出过的发言，键为 (天数, 玩家)
+    
+    # 夜晚行动和猎人开枪的文本，键为(角色, 行动)
+    ACTION_TEMPLATES = {
+        ("guard", "protect"): "守卫保护了 {target}",
+        ("werewolf", "attack"): "狼人选择袭击 {target}",
+        ("seer", "check"): "预言家查验了 {target}",
+        ("witch", "save"): "女巫使用解药救了 {target}",
+        ("witch", "poison"): "女巫使用毒药毒死了 {target}",
+        ("hunter", "shoot"): "猎人在死前射杀了 {target}"
+    }
+    
+    # 阶段开始的文本
+    PHASE_TEMPLATES = {
+        "day": "\n=== 第 {day} 天 ===",
+        "night": "\n--- 夜晚阶段 ---",
+        "daytime": "\n--- 白天阶段 ---",
+        "speech": "\n各位玩家开始发言：",
+        "vote": "\n开始投票："
+    }
+    
+    def write(self, event):
+        if self.live and event.type in (SPEECH_DELTA, SPEECH):
+            self._write_live(event)
+            return
+        text = self.render(event)
+        if text is not None:
+            print(text)
+    
+    def _write_live(self, event):
+        """逐段输出发言，完整的发言事件只在没有逐段输出过时才输出"""
+        data = event.data
+        key = (event.day, data["player"])
+        if event.type == SPEECH_DELTA:
+            if self._live_speaker != key:
+                # 新的发言另起一行，流水线发言时上一段发言可能还没有结束输出
+                if self._live_speaker is not None:
+                    print()
+                print(f"\n{data['player']} ({data['role_name']}) 说：", end="")
+                self._live_speaker = key
+                self._live_done.add(key)
+            print(data["text"], end="", flush=True)
+            return
+        
+        if key in self._live_done:
+            self._live_done.discard(key)
+            if self._live_speaker == key:
+                print()
+                self._live_speaker = None
+            return
+        print(self.render(event))
+    
+    def render(self, event):
+        """返回事件对应的文本，不需要输出的事件返回None"""
+        data = event.data
+        if event.type == GAME_START:
+            if data.get("resumed"):
+                return f"=== 从第 {event.day} 天继续游戏 ==="
+            return "=== 游戏开始 ==="
+        if event.type == PHASE_START:
+            return self.PHASE_TEMPLATES[data["phase"]].format(day=event.day)
+        if event.type == ACTION:
+            if data["role"] == "werewolf" and data["target"] is None:
+                # 狼人的目标被保护或没有选择目标
+                return "今晚没有人被狼人杀死"
+            return self.ACTION_TEMPLATES[(data["role"], data["action"])].format(target=data["target"])
+        if event.type == KILL:
+            return f"{data['player']} 因{data['reason']}死亡"
+        if event.type == VOTE:
+            return f"{data['voter']} 投票给 {data['target']}"
+        if event.type == SPEECH:
+            return f"\n{data['player']} ({data['role_name']}) 说：{data['text']}"
+        if event.type == REVEAL:
+            return f"{data['player']} 展示了白痴身份，继续存活但失去投票权"
+        if event.type == ANNOUNCEMENT:
+            return data["message"]
+        if event.type == ROUND_LIMIT:
+            return f"\n已达到最大天数 {data['max_rounds']}，游戏结束"
+        if event.type == GAME_END:
+            lines = ["\n=== 游戏结束 ===", f"胜利者: {data['winner'] or '无（平局）'}", "\n玩家角色:"]
+            for player in data["players"]:
+                status = "存活" if player["alive"] else "死亡"
+                lines.append(f"{player['name']}: {player['role']} ({status})")
+            return "\n".join(lines)
+        return None
+    
+    def close(self):
+        pass
+
+class JsonlSink:
+    """把事件缓冲后以JSONL格式追加写入文件，每行一个事件"""
+    
+    def __init__(self, path, buffer_size=64):
+        """
+        Args:
+            path (str): 输出文件路径
+            buffer_size (int): 缓冲的事件数量，达到后写入文件
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        self.path = path
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._file = open(path, "a", encoding="utf-8")
+    
+    def write(self, event):
+        self._buffer.append(json.dumps(event.to_dict(), ensure_ascii=False))
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+    
+    def flush(self):
+        """把缓冲的事件写入文件"""
+        if self._buffer:
+            self._file.write("\n".join(self._buffer) + "\n")
+            self._buffer = []
+        self._file.flush()
+    
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+class MultiSink:
+    """把事件同时写入多个输出"""
+    
+    def __init__(self, *sinks):
+        self.sinks = sinks
+    
+    def write(self, event):
+        for sink in self.sinks:
+            sink.write(event)
+    
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+class EventLog:
+    """只追加的游戏事件流，事件交给可替换的输出处理"""
+    
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else ConsoleSink()
+        self.enabled = not isinstance(self.sink, NullSink)  # 丢弃所有事件时不创建事件对象
+        self._seq = 0
+        self._lock = threading.Lock()
+    
+    def emit(self, event_type, day, **data):
+        """
+        记录一个事件
+        
+        Args:
+            event_type (str): 事件类型
+            day (int): 事件发生的天数
+            **data: 事件内容
+        
+        Returns:
+            GameEvent: 记录的事件，输出被禁用时返回None
+        """
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            event = GameEvent(self._seq, event_type, day, data)
+            self._seq += 1
+            self.sink.write(event)
+        return event
+    
+    def close(self):
+        """关闭输出，写出所有缓冲的事件"""
+        self.sink.close()
\ No newline at end of file
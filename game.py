@@ -1,9 +1,21 @@
 import os
 import time
+import base64
+import struct
+import uuid
+import queue
 import random
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 
 from llm_client import LLMClient
+from night_scheduler import NightScheduler
+from memory import MemoryStore, estimate_tokens
+from name_matcher import NameMatcher
+from player import PUBLIC_MEMORY_REFERENCE
+from metrics import MetricsRecorder, tag_context, submit_with_context
+from events import EventLog, GAME_START, PHASE_START, ACTION, KILL, VOTE, SPEECH, SPEECH_DELTA, REVEAL, ANNOUNCEMENT, ROUND_LIMIT, GAME_END
+from prompt_templates import PromptTemplateRegistry, default_registry
 from roles.villager import Villager
 from roles.werewolf import Werewolf
 from roles.witch import Witch
@@ -15,96 +27,307 @@ from roles.idiot import Idiot
 class WerewolfGame:
     """狼人杀游戏主类"""
     
-    def __init__(self, api_key=None, model_name="gpt-3.5-turbo"):
-        # 创建LLM客户端
-        self.llm_client = LLMClient(api_key, model_name)
+    # 夜晚没有特殊行动的角色（村民、猎人、白痴）的思考方式：
+    # "each" 每名玩家一次请求，"batched" 同一模型的所有玩家合并为一次请求，"off" 不思考
+    REFLECTION_POLICIES = ("each", "batched", "off")
+    
+    # 提示布局："inline" 每个提示是一条消息；"prefix" 固定的系统消息和所有玩家共享的游戏记录在前，
+    # 每次调用不同的角色、私有信息和任务在最后，同一阶段的请求可以命中服务端和本地的前缀缓存
+    PROMPT_LAYOUTS = ("inline", "prefix")
+    
+    # 狼人的夜晚决策："leader" 随机选择一名狼人独自决定袭击目标；"vote" 所有狼人同时提议，得票最多的目标被袭击；
+    # "aggregate" 所有狼人同时提议，意见不一致时由座位最靠前的狼人根据所有提议再做一次简短的决定
+    WOLF_DECISIONS = ("leader", "vote", "aggregate")
+    
+    def __init__(self, api_key=None, model_name="gpt-3.5-turbo", parallel_voting=False,
+                 concurrent_night=False, max_workers=None, template_auto_reload=False,
+                 memory_token_budget=None, memory_strategy="window", response_cache=None, backend=None,
+                 max_rounds=None, event_sink=None, structured_decisions=False, rate_limiter=None,
+                 metrics=None, checkpoint=None, seed=None, pipelined_speech=False, live_speech=False,
+                 llm_options=None, reflection="each", reflection_interval=1, prompt_layout="inline",
+                 concurrent_speech=False, wolf_decision="leader"):
+        # 创建LLM客户端，response_cache 不为None时相同的请求直接返回缓存的响应
+        # backend 为None时使用OpenAI API，也可以传入 llm_backends.MockBackend 离线运行
+        # rate_limiter 可以传入多局游戏共享的 rate_limiter.RateLimiter，限制每分钟的请求数和token数
+        # metrics 记录每次调用的延迟和token数，并按天数、阶段、角色和玩家汇总
+        # llm_options 是传给每个 LLMClient 的其他参数，如 temperature、max_tokens、timeout、api_base
+        self.metrics = metrics if metrics is not None else MetricsRecorder()
+        self.llm_options = dict(llm_options or {})
+        self.llm_client = LLMClient(api_key, model_name, cache=response_cache, backend=backend,
+                                    rate_limiter=rate_limiter, metrics=self.metrics, **self.llm_options)
+        
+        # 玩家可以使用不同的模型，每个模型一个客户端，调用按模型分组到各自的后端连接池和限流器
+        self.api_key = api_key
+        self.backend = backend  # 传入的后端由所有模型共享，为None时每个模型创建自己的OpenAI后端
+        self.llm_clients = {model_name: self.llm_client}  # 键为模型名称
+        self.player_models = {}  # 键为玩家名称，值为该玩家使用的模型
         
         # 游戏状态
         self.players = {}  # 玩家字典，键为玩家名称，值为玩家对象
         self.roles_dict = {}  # 角色字典，键为玩家名称，值为角色名称
-        self.living_players = []  # 存活玩家列表
+        self.role_names = {}  # 键为玩家名称，值为角色的中文名称，预言家据此判断阵营
+        self.seats = {}  # 键为玩家名称，值为座位序号（加入游戏的顺序）
+        self.role_index = {}  # 键为角色（如 "seer"），值为该角色所有玩家的名称列表，按座位顺序排列
+        self.alive = {}  # 存活玩家，按座位顺序排列的有序集合（值总是None），判断存活和移除都是O(1)
+        self.faction_counts = {"狼人阵营": 0, "好人阵营": 0}  # 存活玩家中各阵营的人数，玩家加入和死亡时更新
         self.day_count = 0  # 天数计数
         self.game_over = False  # 游戏是否结束
         self.winner = None  # 游戏胜利者
+        self.max_rounds = max_rounds  # 最大天数，超过后游戏以平局结束，None表示不限制
+        self.deaths = []  # 死亡记录，每项包含天数、玩家、角色和死因
+        self.next_phase = "night"  # 下一个要进行的阶段，"night" 或 "day"
+        
+        # 游戏自身的随机选择（如狼人决策者）使用独立的随机数生成器，相同的种子和模型回答得到相同的游戏
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng = random.Random(self.seed)
+        
+        # 检查点，checkpoint 为 checkpoint.CheckpointWriter 时每个阶段结束后保存游戏状态
+        self.checkpoint = checkpoint
+        self.resumed = False  # 是否从检查点恢复
+        
+        # 所有玩家共享的只追加游戏记录，广播消息只写入一次，作为每名玩家的公共记忆
+        self.public_log = MemoryStore(memory_token_budget, memory_strategy)
+        self.name_matcher = None  # 玩家名称匹配器，游戏开始时根据所有玩家构建
+        
+        # 游戏事件流，默认输出到控制台，也可以传入 events.NullSink、JsonlSink 等
+        self.game_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.event_log = EventLog(event_sink)
+        
+        # 并发设置
+        self.parallel_voting = parallel_voting  # 是否同时收集所有玩家的投票
+        self.concurrent_night = concurrent_night  # 夜晚互不依赖的行动是否并发执行
+        self.max_workers = max_workers  # 并发请求的最大线程数，None表示与玩家数量相同
+        
+        # 为True时白天发言使用流水线：后台线程以流式请求依次生成发言，一段发言结束后立即开始下一名玩家的请求，
+        # 主线程同时输出上一段发言
+        self.pipelined_speech = pipelined_speech
+        self.speech_stats = []  # 每天发言阶段的耗时统计，见 get_speech_report
+        self.live_speech = live_speech  # 为True时发言生成过程中逐段发出 SPEECH_DELTA 事件，供观众实时观看
+        # 为True时所有玩家基于同一份游戏记录同时生成发言，每天的发言耗时约等于一次请求，优先于流水线发言
+        self.concurrent_speech = concurrent_speech
+        self._speech_executor = None  # 生成发言的后台线程，整局游戏复用同一个线程以复用其HTTP连接
+        
+        # 玩家记忆设置，限制长局游戏中提示的长度
+        self.memory_token_budget = memory_token_budget  # 每名玩家每类记忆的token上限，None表示不限制
+        self.memory_strategy = memory_strategy  # 超出预算时的处理方式："window" 或 "summary"
+        
+        # 为True时投票和夜晚行动要求模型返回JSON格式的决策，并按合法选项校验
+        self.structured_decisions = structured_decisions
+        
+        # 夜晚思考只写入玩家自己的私有记忆，却占夜晚请求的很大一部分，并使之后的每个提示变长
+        if reflection not in self.REFLECTION_POLICIES:
+            raise ValueError(f"不支持的夜晚思考方式: {reflection}")
+        if reflection_interval < 1:
+            raise ValueError("reflection_interval 不能小于1")
+        self.reflection = reflection
+        self.reflection_interval = reflection_interval  # 每隔几个夜晚思考一次，第1晚总是思考
+        self.reflection_stats = []  # 每晚夜晚思考的统计，见 get_reflection_report
+        
+        if prompt_layout not in self.PROMPT_LAYOUTS:
+            raise ValueError(f"不支持的提示布局: {prompt_layout}")
+        self.prompt_layout = prompt_layout
+        
+        if wolf_decision not in self.WOLF_DECISIONS:
+            raise ValueError(f"不支持的狼人决策方式: {wolf_decision}")
+        self.wolf_decision = wolf_decision
         
         # 提示模板路径
         self.prompt_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
         
+        # 所有玩家共享的提示模板注册表，开启热加载后修改模板文件无需重启
+        # 热加载的游戏使用自己的注册表，不改变同一进程中其他游戏（如批量模拟的工作进程）共享的注册表
+        self.template_registry = PromptTemplateRegistry(auto_reload=True) if template_auto_reload else default_registry
+        
         # 创建提示目录（如果不存在）
         if not os.path.exists(self.prompt_dir):
             os.makedirs(self.prompt_dir)
     
-    def add_player(self, name, role):
+    def add_player(self, name, role, model_name=None):
         """
         添加玩家到游戏
         
         Args:
             name (str): 玩家名称
             role (str): 玩家角色，可以是 villager, werewolf, witch, seer, guard, hunter, idiot
+            model_name (str): 该玩家使用的模型，None表示使用游戏的默认模型
         """
+        llm_client = self.get_llm_client(model_name)
+        model_name = llm_client.get_model()
+        
         # 根据角色创建对应的玩家对象
         if role.lower() == "villager":
-            player = Villager(name, self.llm_client)
+            player = Villager(name, llm_client, model_name)
         elif role.lower() == "werewolf":
-            player = Werewolf(name, self.llm_client)
+            player = Werewolf(name, llm_client, model_name)
         elif role.lower() == "witch":
-            player = Witch(name, self.llm_client)
+            player = Witch(name, llm_client, model_name)
         elif role.lower() == "seer":
-            player = Seer(name, self.llm_client)
+            player = Seer(name, llm_client, model_name)
         elif role.lower() == "guard":
-            player = Guard(name, self.llm_client)
+            player = Guard(name, llm_client, model_name)
         elif role.lower() == "hunter":
-            player = Hunter(name, self.llm_client)
+            player = Hunter(name, llm_client, model_name)
         elif role.lower() == "idiot":
-            player = Idiot(name, self.llm_client)
+            player = Idiot(name, llm_client, model_name)
         else:
             raise ValueError(f"不支持的角色类型: {role}")
         
-        # 将玩家添加到玩家字典和角色字典
+        # 公共记忆使用共享的游戏记录，玩家自己只保存私有信息
+        player.set_public_memory(self.public_log)
+        player.set_structured_decisions(self.structured_decisions)
+        player.set_prompt_layout(self.prompt_layout)
+        player.set_template_registry(self.template_registry)
+        
+        # 设置记忆预算
+        if self.memory_token_budget is not None:
+            player.set_memory_budget(self.memory_token_budget, self.memory_strategy)
+        
+        # 将玩家添加到玩家字典、角色字典和各个索引，狼人队友在游戏开始时统一告知
         self.players[name] = player
         self.roles_dict[name] = role
-        self.living_players.append(name)
-        
-        # 如果是狼人，告知其他狼人
-        if "狼" in role:
-            # 获取所有狼人
-            werewolves = [p for p, r in self.roles_dict.items() if "狼" in r]
-            if len(werewolves) > 1:
-                for wolf in werewolves:
-                    if wolf != name:
-                        self.players[wolf].add_private_memory(f"{name} 也是狼人")
-                        player.add_private_memory(f"{wolf} 也是狼人")
+        self.role_names[name] = player.get_role()
+        self.player_models[name] = model_name
+        self.seats[name] = len(self.seats)
+        self.role_index.setdefault(role.lower(), []).append(name)
+        self.alive[name] = None
+        self.faction_counts[self._get_faction(name)] += 1
         
         return player
     
+    @property
+    def living_players(self):
+        """按座位顺序排列的存活玩家列表，每次返回新的列表"""
+        return list(self.alive)
+    
+    @living_players.setter
+    def living_players(self, names):
+        self.alive = dict.fromkeys(names)
+        self.faction_counts = {"狼人阵营": 0, "好人阵营": 0}
+        for name in self.alive:
+            self.faction_counts[self._get_faction(name)] += 1
+    
+    def get_living_players(self, *roles):
+        """
+        返回按座位顺序排列的存活玩家
+        
+        Args:
+            *roles (str): 只返回这些角色（如 "seer"）的玩家，不指定时返回所有存活玩家
+        """
+        if not roles:
+            return list(self.alive)
+        names = [name for role in roles for name in self.role_index.get(role, ()) if name in self.alive]
+        if len(roles) > 1:
+            names.sort(key=self.seats.get)
+        return names
+    
+    def _get_faction(self, player_name):
+        """返回玩家所属的阵营"""
+        return "狼人阵营" if self.players[player_name].is_werewolf() else "好人阵营"
+    
+    def _brief_werewolves(self):
+        """告知每名狼人其他狼人的身份，每名狼人一条固定的记忆"""
+        werewolves = self.role_index.get("werewolf", [])
+        for wolf in werewolves:
+            teammates = [name for name in werewolves if name != wolf]
+            if teammates:
+                self.players[wolf].add_private_memory(f"狼人队友: {', '.join(teammates)}", pinned=True)
+    
+    def get_llm_client(self, model_name=None):
+        """
+        返回指定模型的客户端，不存在时按默认客户端的缓存、限流器、指标和 llm_options 创建
+        
+        Args:
+            model_name (str): 模型名称，None表示游戏的默认模型
+        """
+        if model_name is None:
+            return self.llm_client
+        llm_client = self.llm_clients.get(model_name)
+        if llm_client is None:
+            llm_client = LLMClient(self.api_key, model_name, cache=self.llm_client.cache, backend=self.backend,
+                                   rate_limiter=self.llm_client.rate_limiter, metrics=self.metrics,
+                                   **self.llm_options)
+            self.llm_clients[model_name] = llm_client
+        return llm_client
+    
+    def set_rate_limiter(self, rate_limiter, model_name=None):
+        """
+        设置限流器，model_name 为None时设置所有模型的限流器
+        
+        服务端的配额通常按模型分别计算，可以为每个模型设置独立的限流器。
+        """
+        if model_name is None:
+            for llm_client in self.llm_clients.values():
+                llm_client.set_rate_limiter(rate_limiter)
+        else:
+            self.get_llm_client(model_name).set_rate_limiter(rate_limiter)
+    
+    def get_call_stats(self):
+        """返回所有模型客户端合计的调用统计"""
+        total = {}
+        for llm_client in self.llm_clients.values():
+            for name, value in llm_client.get_call_stats().items():
+                total[name] = total.get(name, 0) + value
+        return total
+    
     def start_game(self):
-        """开始游戏"""
-        print("=== 游戏开始 ===")
-        self.broadcast_message("游戏开始，天黑请闭眼...")
-        
-        # 游戏循环，直到游戏结束
-        while not self.game_over:
-            self.day_count += 1
-            print(f"\n=== 第 {self.day_count} 天 ===")
-            
-            # 夜晚阶段
-            print("\n--- 夜晚阶段 ---")
-            self.night_phase()
-            
-            # 检查游戏是否结束
-            if self.check_game_over():
-                break
+        """开始游戏，从检查点恢复的游戏从保存时的阶段继续"""
+        self.emit(GAME_START, game_id=self.game_id, players=dict(self.roles_dict), resumed=self.resumed)
+        
+        # 游戏中途出错（如回放分歧）时也要写出缓冲的事件并关闭文件，这一局的记录最有排查价值
+        try:
+            # 所有玩家共享同一个名称匹配器，从模型回应中提取目标玩家
+            self.name_matcher = NameMatcher(self.players)
+            for player in self.players.values():
+                player.set_name_matcher(self.name_matcher)
+            if not self.resumed:
+                self._brief_werewolves()
+                self.broadcast_message("游戏开始，天黑请闭眼...")
+                self.save_checkpoint()
             
-            # 白天阶段
-            print("\n--- 白天阶段 ---")
-            self.day_phase()
+            # 游戏循环，直到游戏结束
+            while not self.game_over:
+                if self.next_phase == "night":
+                    if self.max_rounds is not None and self.day_count >= self.max_rounds:
+                        self.emit(ROUND_LIMIT, max_rounds=self.max_rounds)
+                        self.game_over = True
+                        break
+                    
+                    self.day_count += 1
+                    self.emit(PHASE_START, phase="day")
+                    
+                    # 夜晚阶段
+                    self.emit(PHASE_START, phase="night")
+                    with tag_context(game_id=self.game_id, day=self.day_count, phase="night"):
+                        self.night_phase()
+                    
+                    # 检查游戏是否结束，并保存检查点
+                    self.next_phase = "day"
+                    self.check_game_over()
+                    self.save_checkpoint()
+                    if self.game_over:
+                        break
+                
+                # 白天阶段
+                self.emit(PHASE_START, phase="daytime")
+                with tag_context(game_id=self.game_id, day=self.day_count, phase="day"):
+                    self.day_phase()
+                
+                # 检查游戏是否结束，并保存检查点
+                self.next_phase = "night"
+                self.check_game_over()
+                self.save_checkpoint()
+                if self.game_over:
+                    break
             
-            # 检查游戏是否结束
-            if self.check_game_over():
-                break
-        
-        # 宣布游戏结果
-        self.announce_result()
+            # 宣布游戏结果
+            self.announce_result()
+        finally:
+            self.event_log.close()
+            if self.checkpoint is not None:
+                self.checkpoint.close()
+            if self._speech_executor is not None:
+                self._speech_executor.shutdown()
+                self._speech_executor = None
     
     def night_phase(self):
         """夜晚阶段处理"""
@@ -112,90 +335,121 @@ class WerewolfGame:
         night_info = f"第 {self.day_count} 天夜晚"
         self.broadcast_private_message(night_info)
         
-        # 守卫行动
-        protected_player = None
-        guard_players = [p for p in self.living_players if isinstance(self.players[p], Guard)]
-        if guard_players:
-            guard_player = guard_players[0]
-            guard_prompt_path = os.path.join("prompts", "guard_night_action.txt")
-            protected_player = self.players[guard_player].night_action(
-                night_info, 
-                self.living_players, 
-                guard_prompt_path
+        # 夜晚开始时的存活玩家，所有行动都基于这一份名单做决定
+        living_players = self.living_players
+        
+        # 声明各角色的夜晚行动及其依赖关系，只有女巫需要等待守卫和狼人的结果
+        scheduler = NightScheduler(concurrent=self.concurrent_night, max_workers=self.max_workers)
+        
+        # 守卫行动，每名守卫各自守护一名玩家
+        guards = [self.players[p] for p in self.get_living_players("guard")]
+        guard_prompt_path = os.path.join("prompts", "guard_night_action.txt")
+        for guard in guards:
+            scheduler.add_action(
+                f"guard:{guard.get_name()}",
+                lambda results, guard=guard: self._player_call(
+                    guard.get_name(), "guard", guard.night_action, night_info, living_players, guard_prompt_path
+                )
             )
-            if protected_player:
-                print(f"守卫保护了 {protected_player}")
         
         # 狼人行动
-        wolf_players = [p for p in self.living_players if "狼" in self.roles_dict[p]]
-        victim = None
-        
+        wolf_players = self.get_living_players("werewolf")
+        wolf_proposals = {}  # 狼队决策时每名狼人的提议
         if wolf_players:
-            # 如果有多个狼人，随机选择一个作为决策者
-            wolf_leader = random.choice(wolf_players)
             wolf_prompt_path = os.path.join("prompts", "werewolf_night_action.txt")
-            victim = self.players[wolf_leader].night_action(
-                night_info, 
-                self.living_players, 
-                wolf_prompt_path
-            )
-            
-            # 如果狼人选择了受害者，并且该玩家没有被守卫保护
-            if victim and victim != protected_player:
-                print(f"狼人选择袭击 {victim}")
+            if self.wolf_decision == "leader":
+                # 如果有多个狼人，随机选择一个作为决策者
+                wolf_actor = self.rng.choice(wolf_players)
+                wolf_leader = self.players[wolf_actor]
+                scheduler.add_action(
+                    "wolf",
+                    lambda results: self._player_call(
+                        wolf_leader.get_name(), "attack", wolf_leader.night_action, night_info, living_players, wolf_prompt_path
+                    )
+                )
             else:
-                # 如果目标被保护或没有选择目标
-                victim = None
-                print("今晚没有人被狼人杀死")
-        
-        # 预言家行动
-        seer_players = [p for p in self.living_players if isinstance(self.players[p], Seer)]
-        if seer_players:
-            seer_player = seer_players[0]
-            seer_prompt_path = os.path.join("prompts", "seer_night_action.txt")
-            checked_player = self.players[seer_player].night_action(
-                night_info, 
-                self.living_players, 
-                seer_prompt_path,
-                self.roles_dict
+                wolf_actor = wolf_players[0]
+                scheduler.add_action(
+                    "wolf",
+                    lambda results: self._wolf_pack_decision(
+                        wolf_players, night_info, living_players, wolf_prompt_path, wolf_proposals
+                    )
+                )
+        
+        # 预言家行动，预言家根据角色的中文名称判断阵营
+        seers = [self.players[p] for p in self.get_living_players("seer")]
+        seer_prompt_path = os.path.join("prompts", "seer_night_action.txt")
+        for seer in seers:
+            scheduler.add_action(
+                f"seer:{seer.get_name()}",
+                lambda results, seer=seer: self._player_call(
+                    seer.get_name(), "check", seer.night_action, night_info, living_players, seer_prompt_path,
+                    self.role_names
+                )
             )
-            if checked_player:
-                print(f"预言家查验了 {checked_player}")
-        
-        # 女巫行动
-        witch_players = [p for p in self.living_players if isinstance(self.players[p], Witch)]
-        if witch_players:
-            witch_player = witch_players[0]
-            witch_prompt_path = os.path.join("prompts", "witch_night_action.txt")
-            witch_action = self.players[witch_player].night_action(
-                night_info, 
-                self.living_players, 
-                witch_prompt_path,
-                victim
+        
+        # 女巫行动，需要知道狼人袭击的目标是否被守卫保护
+        witches = [self.players[p] for p in self.get_living_players("witch")]
+        witch_prompt_path = os.path.join("prompts", "witch_night_action.txt")
+        witch_depends_on = [name for name in scheduler.actions if name.startswith("guard:") or name == "wolf"]
+        for witch in witches:
+            scheduler.add_action(
+                f"witch:{witch.get_name()}",
+                lambda results, witch=witch: self._player_call(
+                    witch.get_name(),
+                    "potion",
+                    witch.night_action,
+                    night_info,
+                    living_players,
+                    witch_prompt_path,
+                    self._resolve_wolf_victim(results)
+                ),
+                depends_on=witch_depends_on
             )
-            
-            if witch_action:
-                action_type, target = witch_action
-                if action_type == "save" and victim:
-                    # 女巫使用解药救人
-                    victim = None
-                    print(f"女巫使用解药救了 {target}")
-                elif action_type == "poison":
-                    # 女巫使用毒药
-                    if not victim:  # 如果没有狼人袭击的受害者
-                        victim = target
-                    else:  # 如果已有狼人袭击的受害者，则有第二个受害者
-                        self.kill_player(target, "女巫毒死")
-                    print(f"女巫使用毒药毒死了 {target}")
-        
-        # 其他玩家的夜间思考（村民，猎人，白痴等）
-        for player_name in self.living_players:
-            player = self.players[player_name]
-            if not isinstance(player, (Werewolf, Witch, Seer, Guard)):
-                # 这些角色没有特殊夜晚行动，但可以进行思考
-                night_action_prompt_path = os.path.join("prompts", f"{player.get_role().lower()}_night_action.txt")
-                if os.path.exists(os.path.join(os.path.dirname(os.path.abspath(__file__)), night_action_prompt_path)):
-                    player.night_action(night_info, self.living_players, night_action_prompt_path)
+        
+        # 其他玩家的夜间思考（村民，猎人，白痴等），只影响自己的私有记忆
+        self._schedule_reflections(scheduler, night_info, living_players)
+        
+        results = scheduler.run()
+        
+        # 按固定顺序结算夜晚行动的结果，同一角色的多名玩家按座位顺序结算
+        for guard in guards:
+            protected_player = results.get(f"guard:{guard.get_name()}")
+            if protected_player:
+                self.emit(ACTION, role="guard", actor=guard.get_name(), action="protect", target=protected_player)
+        
+        victim = None
+        if "wolf" in results:
+            # 目标被保护或没有选择目标时 victim 为None
+            victim = self._resolve_wolf_victim(results)
+            if wolf_proposals:
+                self.emit(ACTION, role="werewolf", actor=wolf_actor, action="attack", target=victim,
+                          proposals=dict(wolf_proposals))
+            else:
+                self.emit(ACTION, role="werewolf", actor=wolf_actor, action="attack", target=victim)
+        
+        for seer in seers:
+            checked_player = results.get(f"seer:{seer.get_name()}")
+            if checked_player:
+                self.emit(ACTION, role="seer", actor=seer.get_name(), action="check", target=checked_player,
+                          result=seer.checked_players.get(checked_player))
+        
+        for witch in witches:
+            witch_action = results.get(f"witch:{witch.get_name()}")
+            if not witch_action:
+                continue
+            action_type, target = witch_action
+            if action_type == "save" and victim:
+                # 女巫使用解药救人
+                victim = None
+                self.emit(ACTION, role="witch", actor=witch.get_name(), action="save", target=target)
+            elif action_type == "poison":
+                # 女巫使用毒药
+                if not victim:  # 如果没有狼人袭击的受害者
+                    victim = target
+                else:  # 如果已有狼人袭击的受害者，则有第二个受害者
+                    self.kill_player(target, "女巫毒死")
+                self.emit(ACTION, role="witch", actor=witch.get_name(), action="poison", target=target)
         
         # 处理夜晚死亡
         if victim:
@@ -208,10 +462,12 @@ class WerewolfGame:
                 
                 # 猎人死亡时选择射杀目标
                 hunter_prompt_path = os.path.join("prompts", "hunter_shoot_action.txt")
-                hunter_victim = hunter.shoot(self.living_players, hunter_prompt_path)
+                hunter_victim = self._player_call(
+                    hunter.get_name(), "shoot", hunter.shoot, self.living_players, hunter_prompt_path
+                )
                 
                 if hunter_victim:
-                    print(f"猎人在死前射杀了 {hunter_victim}")
+                    self.emit(ACTION, role="hunter", actor=hunter.get_name(), action="shoot", target=hunter_victim)
             
             # 处理夜晚的死亡结果
             self.kill_player(victim, "狼人袭击")
@@ -226,6 +482,148 @@ class WerewolfGame:
         else:
             self.broadcast_message("天亮了，昨晚是平安夜，没有人死亡。")
     
+    def _schedule_reflections(self, scheduler, night_info, living_players):
+        """按夜晚思考方式把思考请求加入夜晚调度，并记录本晚的统计"""
+        thinkers = self.get_living_players("villager", "hunter", "idiot")
+        if not thinkers:
+            return
+        
+        # 每名玩家单独思考时的模板，没有模板的玩家不思考
+        paths = {}
+        for name in thinkers:
+            path = os.path.join("prompts", f"{self.roles_dict[name].lower()}_night_action.txt")
+            if self.template_registry.get(path):
+                paths[name] = path
+        
+        stats = {"day": self.day_count, "players": len(thinkers), "calls": 0, "avoided_calls": 0,
+                 "avoided_prompt_tokens": 0}
+        self.reflection_stats.append(stats)
+        
+        if self.reflection == "each" and (self.day_count - 1) % self.reflection_interval == 0:
+            for name, path in paths.items():
+                player = self.players[name]
+                scheduler.add_action(
+                    f"reflect:{name}",
+                    lambda results, player=player, path=path: self._player_call(
+                        player.get_name(), "reflect", player.night_action, night_info, living_players, path
+                    )
+                )
+            stats["calls"] = len(paths)
+            return
+        
+        # 跳过的请求按记忆的token数估算节省的token，不为此拼接每名玩家的完整提示
+        stats["avoided_calls"] = len(paths)
+        stats["avoided_prompt_tokens"] = sum(
+            self.players[name].estimate_reflection_tokens(night_info, living_players, path) for name, path in paths.items()
+        )
+        if self.reflection == "off" or (self.day_count - 1) % self.reflection_interval != 0:
+            return
+        
+        # 合并思考：同一模型的玩家共用一次只包含公共信息的局势分析，没有模板时不思考
+        # 提示中不能出现任何玩家的私有信息或思考者名单，否则分析会把猎人、白痴等隐藏身份泄露给其他玩家
+        batch_path = os.path.join("prompts", "public_reflection.txt")
+        batch_template = self.template_registry.get(batch_path)
+        if not batch_template:
+            return
+        batch_tokens = (estimate_tokens(batch_template.text) + estimate_tokens(night_info)
+                        + estimate_tokens(", ".join(living_players)) + self.public_log.get_token_count())
+        groups = {}
+        for name in paths:
+            groups.setdefault(self.player_models[name], []).append(name)
+        for model_name, names in groups.items():
+            fields = {
+                "game_state": night_info,
+                "public_memory": self.public_log.get_text(),
+                "living_players": ", ".join(living_players)
+            }
+            if self.prompt_layout == "prefix":
+                # 与玩家自己的提示共享同一个前缀
+                context = f"游戏公共信息：\n{fields['public_memory']}"
+                fields["public_memory"] = PUBLIC_MEMORY_REFERENCE
+                prompt = self.get_llm_client(model_name).build_messages(batch_template.format(**fields), context=context)
+            else:
+                prompt = batch_template.format(**fields)
+            scheduler.add_action(
+                f"reflect-batch:{model_name}",
+                lambda results, names=names, prompt=prompt, model_name=model_name: self._batched_reflection(
+                    self.get_llm_client(model_name), prompt, names
+                )
+            )
+            stats["calls"] += 1
+            stats["avoided_calls"] -= 1
+            stats["avoided_prompt_tokens"] -= batch_tokens
+    
+    def _batched_reflection(self, llm_client, prompt, names):
+        """一次请求得到只基于公共信息的局势分析，写入每名玩家的私有记忆，回答为空时本晚不思考"""
+        with tag_context(action="reflect"):
+            reflection = llm_client.chat(prompt).strip()
+        
+        if reflection:
+            for name in names:
+                self.players[name].add_reflection(reflection)
+        return None
+    
+    def _wolf_pack_decision(self, wolves, night_info, living_players, prompt_path, proposals):
+        """
+        狼队共同决策：所有狼人同时提议袭击目标，耗时约等于一次请求，提议写入 proposals
+        
+        所有提议和最终决定作为一条记忆写入每名狼人的私有记忆，狼队不需要额外的请求就能共享彼此的想法。
+        vote 按票数决定，票数相同时取座位靠前的狼人提议的目标；aggregate 在提议不一致时
+        由座位最靠前的狼人再做一次决定，这次请求失败时按票数决定。
+        
+        Returns:
+            str: 狼队决定袭击的玩家，没有任何提议时返回None
+        """
+        if len(wolves) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers or len(wolves)) as executor:
+                futures = [
+                    submit_with_context(
+                        executor, self._player_call, name, "propose", self.players[name].propose_target,
+                        night_info, living_players, prompt_path
+                    )
+                    for name in wolves
+                ]
+                for name, future in zip(wolves, futures):
+                    proposals[name] = future.result()
+        else:
+            proposals[wolves[0]] = self._player_call(
+                wolves[0], "propose", self.players[wolves[0]].propose_target, night_info, living_players, prompt_path
+            )
+        
+        # 按票数排序，票数相同时保持座位顺序
+        votes = {}
+        for target in proposals.values():
+            if target:
+                votes[target] = votes.get(target, 0) + 1
+        if not votes:
+            return None
+        target = max(votes, key=votes.get)
+        
+        if self.wolf_decision == "aggregate" and len(votes) > 1:
+            aggregator = self.players[wolves[0]]
+            pack_prompt_path = os.path.join("prompts", "werewolf_pack_decision.txt")
+            target = self._player_call(
+                wolves[0], "attack", aggregator.decide_pack_target, night_info, living_players, proposals, pack_prompt_path
+            ) or target
+        
+        summary = ", ".join(f"{wolf} 提议袭击 {proposal or '（没有提议）'}" for wolf, proposal in proposals.items())
+        for name in wolves:
+            self.players[name].add_private_memory(f"夜晚行动: 狼队提议 {summary}，决定袭击 {target}")
+        return target
+    
+    def _player_call(self, player_name, action, fn, *args):
+        """以玩家的身份调用 fn，期间的LLM调用都带有该玩家的角色和行动标签"""
+        with tag_context(player=player_name, role=self.roles_dict[player_name], action=action):
+            return fn(*args)
+    
+    def _resolve_wolf_victim(self, results):
+        """根据守卫和狼人的行动结果，返回狼人实际杀死的玩家，目标被任意一名守卫保护或没有目标时返回None"""
+        victim = results.get("wolf")
+        if not victim:
+            return None
+        protected = {target for name, target in results.items() if name.startswith("guard:")}
+        return None if victim in protected else victim
+    
     def day_phase(self):
         """白天阶段处理"""
         # 记录白天信息
@@ -244,8 +642,8 @@ class WerewolfGame:
             if isinstance(self.players[lynched_player], Idiot):
                 idiot = self.players[lynched_player]
                 idiot_prompt_path = os.path.join("prompts", "idiot_reveal_action.txt")
-                if idiot.survive_lynching(idiot_prompt_path):
-                    print(f"{lynched_player} 展示了白痴身份，继续存活但失去投票权")
+                if self._player_call(lynched_player, "reveal", idiot.survive_lynching, idiot_prompt_path):
+                    self.emit(REVEAL, player=lynched_player, role="idiot")
                     self.broadcast_message(f"{lynched_player} 是白痴，免于被处决，但失去投票权")
                     return
             
@@ -258,10 +656,12 @@ class WerewolfGame:
                 
                 # 猎人死亡时选择射杀目标
                 hunter_prompt_path = os.path.join("prompts", "hunter_shoot_action.txt")
-                hunter_victim = hunter.shoot(self.living_players, hunter_prompt_path)
+                hunter_victim = self._player_call(
+                    hunter.get_name(), "shoot", hunter.shoot, self.living_players, hunter_prompt_path
+                )
                 
                 if hunter_victim:
-                    print(f"猎人在死前射杀了 {hunter_victim}")
+                    self.emit(ACTION, role="hunter", actor=hunter.get_name(), action="shoot", target=hunter_victim)
             
             # 处理投票处决
             self.kill_player(lynched_player, "投票处决")
@@ -276,33 +676,141 @@ class WerewolfGame:
     
     def player_speak(self, day_info):
         """玩家依次发言"""
-        print("\n各位玩家开始发言：")
-        for player_name in self.living_players:
-            player = self.players[player_name]
-            speak_prompt_path = os.path.join("prompts", "player_speak.txt")
-            speech = player.speak(day_info, speak_prompt_path)
+        self.emit(PHASE_START, phase="speech")
+        speakers = self.living_players
+        timing = {"generate": 0.0, "output": 0.0}  # 生成发言和输出发言的累计耗时
+        start_time = time.perf_counter()
+        
+        if self.concurrent_speech and len(speakers) > 1:
+            self._concurrent_speak(day_info, speakers, timing)
+        elif self.pipelined_speech and len(speakers) > 1:
+            self._pipelined_speak(day_info, speakers, timing)
+        else:
+            for player_name in speakers:
+                speech = self._generate_speech(player_name, day_info, timing)
+                self._output_speech(player_name, speech, timing)
+        
+        elapsed = time.perf_counter() - start_time
+        self.speech_stats.append({
+            "day": self.day_count,
+            "pipelined": self.pipelined_speech,
+            "concurrent": self.concurrent_speech,
+            "speakers": len(speakers),
+            "elapsed": round(elapsed, 6),
+            "generate": round(timing["generate"], 6),
+            "output": round(timing["output"], 6),
+            # 顺序发言时生成和输出依次进行，流水线或并发节省的就是两者与实际耗时的差
+            "saved": round(max(timing["generate"] + timing["output"] - elapsed, 0.0), 6)
+        })
+    
+    def _generate_speech(self, player_name, day_info, timing):
+        """生成一名玩家的发言并写入共享的游戏记录，所有玩家都能看到"""
+        start_time = time.perf_counter()
+        speech = self._request_speech(player_name, day_info)
+        if speech:
+            self.public_log.append(f"{player_name} 说：{speech}")
+        timing["generate"] += time.perf_counter() - start_time
+        return speech
+    
+    def _request_speech(self, player_name, day_info):
+        """请求一名玩家的发言，不写入游戏记录"""
+        player = self.players[player_name]
+        speak_prompt_path = os.path.join("prompts", "player_speak.txt")
+        on_chunk = None
+        if self.live_speech:
+            # 每段生成的文本都作为事件转发给控制台或事件日志
+            def on_chunk(chunk):
+                self.emit(SPEECH_DELTA, player=player_name, role=self.roles_dict[player_name],
+                          role_name=player.get_role(), text=chunk)
+        return self._player_call(player_name, "speak", player.speak, day_info, speak_prompt_path,
+                                 self.pipelined_speech, on_chunk)
+    
+    def _output_speech(self, player_name, speech, timing):
+        """输出一名玩家的发言事件"""
+        start_time = time.perf_counter()
+        if speech:
+            self.emit(SPEECH, player=player_name, role=self.roles_dict[player_name],
+                      role_name=self.players[player_name].get_role(), text=speech)
+        timing["output"] += time.perf_counter() - start_time
+    
+    def _concurrent_speak(self, day_info, speakers, timing):
+        """
+        并发发言：所有玩家基于发言阶段开始时的同一份游戏记录同时生成发言，全部完成后按座位顺序写入记录并输出，
+        同一天后发言的玩家看不到前面玩家当天的发言
+        """
+        def _timed_request(player_name):
+            start_time = time.perf_counter()
+            speech = self._request_speech(player_name, day_info)
+            return speech, time.perf_counter() - start_time
+        
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(speakers)) as executor:
+            futures = [submit_with_context(executor, _timed_request, player_name) for player_name in speakers]
+            results = [future.result() for future in futures]
+        # 生成耗时按每名玩家单独请求的耗时累计，与实际耗时的差就是并发节省的时间
+        timing["generate"] += sum(elapsed for _, elapsed in results)
+        speeches = [speech for speech, _ in results]
+        
+        for player_name, speech in zip(speakers, speeches):
             if speech:
-                print(f"\n{player_name} ({player.get_role()}) 说：{speech}")
-                # 将发言广播给所有玩家
-                for p in self.living_players:
-                    if p != player_name:
-                        self.players[p].add_public_memory(f"{player_name} 说：{speech}")
+                self.public_log.append(f"{player_name} 说：{speech}")
+            self._output_speech(player_name, speech, timing)
+    
+    def _pipelined_speak(self, day_info, speakers, timing):
+        """
+        流水线发言：后台线程依次生成发言，每段发言写入共享记录后立即开始下一名玩家的请求，
+        主线程按顺序输出已经完成的发言，输出与下一段发言的生成重叠
+        """
+        finished = queue.Queue()
+        
+        def _generate_all():
+            try:
+                for player_name in speakers:
+                    finished.put((player_name, self._generate_speech(player_name, day_info, timing)))
+            finally:
+                # 出错时也要让主线程退出等待
+                finished.put(None)
+        
+        if self._speech_executor is None:
+            self._speech_executor = ThreadPoolExecutor(max_workers=1)
+        future = submit_with_context(self._speech_executor, _generate_all)
+        while True:
+            item = finished.get()
+            if item is None:
+                break
+            self._output_speech(*item, timing)
+        future.result()
     
     def voting_phase(self):
         """投票阶段，返回被投票出局的玩家名称"""
-        print("\n开始投票：")
+        self.emit(PHASE_START, phase="vote")
         
         # 收集每个玩家的投票
+        voters = [p for p in self.alive if self.players[p].can_vote()]
+        vote_prompt_path = os.path.join("prompts", "player_vote.txt")
+        
+        living_players = self.living_players
+        if self.parallel_voting and len(voters) > 1:
+            # 投票期间游戏状态不会改变，所有玩家可以同时投票
+            with ThreadPoolExecutor(max_workers=self.max_workers or len(voters)) as executor:
+                futures = [
+                    submit_with_context(
+                        executor, self._player_call, p, "vote", self.players[p].vote, living_players, vote_prompt_path
+                    )
+                    for p in voters
+                ]
+                ballots = [future.result() for future in futures]
+        else:
+            ballots = [
+                self._player_call(p, "vote", self.players[p].vote, living_players, vote_prompt_path)
+                for p in voters
+            ]
+        
+        # 按固定的玩家顺序记录投票，保证计票结果可复现
         votes = {}
-        for player_name in self.living_players:
-            player = self.players[player_name]
-            # 检查玩家是否有投票权
-            if player.can_vote():
-                vote_prompt_path = os.path.join("prompts", "player_vote.txt")
-                vote = player.vote(self.living_players, vote_prompt_path)
-                if vote:
-                    votes[player_name] = vote
-                    print(f"{player_name} 投票给 {vote}")
+        for player_name, vote in zip(voters, ballots):
+            if vote:
+                votes[player_name] = vote
+                self.emit(VOTE, voter=player_name, target=vote)
         
         # 统计投票结果
         vote_count = Counter(votes.values())
@@ -323,18 +831,25 @@ class WerewolfGame:
     
     def kill_player(self, player_name, reason):
         """处理玩家死亡"""
-        if player_name in self.living_players:
+        if player_name in self.alive:
             self.players[player_name].set_alive(False)
-            self.living_players.remove(player_name)
+            del self.alive[player_name]
+            self.faction_counts[self._get_faction(player_name)] -= 1
+            self.deaths.append({
+                "day": self.day_count,
+                "player": player_name,
+                "role": self.roles_dict[player_name],
+                "reason": reason
+            })
             death_message = f"{player_name} 因{reason}死亡"
-            print(death_message)
+            self.emit(KILL, player=player_name, role=self.roles_dict[player_name], reason=reason)
             self.broadcast_private_message(death_message)
     
     def check_game_over(self):
         """检查游戏是否结束，返回是否结束的布尔值"""
-        # 获取存活的狼人和好人数量
-        werewolf_count = sum(1 for p in self.living_players if "狼" in self.roles_dict[p])
-        villager_count = len(self.living_players) - werewolf_count
+        # 存活的狼人和好人数量，玩家加入和死亡时已经更新
+        werewolf_count = self.faction_counts["狼人阵营"]
+        villager_count = self.faction_counts["好人阵营"]
         
         # 游戏结束条件
         if werewolf_count == 0:
@@ -348,31 +863,143 @@ class WerewolfGame:
         
         return False
     
+    def get_state(self):
+        """返回需要保存到检查点的游戏状态（不含玩家状态和记忆）"""
+        version, internal_state, gauss_next = self.rng.getstate()
+        return {
+            "game_id": self.game_id,
+            "seed": self.seed,
+            "players": list(self.roles_dict.items()),
+            "models": dict(self.player_models),
+            "living_players": self.living_players,
+            "day_count": self.day_count,
+            "next_phase": self.next_phase,
+            "game_over": self.game_over,
+            "winner": self.winner,
+            "deaths": list(self.deaths),
+            # 恢复随机数状态，使恢复后的游戏与未中断时做出相同的随机选择（如狼人决策者）
+            "random_state": [
+                version,
+                base64.b64encode(struct.pack(f"{len(internal_state)}I", *internal_state)).decode("ascii"),
+                gauss_next
+            ]
+        }
+    
+    def restore(self, state):
+        """
+        从 checkpoint.load_checkpoint 返回的状态恢复游戏，调用前需要按 state["game"]["players"] 和 state["game"]["models"] 添加所有玩家
+        """
+        game_state = state["game"]
+        self.game_id = game_state["game_id"]
+        self.living_players = list(game_state["living_players"])
+        self.day_count = game_state["day_count"]
+        self.next_phase = game_state["next_phase"]
+        self.game_over = game_state["game_over"]
+        self.winner = game_state["winner"]
+        self.deaths = list(game_state["deaths"])
+        version, internal_state, gauss_next = game_state["random_state"]
+        packed = base64.b64decode(internal_state)
+        self.seed = game_state.get("seed", self.seed)
+        self.rng.setstate((version, struct.unpack(f"{len(packed) // 4}I", packed), gauss_next))
+        
+        for name, player_state in state["players"].items():
+            self.players[name].set_state(player_state)
+        self.public_log.restore(state["memory"]["public"])
+        for name, player in self.players.items():
+            player.private_memory.restore(state["memory"][f"private:{name}"])
+        self.resumed = True
+    
+    def set_event_sink(self, sink):
+        """在游戏开始前更换事件输出（如 events.MultiSink），文件名需要使用 game_id 时在创建游戏后设置"""
+        self.event_log = EventLog(sink)
+    
+    def set_checkpoint(self, checkpoint):
+        """设置检查点写入器（checkpoint.CheckpointWriter），None表示不保存检查点"""
+        self.checkpoint = checkpoint
+    
+    def save_checkpoint(self):
+        """在阶段结束时保存检查点，没有设置检查点时不做任何事"""
+        if self.checkpoint is not None:
+            self.checkpoint.save(self)
+    
+    def get_memory_report(self):
+        """获取每名玩家的私有记忆大小统计，键为玩家名称，公共记忆的统计在 "public_log" 键下"""
+        report = {name: player.get_memory_stats()["private"] for name, player in self.players.items()}
+        report["public_log"] = self.public_log.stats()
+        return report
+    
+    def get_speech_report(self):
+        """
+        获取发言阶段的耗时统计
+        
+        Returns:
+            dict: days 为每天的统计（elapsed 为实际耗时，generate 和 output 为生成和输出发言的累计耗时，
+                saved 为流水线或并发发言节省的时间），total 为所有天数的合计
+        """
+        total = {name: round(sum(day[name] for day in self.speech_stats), 6)
+                 for name in ("elapsed", "generate", "output", "saved")}
+        return {"days": list(self.speech_stats), "total": total}
+    
+    def get_reflection_report(self):
+        """
+        获取夜晚思考的统计和与每名玩家每晚单独思考相比节省的请求
+        
+        avoided_calls 和 avoided_prompt_tokens 是少发送的请求数和提示token数（按模板和记忆的token数估算），
+        avoided_seconds 按本局思考请求（没有时按所有请求）的平均耗时估算，并发执行的夜晚实际节省的时间更少。
+        思考内容写入私有记忆后还会使之后的每个提示变长，这部分节省不在此统计中，可以用 simulate.py 比较总token数。
+        
+        Returns:
+            dict: policy 和 interval 为思考方式，nights 为每晚的统计，total 为合计
+        """
+        # 使用汇总计数而不是单次调用记录，长时间运行时记录器只保留最近的记录
+        reflect = self.metrics.totals(game_id=self.game_id, action="reflect")
+        sample = reflect if reflect["calls"] else self.metrics.totals(game_id=self.game_id)
+        average_latency = sample["latency"] / sample["calls"] if sample["calls"] else 0.0
+        
+        avoided_calls = sum(night["avoided_calls"] for night in self.reflection_stats)
+        total = {
+            "calls": sum(night["calls"] for night in self.reflection_stats),
+            "prompt_tokens": reflect["prompt_tokens"],
+            "completion_tokens": reflect["completion_tokens"],
+            "latency": reflect["latency"],
+            "avoided_calls": avoided_calls,
+            "avoided_prompt_tokens": sum(night["avoided_prompt_tokens"] for night in self.reflection_stats),
+            "avoided_seconds": round(avoided_calls * average_latency, 6)
+        }
+        return {"policy": self.reflection, "interval": self.reflection_interval,
+                "nights": list(self.reflection_stats), "total": total}
+    
     def announce_result(self):
         """宣布游戏结果"""
-        print("\n=== 游戏结束 ===")
-        print(f"胜利者: {self.winner}")
-        print("\n玩家角色:")
-        for player_name, role in self.roles_dict.items():
-            status = "存活" if player_name in self.living_players else "死亡"
-            print(f"{player_name}: {role} ({status})")
+        players = [
+            {"name": player_name, "role": role, "alive": player_name in self.alive}
+            for player_name, role in self.roles_dict.items()
+        ]
+        self.emit(GAME_END, winner=self.winner, players=players)
     
     def broadcast_message(self, message):
-        """广播公共消息给所有玩家"""
-        for player_name in self.players:
-            self.players[player_name].add_public_memory(message)
-        print(message)
+        """广播公共消息给所有玩家，并作为公告输出"""
+        self.public_log.append(message)
+        self.emit(ANNOUNCEMENT, message=message)
+    
+    def emit(self, event_type, **data):
+        """记录一个当天的游戏事件"""
+        return self.event_log.emit(event_type, self.day_count, **data)
     
     def broadcast_private_message(self, message):
-        """广播私有消息给所有玩家"""
-        for player_name in self.players:
-            self.players[player_name].add_private_memory(message)
+        """广播不作为公告输出的消息给所有玩家（如阶段信息和死亡记录）"""
+        self.public_log.append(message)
     
-    def create_default_prompt_templates(self):
-        """创建默认的提示模板文件"""
+    def create_default_prompt_templates(self, overwrite=True):
+        """
+        创建默认的提示模板文件
+        
+        Args:
+            overwrite (bool): 是否覆盖已存在的模板文件，为False时只创建缺失的模板，保留用户修改过的模板
+        """
         templates = {
             # 夜晚行动提示
-            "werewolf_night_action.txt": """你是一名狼人，现在是{game_state}。请根据以下信息选择一名玩家进行袭击：
+            "werewolf_night_action.txt": """你的名字是{player_name}。你是一名狼人，现在是{game_state}。请根据以下信息选择一名玩家进行袭击：
 
 游戏公共信息：
 {public_memory}
@@ -385,7 +1012,19 @@ class WerewolfGame:
 
 请选择一名玩家作为袭击目标。只需回复目标玩家的名字即可。""",
             
-            "witch_night_action.txt": """你是女巫，现在是{game_state}。请根据以下信息决定是否使用药剂：
+            "werewolf_pack_decision.txt": """你的名字是{player_name}。你是一名狼人，现在是{game_state}。狼队成员分别提议了今晚的袭击目标，请综合大家的意见做出最终决定：
+
+你的私有信息：
+{private_memory}
+
+当前存活的玩家: {living_players}
+狼队的提议：
+{proposals}
+可选择袭击的目标: {target_options}
+
+只需回复最终袭击目标的名字即可。""",
+            
+            "witch_night_action.txt": """你的名字是{player_name}。你是女巫，现在是{game_state}。请根据以下信息决定是否使用药剂：
 
 游戏公共信息：
 {public_memory}
@@ -404,7 +1043,7 @@ class WerewolfGame:
 
 请简洁回答，直接说明你的决定。""",
             
-            "seer_night_action.txt": """你是预言家，现在是{game_state}。请根据以下信息选择一名玩家进行查验：
+            "seer_night_action.txt": """你的名字是{player_name}。你是预言家，现在是{game_state}。请根据以下信息选择一名玩家进行查验：
 
 游戏公共信息：
 {public_memory}
@@ -419,7 +1058,7 @@ class WerewolfGame:
 
 请选择一名未查验的玩家进行查验，只需回复目标玩家的名字即可。""",
             
-            "guard_night_action.txt": """你是守卫，现在是{game_state}。请根据以下信息选择一名玩家进行守护：
+            "guard_night_action.txt": """你的名字是{player_name}。你是守卫，现在是{game_state}。请根据以下信息选择一名玩家进行守护：
 
 游戏公共信息：
 {public_memory}
@@ -433,7 +1072,7 @@ class WerewolfGame:
 
 请选择一名玩家进行守护，注意不能连续两晚守护同一名玩家。只需回复目标玩家的名字即可。""",
             
-            "villager_night_action.txt": """你是村民，现在是{game_state}。虽然你在夜晚没有特殊行动，但可以思考游戏局势：
+            "villager_night_action.txt": """你的名字是{player_name}。你是村民，现在是{game_state}。虽然你在夜晚没有特殊行动，但可以思考游戏局势：
 
 游戏公共信息：
 {public_memory}
@@ -445,7 +1084,7 @@ class WerewolfGame:
 
 请分析当前局势，判断谁可能是狼人，以及明天应该如何投票。""",
             
-            "hunter_night_action.txt": """你是猎人，现在是{game_state}。虽然你在夜晚没有特殊行动，但可以思考游戏局势：
+            "hunter_night_action.txt": """你的名字是{player_name}。你是猎人，现在是{game_state}。虽然你在夜晚没有特殊行动，但可以思考游戏局势：
 
 游戏公共信息：
 {public_memory}
@@ -457,7 +1096,7 @@ class WerewolfGame:
 
 请分析当前局势，思考如果你被杀死，应该射杀谁，以及为什么。""",
             
-            "idiot_night_action.txt": """你是白痴，现在是{game_state}。虽然你在夜晚没有特殊行动，但可以思考游戏局势：
+            "idiot_night_action.txt": """你的名字是{player_name}。你是白痴，现在是{game_state}。虽然你在夜晚没有特殊行动，但可以思考游戏局势：
 
 游戏公共信息：
 {public_memory}
@@ -469,8 +1108,17 @@ class WerewolfGame:
 
 请分析当前局势，考虑如果明天你被投票出局，是否要揭露身份。""",
             
+            "public_reflection.txt": """现在是{game_state}。请只根据以下公开信息分析当前局势：
+
+游戏公共信息：
+{public_memory}
+
+当前存活的玩家: {living_players}
+
+请用一两句话说明谁可能是狼人以及明天应该如何投票。""",
+            
             # 白天行动提示
-            "player_speak.txt": """你是{role}，现在是{speaking_context}。请根据以下信息进行发言：
+            "player_speak.txt": """你的名字是{player_name}。你是{role}，现在是{speaking_context}。请根据以下信息进行发言：
 
 游戏公共信息：
 {public_memory}
@@ -486,7 +1134,7 @@ class WerewolfGame:
 
 请像真实玩家一样思考并发言，可以适当隐藏自己的身份或误导他人。""",
             
-            "player_vote.txt": """你是{role}，现在需要投票决定处决一名玩家。请根据以下信息做出决定：
+            "player_vote.txt": """你的名字是{player_name}。你是{role}，现在需要投票决定处决一名玩家。请根据以下信息做出决定：
 
 游戏公共信息：
 {public_memory}
@@ -499,7 +1147,7 @@ class WerewolfGame:
 
 请选择一名你认为应该被处决的玩家，只需回复目标玩家的名字即可。""",
             
-            "hunter_shoot_action.txt": """你是猎人，现在你即将死亡，可以开枪带走一名玩家。请根据以下信息选择目标：
+            "hunter_shoot_action.txt": """你的名字是{player_name}。你是猎人，现在你即将死亡，可以开枪带走一名玩家。请根据以下信息选择目标：
 
 游戏公共信息：
 {public_memory}
@@ -512,7 +1160,7 @@ class WerewolfGame:
 
 请选择一名你认为应该射杀的玩家，只需回复目标玩家的名字即可。尽量选择你认为是狼人的玩家。""",
             
-            "idiot_reveal_action.txt": """你是白痴，现在你被投票处决。你可以选择展示身份，继续存活但失去投票权。请根据以下信息做出决定：
+            "idiot_reveal_action.txt": """你的名字是{player_name}。你是白痴，现在你被投票处决。你可以选择展示身份，继续存活但失去投票权。请根据以下信息做出决定：
 
 游戏公共信息：
 {public_memory}
@@ -526,12 +1174,19 @@ class WerewolfGame:
         # 创建提示模板文件
         for filename, content in templates.items():
             file_path = os.path.join(self.prompt_dir, filename)
+            if not overwrite and os.path.exists(file_path):
+                continue
             try:
                 with open(file_path, 'w', encoding='utf-8') as f:
                     f.write(content)
                 print(f"已创建提示模板：{filename}")
             except Exception as e:
                 print(f"创建提示模板 {filename} 失败: {e}")
+        
+        # 模板文件已被覆盖，丢弃缓存中的旧内容
+        self.template_registry.invalidate()
+        if self.template_registry is not default_registry:
+            default_registry.invalidate()
 
 # 示例用法
 if __name__ == "__main__":
@@ -0,0 +1,623 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+from memory import estimate_tokens
+from llm_cache import make_cache_key
+
+class LLMResponse:
+    """一次模型调用的结果"""
+    
+    def __init__(self, text, prompt_tokens=0, completion_tokens=0, cached_tokens=0):
+        self.text = text
+        self.prompt_tokens = prompt_tokens  # 提示消耗的token数
+        self.completion_tokens = completion_tokens  # 生成消耗的token数
+        self.cached_tokens = cached_tokens  # 提示中命中服务端前缀缓存的token数，包含在 prompt_tokens 中
+
+class RateLimitError(Exception):
+    """后端返回429（请求过于频繁）时抛出"""
+    
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after  # 服务端要求等待的秒数（Retry-After），None表示未指定
+
+class ReplayDivergenceError(Exception):
+    """回放时的请求与录制的请求不一致，说明游戏逻辑或提示发生了变化"""
+    
+    def __init__(self, message, seq=None, expected=None, actual=None):
+        super().__init__(message)
+        self.seq = seq  # 发生分歧的请求序号
+        self.expected = expected  # 录制时该序号的提示
+        self.actual = actual  # 回放时收到的提示
+
+class LLMBackend:
+    """模型后端接口，LLMClient 通过后端发送请求，重试和缓存由 LLMClient 负责"""
+    
+    def complete(self, model_name, messages, temperature, max_tokens):
+        """
+        同步发送一次请求
+        
+        Args:
+            model_name (str): 模型名称
+            messages (list): OpenAI格式的消息列表
+            temperature (float): 控制随机性，越高越随机
+            max_tokens (int): 生成文本的最大长度
+        
+        Returns:
+            LLMResponse: 模型返回的结果，失败时抛出异常
+        """
+        raise NotImplementedError
+    
+    async def acomplete(self, model_name, messages, temperature, max_tokens):
+        """异步发送一次请求，默认在线程池中执行同步请求"""
+        return await asyncio.to_thread(self.complete, model_name, messages, temperature, max_tokens)
+    
+    def stream(self, model_name, messages, temperature, max_tokens):
+        """
+        流式发送一次请求，逐段返回生成的文本，默认一次返回完整的回答
+        
+        Yields:
+            str: 生成的文本段
+        
+        Returns:
+            LLMResponse: 生成结束后的完整结果（生成器的返回值）
+        """
+        response = self.complete(model_name, messages, temperature, max_tokens)
+        yield response.text
+        return response
+    
+    async def astream(self, model_name, messages, temperature, max_tokens):
+        """
+        异步流式发送一次请求，默认一次返回完整的回答
+        
+        异步生成器不能有返回值，因此逐段返回生成的文本后，最后一项是完整的结果 LLMResponse。
+        """
+        response = await self.acomplete(model_name, messages, temperature, max_tokens)
+        yield response.text
+        yield response
+    
+    async def aclose(self):
+        """释放当前事件循环上的连接资源"""
+        pass
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI API后端"""
+    
+    def __init__(self, api_key=None, max_concurrency=8, timeout=None, api_base=None):
+        """
+        Args:
+            api_key (str): OpenAI API密钥，None表示从环境变量获取
+            max_concurrency (int): 每个连接池的最大连接数
+            timeout (float): 单次请求的超时时间，单位秒，None表示使用openai库的默认值
+            api_base (str): API地址，None表示使用openai库的默认地址
+        """
+        import openai
+        
+        # 优先使用传入的API密钥，否则从环境变量获取
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("未提供OpenAI API密钥，请通过参数传入或设置OPENAI_API_KEY环境变量")
+        
+        openai.api_key = self.api_key
+        self.openai = openai
+        self.max_concurrency = max_concurrency  # 每个连接池的最大连接数
+        
+        # 每次请求附加的参数
+        self.request_options = {}
+        if timeout is not None:
+            self.request_options["request_timeout"] = timeout
+        if api_base is not None:
+            self.request_options["api_base"] = api_base
+        self._async_sessions = {}  # 每个事件循环共享一个aiohttp连接池
+    
+    def complete(self, model_name, messages, temperature, max_tokens):
+        try:
+            response = self.openai.ChatCompletion.create(
+                model=model_name,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **self.request_options
+            )
+        except self.openai.error.RateLimitError as e:
+            raise RateLimitError(str(e), self._get_retry_after(e)) from e
+        return self._to_response(response)
+    
+    def stream(self, model_name, messages, temperature, max_tokens):
+        parts = []
+        try:
+            response = self.openai.ChatCompletion.create(
+                model=model_name,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **self.request_options
+            )
+            for chunk in response:
+                delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except self.openai.error.RateLimitError as e:
+            raise RateLimitError(str(e), self._get_retry_after(e)) from e
+        
+        return self._to_stream_response(messages, parts)
+    
+    async def astream(self, model_name, messages, temperature, max_tokens):
+        self.openai.aiosession.set(self._get_async_session())
+        parts = []
+        try:
+            response = await self.openai.ChatCompletion.acreate(
+                model=model_name,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                **self.request_options
+            )
+            async for chunk in response:
+                delta = chunk.choices[0].delta.get("content") if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except self.openai.error.RateLimitError as e:
+            raise RateLimitError(str(e), self._get_retry_after(e)) from e
+        yield self._to_stream_response(messages, parts)
+    
+    def _to_stream_response(self, messages, parts):
+        """把流式响应的文本段合并为LLMResponse，流式响应不包含用量，按字符数估算"""
+        text = "".join(parts)
+        return LLMResponse(text, estimate_tokens("".join(m["content"] for m in messages)), estimate_tokens(text))
+    
+    async def acomplete(self, model_name, messages, temperature, max_tokens):
+        # 当前任务内的请求都复用同一个连接池
+        self.openai.aiosession.set(self._get_async_session())
+        try:
+            response = await self.openai.ChatCompletion.acreate(
+                model=model_name,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **self.request_options
+            )
+        except self.openai.error.RateLimitError as e:
+            raise RateLimitError(str(e), self._get_retry_after(e)) from e
+        return self._to_response(response)
+    
+    def _get_retry_after(self, error):
+        """从429响应头中读取 Retry-After 秒数，没有时返回None"""
+        for name, value in (getattr(error, "headers", None) or {}).items():
+            if name.lower() == "retry-after":
+                try:
+                    return float(value)
+                except (TypeError, ValueError):
+                    return None
+        return None
+    
+    def _to_response(self, response):
+        """把OpenAI的响应转换为LLMResponse"""
+        usage = response.get("usage", {}) if hasattr(response, "get") else {}
+        details = usage.get("prompt_tokens_details") or {}
+        return LLMResponse(
+            response.choices[0].message.content,
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+            details.get("cached_tokens", 0)
+        )
+    
+    def _get_async_session(self):
+        """获取当前事件循环对应的共享aiohttp连接池，不存在则创建"""
+        import aiohttp
+        
+        loop = asyncio.get_running_loop()
+        session = self._async_sessions.get(loop)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+            session = aiohttp.ClientSession(connector=connector)
+            self._async_sessions[loop] = session
+        return session
+    
+    async def aclose(self):
+        """关闭当前事件循环上的共享连接池"""
+        session = self._async_sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+class MockBackend(LLMBackend):
+    """
+    离线模拟后端，不访问网络，用于压测游戏引擎
+    
+    根据提示中的模板字段给出合法的角色回答：投票和夜晚行动返回一名候选玩家，
+    女巫返回"使用解药"/"使用毒药 X"，白痴返回"展示身份"。
+    结构化决策的提示会得到JSON格式的回答，invalid_rate 可以模拟不合法的回答。
+    相同的种子和提示总是得到相同的回答，与请求的并发顺序无关。
+    
+    同时按块模拟服务端的前缀缓存：提示按 PREFIX_BLOCK_CHARS 个字符分块，从开头起与之前的请求完全相同的块
+    计入 cached_tokens，与请求的内容无关的回答不受影响。
+    """
+    
+    # 提示中列出候选玩家的字段，按优先级排列
+    TARGET_LABELS = ("可选择袭击的目标", "未查验的玩家", "可守护的玩家", "可投票的对象", "可射杀的目标")
+    
+    # 结构化决策提示中格式要求的开头，见 LLMClient._format_decision_instruction
+    DECISION_MARKER = "只输出一行JSON"
+    
+    # 流式回答每段的字符数，以及首段文本到达时已经过去的延迟比例
+    STREAM_CHUNK_CHARS = 4
+    STREAM_FIRST_CHUNK = 0.3
+    
+    # 模拟前缀缓存时每块的字符数，只有完整的块才会被缓存
+    PREFIX_BLOCK_CHARS = 64
+    
+    def __init__(self, seed=0, latency=0.0, jitter=0.0, save_rate=0.5, poison_rate=0.3, invalid_rate=0.0):
+        """
+        Args:
+            seed (int): 随机种子
+            latency (float): 每次请求固定的模拟延迟，单位秒
+            jitter (float): 在固定延迟基础上增加的随机延迟上限，单位秒
+            save_rate (float): 女巫有解药且有人被袭击时使用解药的概率
+            poison_rate (float): 女巫有毒药时使用毒药的概率
+            invalid_rate (float): 结构化决策首次回答不是JSON的概率，用于测试修正请求
+        """
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.save_rate = save_rate
+        self.poison_rate = poison_rate
+        self.invalid_rate = invalid_rate
+        self._prefix_blocks = set()  # 已缓存的前缀块，每块以模型、之前所有块和本块的内容计算哈希
+        self._prefix_lock = threading.Lock()
+    
+    def complete(self, model_name, messages, temperature, max_tokens):
+        rng = self._get_rng(model_name, messages)
+        delay = self._get_delay(rng)
+        if delay > 0:
+            time.sleep(delay)
+        return self._respond(model_name, messages, rng)
+    
+    async def acomplete(self, model_name, messages, temperature, max_tokens):
+        rng = self._get_rng(model_name, messages)
+        delay = self._get_delay(rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return self._respond(model_name, messages, rng)
+    
+    def stream(self, model_name, messages, temperature, max_tokens):
+        rng = self._get_rng(model_name, messages)
+        delay = self._get_delay(rng)
+        response = self._respond(model_name, messages, rng)
+        
+        chunks = self._split_chunks(response.text)
+        for chunk, chunk_delay in zip(chunks, self._get_chunk_delays(delay, len(chunks))):
+            if chunk_delay > 0:
+                time.sleep(chunk_delay)
+            yield chunk
+        return response
+    
+    async def astream(self, model_name, messages, temperature, max_tokens):
+        rng = self._get_rng(model_name, messages)
+        delay = self._get_delay(rng)
+        response = self._respond(model_name, messages, rng)
+        
+        chunks = self._split_chunks(response.text)
+        for chunk, chunk_delay in zip(chunks, self._get_chunk_delays(delay, len(chunks))):
+            if chunk_delay > 0:
+                await asyncio.sleep(chunk_delay)
+            yield chunk
+        yield response
+    
+    def _split_chunks(self, text):
+        """把回答切分为流式返回的文本段"""
+        return [text[i:i + self.STREAM_CHUNK_CHARS] for i in range(0, len(text), self.STREAM_CHUNK_CHARS)] or [""]
+    
+    def _get_chunk_delays(self, delay, count):
+        """首段文本在模拟延迟的 STREAM_FIRST_CHUNK 比例后到达，其余文本段平均分摊剩余的延迟"""
+        if count == 1:
+            return [delay]
+        rest = delay * (1 - self.STREAM_FIRST_CHUNK) / (count - 1)
+        return [delay * self.STREAM_FIRST_CHUNK] + [rest] * (count - 1)
+    
+    def _get_rng(self, model_name, messages):
+        """每个请求使用由种子和提示决定的独立随机数生成器"""
+        return random.Random(f"{self.seed}:{model_name}:{''.join(m['content'] for m in messages)}")
+    
+    def _get_delay(self, rng):
+        """计算本次请求的模拟延迟"""
+        return self.latency + (rng.uniform(0, self.jitter) if self.jitter > 0 else 0.0)
+    
+    def _respond(self, model_name, messages, rng):
+        """根据提示内容生成回答，所有消息按顺序拼接后作为提示"""
+        prompt = _get_prompt_text(messages)
+        text = self._answer(prompt, rng)
+        cached_tokens = self._lookup_prefix_cache(model_name, messages)
+        return LLMResponse(text, estimate_tokens(prompt), estimate_tokens(text), cached_tokens)
+    
+    def _lookup_prefix_cache(self, model_name, messages):
+        """返回提示开头命中模拟前缀缓存的token数，并把本次请求的所有完整块加入缓存"""
+        text = "".join(f"{message['role']}:{message['content']}\n" for message in messages)
+        block_size = self.PREFIX_BLOCK_CHARS
+        cached_chars = 0
+        block_hash = hash(model_name)
+        with self._prefix_lock:
+            for start in range(0, len(text) - block_size + 1, block_size):
+                block_hash = hash((block_hash, text[start:start + block_size]))
+                if cached_chars == start and block_hash in self._prefix_blocks:
+                    cached_chars += block_size
+                else:
+                    self._prefix_blocks.add(block_hash)
+        return estimate_tokens(text[:cached_chars]) if cached_chars else 0
+    
+    def _answer(self, prompt, rng):
+        if self.DECISION_MARKER in prompt:
+            return self._decision_answer(prompt, rng)
+        
+        # 白痴是否展示身份
+        if "展示身份" in prompt and "被投票处决" in prompt:
+            return "展示身份"
+        
+        # 女巫用药
+        if "你的药剂情况" in prompt:
+            return self._witch_answer(prompt, rng)
+        
+        # 投票和夜晚行动，从候选玩家中选择一名
+        for label in self.TARGET_LABELS:
+            candidates = self._parse_names(prompt, label)
+            if candidates:
+                # 狼人不袭击已知的队友
+                teammates = set(self._parse_names(prompt, "狼人队友"))
+                candidates = [name for name in candidates if name not in teammates] or candidates
+                return rng.choice(candidates)
+        
+        living_players = self._parse_names(prompt, "当前存活的玩家")
+        suspect = rng.choice(living_players) if living_players else "其他玩家"
+        
+        # 夜晚思考，包括合并思考的局势分析
+        if "分析当前局势" in prompt:
+            return f"我觉得 {suspect} 比较可疑，明天需要重点关注。"
+        
+        # 白天发言
+        return rng.choice([
+            "我是好人，昨晚的信息还不够多，先听听大家的发言。",
+            "我觉得有人在刻意带节奏，大家投票前要仔细想想。",
+            "目前没有明确的线索，我建议先观察发言最少的人。"
+        ])
+    
+    def _decision_answer(self, prompt, rng):
+        """结构化决策的回答：先按自由文本的规则回答，再转换为JSON"""
+        context, instruction = prompt.split(self.DECISION_MARKER, 1)
+        actions = re.findall(r"^- (\S+?)（(.*?)）: (.*)$", instruction, re.MULTILINE)
+        
+        # 修正请求中带有之前的回答，否则按自由文本的规则回答
+        previous = self._parse_line(context, "之前的回答")
+        if previous is None:
+            text = self._answer(context, rng)
+            if rng.random() < self.invalid_rate:
+                return text
+        else:
+            text = previous
+        
+        # 回答的第一个词出现在哪个行动的说明中就选择哪个行动，否则选择目标出现在回答中的行动
+        keyword = text.split()[0] if text.split() else ""
+        chosen = None
+        for name, description, targets in actions:
+            if keyword and keyword in description:
+                chosen = (name, targets)
+                break
+        if chosen is None:
+            for name, description, targets in actions:
+                if any(target.strip() in text for target in targets.split(",")):
+                    chosen = (name, targets)
+                    break
+        if chosen is None:
+            chosen = (actions[0][0], actions[0][2]) if actions else ("", "不需要目标")
+        
+        name, targets = chosen
+        target = None
+        if targets != "不需要目标":
+            candidates = [t.strip() for t in targets.split(",") if t.strip()]
+            target = next((c for c in candidates if c in text), None) or rng.choice(candidates)
+        return json.dumps({"action": name, "target": target, "reasoning": "根据目前的信息判断"}, ensure_ascii=False)
+    
+    def _witch_answer(self, prompt, rng):
+        """女巫的回答"""
+        potion_line = self._parse_line(prompt, "你的药剂情况") or ""
+        save_available = "解药: 可用" in potion_line
+        poison_available = "毒药: 可用" in potion_line
+        victim = self._parse_line(prompt, "今晚的受害者是")
+        
+        if victim and save_available and rng.random() < self.save_rate:
+            return "使用解药"
+        
+        if poison_available and rng.random() < self.poison_rate:
+            candidates = [name for name in self._parse_names(prompt, "当前存活的玩家") if name != victim]
+            if candidates:
+                return f"使用毒药 {rng.choice(candidates)}"
+        
+        return "不使用任何药剂"
+    
+    def _parse_line(self, prompt, label):
+        """读取 "label: 内容" 形式的一行，找不到时返回None"""
+        match = re.search(rf"{label}[:：]\s*(.*)", prompt)
+        return match.group(1).strip() if match else None
+    
+    def _parse_names(self, prompt, label):
+        """读取 "label: a, b, c" 形式的玩家列表"""
+        line = self._parse_line(prompt, label)
+        if not line:
+            return []
+        return [name.strip() for name in line.split(",") if name.strip()]
+
+def _get_prompt_text(messages):
+    """拼接所有消息的内容，用于对比回放时的提示"""
+    return "\n\n".join(message["content"] for message in messages)
+
+def _get_request_key(model_name, messages, temperature, max_tokens):
+    """录制和回放时用于匹配请求的键"""
+    return make_cache_key(model_name, json.dumps(messages, ensure_ascii=False), temperature, max_tokens)
+
+class RecordingBackend(LLMBackend):
+    """包装另一个后端，把每次请求的提示和回答追加写入JSONL录制文件，供 ReplayBackend 回放"""
+    
+    def __init__(self, backend, path):
+        """
+        Args:
+            backend (LLMBackend): 实际发送请求的后端
+            path (str): 录制文件路径，已存在时会被覆盖
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        self.backend = backend
+        self.api_key = getattr(backend, "api_key", None)
+        self.path = path
+        self.call_count = 0  # 已录制的请求数
+        self._lock = threading.Lock()
+        self._file = open(path, "w", encoding="utf-8")
+    
+    def write_meta(self, **meta):
+        """写入回放游戏需要的信息（如随机种子和玩家配置），应在第一次请求之前调用"""
+        self._write({"type": "meta", **meta})
+    
+    def complete(self, model_name, messages, temperature, max_tokens):
+        response = self.backend.complete(model_name, messages, temperature, max_tokens)
+        self._record(model_name, messages, temperature, max_tokens, response)
+        return response
+    
+    def stream(self, model_name, messages, temperature, max_tokens):
+        response = yield from self.backend.stream(model_name, messages, temperature, max_tokens)
+        self._record(model_name, messages, temperature, max_tokens, response)
+        return response
+    
+    async def astream(self, model_name, messages, temperature, max_tokens):
+        async for item in self.backend.astream(model_name, messages, temperature, max_tokens):
+            if isinstance(item, LLMResponse):
+                self._record(model_name, messages, temperature, max_tokens, item)
+            yield item
+    
+    async def acomplete(self, model_name, messages, temperature, max_tokens):
+        response = await self.backend.acomplete(model_name, messages, temperature, max_tokens)
+        self._record(model_name, messages, temperature, max_tokens, response)
+        return response
+    
+    async def aclose(self):
+        await self.backend.aclose()
+    
+    def _record(self, model_name, messages, temperature, max_tokens, response):
+        """追加一条请求记录，并发请求按完成顺序编号"""
+        with self._lock:
+            record = {
+                "type": "call",
+                "seq": self.call_count,
+                "key": _get_request_key(model_name, messages, temperature, max_tokens),
+                "model": model_name,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "messages": messages,
+                "response": response.text,
+                "prompt_tokens": response.prompt_tokens,
+                "completion_tokens": response.completion_tokens,
+                "cached_tokens": response.cached_tokens
+            }
+            self.call_count += 1
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+    
+    def _write(self, record):
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+    
+    def close(self):
+        """关闭录制文件"""
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+class ReplayBackend(LLMBackend):
+    """
+    按录制文件回放模型的回答，不访问网络
+    
+    请求按提示、模型和采样参数匹配，与并发请求的完成顺序无关。
+    收到录制中没有的请求时抛出 ReplayDivergenceError，并给出尚未回放的请求中与之最接近的提示以便对比。
+    """
+    
+    def __init__(self, path):
+        """
+        Args:
+            path (str): RecordingBackend 写入的录制文件
+        """
+        self.path = path
+        self.meta = {}
+        self._calls = []  # 按录制顺序排列的请求
+        self._responses = {}  # 键为请求键，值为尚未回放的回答队列
+        self._seq = 0  # 已回放的请求数
+        self._replayed = set()  # 已回放的请求在录制中的序号
+        self._lock = threading.Lock()
+        
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record["type"] == "meta":
+                    self.meta.update({k: v for k, v in record.items() if k != "type"})
+                elif record["type"] == "call":
+                    self._calls.append(record)
+                    self._responses.setdefault(record["key"], deque()).append(record)
+    
+    def complete(self, model_name, messages, temperature, max_tokens):
+        key = _get_request_key(model_name, messages, temperature, max_tokens)
+        with self._lock:
+            seq = self._seq
+            queue = self._responses.get(key)
+            if not queue:
+                raise self._divergence(seq, messages)
+            record = queue.popleft()
+            self._replayed.add(record["seq"])
+            self._seq += 1
+        return LLMResponse(record["response"], record["prompt_tokens"], record["completion_tokens"],
+                           record.get("cached_tokens", 0))
+    
+    async def acomplete(self, model_name, messages, temperature, max_tokens):
+        return self.complete(model_name, messages, temperature, max_tokens)
+    
+    def remaining(self):
+        """返回尚未回放的请求数，游戏结束时不为0说明游戏比录制时提前结束"""
+        with self._lock:
+            return len(self._calls) - self._seq
+    
+    def _divergence(self, seq, messages):
+        """
+        构造分歧错误，指出与录制中最接近的提示第一个不同的位置
+        
+        并发请求的完成顺序每次可能不同，因此不按序号对比，而是在尚未回放的请求中
+        找公共前缀最长的一个，通常就是模板或游戏逻辑改变后的同一个请求。
+        """
+        actual = _get_prompt_text(messages)
+        pending = [call for call in self._calls if call["seq"] not in self._replayed]
+        if not pending:
+            return ReplayDivergenceError(f"第 {seq} 次请求超出了录制的 {len(self._calls)} 次请求", seq, None, actual)
+        
+        def _common_prefix(expected):
+            return next(
+                (i for i, (a, b) in enumerate(zip(expected, actual)) if a != b),
+                min(len(expected), len(actual))
+            )
+        
+        closest = max(pending, key=lambda call: _common_prefix(_get_prompt_text(call["messages"])))
+        expected = _get_prompt_text(closest["messages"])
+        position = _common_prefix(expected)
+        start = max(position - 20, 0)
+        message = (
+            f"第 {seq} 次请求与录制不一致，与录制的第 {closest['seq']} 次请求从第 {position} 个字符开始不同：\n"
+            f"录制: ...{expected[start:position + 40]}\n"
+            f"回放: ...{actual[start:position + 40]}"
+        )
+        return ReplayDivergenceError(message, seq, expected, actual)
\ No newline at end of file
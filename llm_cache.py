@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+def make_cache_key(model_name, prompt, temperature, max_tokens):
+    """根据模型、提示和采样参数生成缓存键"""
+    payload = json.dumps(
+        {"model": model_name, "prompt": prompt, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False,
+        sort_keys=True
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class MemoryLRUCache:
+    """内存LRU缓存，超过条目上限时淘汰最久未使用的响应"""
+    
+    def __init__(self, max_entries=1024, ttl=None):
+        """
+        Args:
+            max_entries (int): 最多保存的响应数量
+            ttl (float): 响应的有效期，单位秒，None表示永不过期
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # 键为缓存键，值为(响应文本, 写入时间)
+        self._lock = threading.Lock()
+    
+    def get(self, key):
+        """读取缓存的响应，不存在或已过期时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            response, created_at = entry
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+    
+    def set(self, key, response, created_at=None):
+        """写入响应，必要时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = (response, created_at or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        return len(self._entries)
+
+class SQLiteCache:
+    """基于SQLite的磁盘缓存，可以在多次运行和多个进程之间共享"""
+    
+    def __init__(self, path, max_entries=100000, ttl=None):
+        """
+        Args:
+            path (str): 数据库文件路径
+            max_entries (int): 最多保存的响应数量，超出时淘汰最久未使用的条目
+            ttl (float): 响应的有效期，单位秒，None表示永不过期
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_accessed_at ON responses (accessed_at)")
+            # 估计的条目数，写入时不必每次统计整个表；其他进程写入的条目在超出上限、淘汰之前重新统计
+            self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    
+    def get(self, key):
+        """
+        读取缓存的响应和写入时间
+        
+        Returns:
+            tuple: (响应文本, 写入时间)，不存在或已过期时返回None
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            response, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._size -= self._conn.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            return response, created_at
+    
+    def set(self, key, response, created_at=None):
+        """写入响应，超出上限时一次淘汰最久未使用的十分之一条目"""
+        now = time.time()
+        with self._lock, self._conn:
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, response, created_at or now, now)
+            )
+            if not exists:
+                self._size += 1
+            if self._size <= self.max_entries:
+                return
+            
+            # 淘汰到上限的90%，之后的写入在再次超出上限之前都不需要统计和淘汰
+            self._size = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if self._size > self.max_entries:
+                excess = self._size - (self.max_entries - self.max_entries // 10)
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (excess,)
+                )
+                self._size -= excess
+    
+    def clear(self):
+        """清空缓存"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+            self._size = 0
+    
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+    
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+class ResponseCache:
+    """LLM响应缓存，先查内存层再查磁盘层，磁盘命中的响应会提升到内存层"""
+    
+    def __init__(self, memory=None, disk=None):
+        """
+        Args:
+            memory (MemoryLRUCache): 内存缓存层，None表示不使用
+            disk (SQLiteCache): 磁盘缓存层，None表示不使用
+        """
+        self.memory = memory
+        self.disk = disk
+        self._lock = threading.Lock()
+        
+        # 统计信息
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+    
+    @classmethod
+    def create(cls, path=None, max_memory_entries=1024, max_disk_entries=100000, ttl=None):
+        """创建默认的两层缓存，path为None时只使用内存缓存"""
+        memory = MemoryLRUCache(max_memory_entries, ttl)
+        disk = SQLiteCache(path, max_disk_entries, ttl) if path else None
+        return cls(memory, disk)
+    
+    def get(self, key):
+        """读取缓存的响应，未命中时返回None"""
+        if self.memory is not None:
+            response = self.memory.get(key)
+            if response is not None:
+                with self._lock:
+                    self.memory_hits += 1
+                return response
+        
+        if self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                response, created_at = entry
+                with self._lock:
+                    self.disk_hits += 1
+                # 保留磁盘上的写入时间，提升到内存层的响应不会超过有效期继续使用
+                if self.memory is not None:
+                    self.memory.set(key, response, created_at)
+                return response
+        
+        with self._lock:
+            self.misses += 1
+        return None
+    
+    def set(self, key, response):
+        """把响应写入所有缓存层"""
+        created_at = time.time()
+        if self.memory is not None:
+            self.memory.set(key, response, created_at)
+        if self.disk is not None:
+            self.disk.set(key, response, created_at)
+    
+    def clear(self):
+        """清空所有缓存层"""
+        if self.memory is not None:
+            self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+    
+    def stats(self):
+        """返回缓存命中统计"""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory) if self.memory is not None else 0,
+            "disk_entries": len(self.disk) if self.disk is not None else 0
+        }
\ No newline at end of file
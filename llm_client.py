@@ -1,51 +1,553 @@
-import os
-import openai
 import time
 import json
+import asyncio
+import threading
+
+from memory import estimate_tokens
+from llm_backends import LLMResponse, OpenAIBackend, RateLimitError, ReplayDivergenceError
+from llm_cache import make_cache_key
+
+# 结构化决策只需要返回一个很短的JSON，生成长度远小于自由发言
+DECISION_MAX_TOKENS = 100
+
+# build_messages 默认的系统消息，所有请求完全相同，是可以被服务端和本地前缀缓存复用的前缀的开头
+PREFIX_SYSTEM_PROMPT = (
+    "你正在参与一局狼人杀游戏。接下来的消息依次是所有玩家都能看到的游戏公共信息，"
+    "以及你的身份、私有信息和本次需要完成的任务。请只根据你能看到的信息，按最后一条消息的要求回答。"
+)
+
+# 所有重试都失败时返回的默认响应
+FAILED_RESPONSE = "我无法回应，请稍后再试。"
+
+def get_prompt_text(prompt):
+    """返回提示或消息列表的全部文本，用于估算token数"""
+    if isinstance(prompt, str):
+        return prompt
+    return "\n\n".join(message["content"] for message in prompt)
+
+class _ChatRequest:
+    """一次聊天请求在多次重试之间共享的状态"""
+    
+    def __init__(self, prompt, temperature, max_tokens):
+        self.start_time = time.perf_counter()
+        self.prompt = prompt
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.cache_key = None  # 缓存键，None表示不使用缓存
+        self.estimated_tokens = 0  # 每次尝试向限流器预留的token数，只在使用限流器时估算
+        self.errors = {"error": 0, "rate_limit": 0}  # 已经失败的次数，按普通错误和429分别计数
+        self.reserved = 0  # 当前尝试预留的token配额，请求成功或失败后归零
 
 class LLMClient:
-    """LLM客户端，负责与OpenAI API通信"""
+    """LLM客户端，负责重试和缓存，实际请求由可替换的模型后端发送"""
     
-    def __init__(self, api_key=None, model_name="gpt-3.5-turbo"):
-        # 优先使用传入的API密钥，否则从环境变量获取
-        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
-        if not self.api_key:
-            raise ValueError("未提供OpenAI API密钥，请通过参数传入或设置OPENAI_API_KEY环境变量")
+    def __init__(self, api_key=None, model_name="gpt-3.5-turbo", max_concurrency=8, cache=None, backend=None,
+                 rate_limiter=None, metrics=None, temperature=0.7, max_tokens=500, timeout=None, api_base=None):
+        # 未指定后端时使用OpenAI API，此时必须提供API密钥，timeout 和 api_base 只用于OpenAI后端
+        if backend is None:
+            backend = OpenAIBackend(api_key, max_concurrency, timeout=timeout, api_base=api_base)
+        self.backend = backend  # 模型后端（如 llm_backends.OpenAIBackend、MockBackend）
+        self.api_key = getattr(backend, "api_key", None)
         
-        openai.api_key = self.api_key
         self.model_name = model_name
+        self.temperature = temperature  # 请求未指定时使用的采样温度
+        self.max_tokens = max_tokens  # 请求未指定时生成文本的最大长度
         self.max_retries = 3
         self.retry_delay = 2  # 重试延迟，单位秒
+        self.max_rate_limit_retries = 8  # 收到429时的最大重试次数，429不计入 max_retries
+        self.max_concurrency = max_concurrency  # chat_many 默认的最大并发请求数
+        self.cache = cache  # 响应缓存（如 llm_cache.ResponseCache），None表示不缓存
+        self.cache_bypass = False  # 为True时所有请求都跳过缓存
+        self.rate_limiter = rate_limiter  # 限流器（如 rate_limiter.RateLimiter），可以在多个客户端之间共享
+        self.metrics = metrics  # 调用指标记录器（如 metrics.MetricsRecorder），None表示不记录
+        
+        # 调用统计，多个线程可能同时更新
+        self._stats_lock = threading.Lock()
+        self.call_count = 0  # 实际发送到后端的请求数（含重试）
+        self.cache_hit_count = 0  # 直接由缓存返回的请求数
+        self.failure_count = 0  # 重试全部失败、返回默认响应的请求数
+        self.rate_limited_count = 0  # 收到429的请求数
+        self.decision_count = 0  # 结构化决策的次数
+        self.repair_count = 0  # 结构化决策首次回答不合法、发送修正请求的次数
+        self.invalid_decision_count = 0  # 修正后仍不合法、被放弃的决策次数
     
-    def chat(self, prompt, temperature=0.7, max_tokens=500):
+    def chat(self, prompt, temperature=None, max_tokens=None, use_cache=True):
         """
         向LLM发送聊天请求
         
         Args:
-            prompt (str): 输入提示
-            temperature (float): 控制随机性，越高越随机
-            max_tokens (int): 生成文本的最大长度
+            prompt (str|list): 输入提示，也可以是 build_messages 组装的消息列表
+            temperature (float): 控制随机性，越高越随机，None表示使用客户端的默认值
+            max_tokens (int): 生成文本的最大长度，None表示使用客户端的默认值
+            use_cache (bool): 是否读写响应缓存，为False时总是请求模型
             
         Returns:
             str: LLM返回的文本响应
         """
+        request, cached_response = self._start_request(prompt, temperature, max_tokens, use_cache)
+        if cached_response is not None:
+            return cached_response
+        
+        # 重试逻辑
+        while True:
+            try:
+                self._reserve(request, self.rate_limiter.acquire(request.estimated_tokens) if self.rate_limiter else 0)
+                response = self.backend.complete(
+                    self.model_name,
+                    self._to_messages(prompt),
+                    request.temperature,
+                    request.max_tokens
+                )
+                return self._finish_request(request, response)
+            except Exception as e:
+                delay = self._handle_failure(request, e)
+                if delay is None:
+                    return FAILED_RESPONSE
+                time.sleep(delay)
+    
+    async def achat(self, prompt, temperature=None, max_tokens=None, use_cache=True):
+        """
+        异步向LLM发送聊天请求，重试等待期间不会阻塞事件循环
+        
+        Args:
+            prompt (str|list): 输入提示，也可以是 build_messages 组装的消息列表
+            temperature (float): 控制随机性，越高越随机，None表示使用客户端的默认值
+            max_tokens (int): 生成文本的最大长度，None表示使用客户端的默认值
+            use_cache (bool): 是否读写响应缓存，为False时总是请求模型
+        
+        Returns:
+            str: LLM返回的文本响应
+        """
+        request, cached_response = self._start_request(prompt, temperature, max_tokens, use_cache)
+        if cached_response is not None:
+            return cached_response
+        
+        # 重试逻辑
+        while True:
+            try:
+                self._reserve(request, await self.rate_limiter.aacquire(request.estimated_tokens) if self.rate_limiter else 0)
+                response = await self.backend.acomplete(
+                    self.model_name,
+                    self._to_messages(prompt),
+                    request.temperature,
+                    request.max_tokens
+                )
+                return self._finish_request(request, response)
+            except Exception as e:
+                delay = self._handle_failure(request, e)
+                if delay is None:
+                    return FAILED_RESPONSE
+                await asyncio.sleep(delay)
+    
+    def chat_stream(self, prompt, temperature=None, max_tokens=None, use_cache=True):
+        """
+        流式向LLM发送聊天请求，逐段返回生成的文本
+        
+        第一段文本到达之前失败时按 chat 的规则重试，之后失败时结束生成，已经返回的文本不会撤回。
+        拼接所有文本段并去掉首尾空白后与 chat 的返回值相同。
+        
+        Args:
+            prompt (str|list): 输入提示，也可以是 build_messages 组装的消息列表
+            temperature (float): 控制随机性，越高越随机，None表示使用客户端的默认值
+            max_tokens (int): 生成文本的最大长度，None表示使用客户端的默认值
+            use_cache (bool): 是否读写响应缓存，为False时总是请求模型
+        
+        Yields:
+            str: 生成的文本段
+        """
+        # 缓存命中时一次返回完整的响应
+        request, cached_response = self._start_request(prompt, temperature, max_tokens, use_cache)
+        if cached_response is not None:
+            yield cached_response
+            return
+        
         # 重试逻辑
-        for attempt in range(self.max_retries):
+        while True:
+            first_chunk = None  # 第一段文本到达的时间，返回过文本段后不能再重试
             try:
-                response = openai.ChatCompletion.create(
-                    model=self.model_name,
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=temperature,
-                    max_tokens=max_tokens
+                self._reserve(request, self.rate_limiter.acquire(request.estimated_tokens) if self.rate_limiter else 0)
+                stream = self.backend.stream(
+                    self.model_name,
+                    self._to_messages(prompt),
+                    request.temperature,
+                    request.max_tokens
                 )
-                return response.choices[0].message.content.strip()
+                while True:
+                    try:
+                        chunk = next(stream)
+                    except StopIteration as stop:
+                        response = stop.value
+                        break
+                    if chunk:
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter()
+                        yield chunk
+                self._finish_request(request, response, first_chunk)
+                return
             except Exception as e:
-                print(f"API请求失败 (尝试 {attempt + 1}/{self.max_retries}): {e}")
-                if attempt < self.max_retries - 1:
-                    time.sleep(self.retry_delay * (2 ** attempt))  # 指数退避
-                else:
-                    print("所有重试都失败，返回默认响应")
-                    return "我无法回应，请稍后再试。"
+                delay = self._handle_failure(request, e, first_chunk)
+                if delay is None:
+                    if first_chunk is None:
+                        yield FAILED_RESPONSE
+                    return
+                time.sleep(delay)
+    
+    async def achat_stream(self, prompt, temperature=None, max_tokens=None, use_cache=True):
+        """
+        chat_stream 的异步版本，以异步迭代器逐段返回生成的文本，等待期间不会阻塞事件循环
+        
+        Args:
+            prompt (str|list): 输入提示，也可以是 build_messages 组装的消息列表
+            temperature (float): 控制随机性，越高越随机，None表示使用客户端的默认值
+            max_tokens (int): 生成文本的最大长度，None表示使用客户端的默认值
+            use_cache (bool): 是否读写响应缓存，为False时总是请求模型
+        
+        Yields:
+            str: 生成的文本段
+        """
+        # 缓存命中时一次返回完整的响应
+        request, cached_response = self._start_request(prompt, temperature, max_tokens, use_cache)
+        if cached_response is not None:
+            yield cached_response
+            return
+        
+        # 重试逻辑
+        while True:
+            first_chunk = None  # 第一段文本到达的时间，返回过文本段后不能再重试
+            try:
+                self._reserve(request, await self.rate_limiter.aacquire(request.estimated_tokens) if self.rate_limiter else 0)
+                response = None
+                # 后端逐段返回文本，最后一项是完整的结果
+                async for item in self.backend.astream(
+                    self.model_name,
+                    self._to_messages(prompt),
+                    request.temperature,
+                    request.max_tokens
+                ):
+                    if isinstance(item, LLMResponse):
+                        response = item
+                    elif item:
+                        if first_chunk is None:
+                            first_chunk = time.perf_counter()
+                        yield item
+                self._finish_request(request, response, first_chunk)
+                return
+            except Exception as e:
+                delay = self._handle_failure(request, e, first_chunk)
+                if delay is None:
+                    if first_chunk is None:
+                        yield FAILED_RESPONSE
+                    return
+                await asyncio.sleep(delay)
+    
+    async def chat_many(self, prompts, temperature=None, max_tokens=None, max_concurrency=None):
+        """
+        并发发送多条互不依赖的聊天请求
+        
+        Args:
+            prompts (list): 输入提示列表
+            temperature (float): 控制随机性，越高越随机，None表示使用客户端的默认值
+            max_tokens (int): 生成文本的最大长度，None表示使用客户端的默认值
+            max_concurrency (int): 同时在途的最大请求数，默认使用 self.max_concurrency
+        
+        Returns:
+            list: 与 prompts 顺序一一对应的文本响应
+        """
+        semaphore = asyncio.Semaphore(max_concurrency or self.max_concurrency)
+        
+        async def _bounded_chat(prompt):
+            async with semaphore:
+                return await self.achat(prompt, temperature, max_tokens)
+        
+        return await asyncio.gather(*(_bounded_chat(prompt) for prompt in prompts))
+    
+    def decide(self, prompt, actions, temperature=None, max_tokens=DECISION_MAX_TOKENS):
+        """
+        结构化决策：要求模型只输出一行JSON，并按合法选项校验，不合法时发送一次修正请求
+        
+        Args:
+            prompt (str|list): 输入提示，也可以是 build_messages 组装的消息列表
+            actions (list): 合法的行动，每项为 (行动名称, 行动说明, 合法目标列表)，
+                不需要目标的行动其目标列表为None
+            temperature (float): 控制随机性，越高越随机，None表示使用客户端的默认值
+            max_tokens (int): 生成文本的最大长度
+        
+        Returns:
+            dict: 包含 action、target、reasoning 的决策，修正后仍不合法时返回None
+        """
+        self._count("decision_count")
+        instruction = self._format_decision_instruction(actions)
+        response = self.chat(self._extend_prompt(prompt, instruction), temperature, max_tokens)
+        decision, error = self._parse_decision(response, actions)
+        if decision is not None:
+            return decision
+        
+        # 修正请求只包含上一次的回答和格式要求，不再重复完整的游戏信息
+        self._count("repair_count")
+        repair_prompt = f"你之前的回答不符合要求：{error}\n之前的回答：{response}\n\n{instruction}"
+        response = self.chat(repair_prompt, 0.0, max_tokens)
+        decision, error = self._parse_decision(response, actions)
+        if decision is None:
+            self._count("invalid_decision_count")
+        return decision
+    
+    def build_messages(self, prompt, context=None, system=PREFIX_SYSTEM_PROMPT):
+        """
+        按前缀稳定的顺序组装消息：固定的系统消息在前，其次是多次调用共享的上下文（如只追加的游戏记录），
+        每次调用不同的提示在最后。同一阶段所有玩家的请求因此共享很长的前缀，可以命中服务端和本地的前缀缓存。
+        
+        Args:
+            prompt (str): 每次调用不同的提示
+            context (str): 多次调用共享的上下文，None表示没有
+            system (str): 系统消息，None表示没有
+        
+        Returns:
+            list: OpenAI格式的消息列表，可以直接作为 chat、decide 等方法的 prompt
+        """
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        if context:
+            messages.append({"role": "user", "content": context})
+        messages.append({"role": "user", "content": prompt})
+        return messages
+    
+    def _to_messages(self, prompt):
+        """把提示转换为消息列表"""
+        if isinstance(prompt, str):
+            return [{"role": "user", "content": prompt}]
+        return list(prompt)
+    
+    def _extend_prompt(self, prompt, text):
+        """在提示的最后追加文本，消息列表追加到最后一条消息中，前面的消息保持不变"""
+        if isinstance(prompt, str):
+            return f"{prompt}\n\n{text}"
+        messages = list(prompt)
+        messages[-1] = {**messages[-1], "content": f"{messages[-1]['content']}\n\n{text}"}
+        return messages
+    
+    def _format_decision_instruction(self, actions):
+        """生成结构化决策的格式要求"""
+        lines = [
+            '只输出一行JSON，不要输出其他内容，格式为 {"action": "行动名称", "target": "目标玩家或null", "reasoning": "不超过20字的理由"}',
+            "可选的行动和目标:"
+        ]
+        for name, description, targets in actions:
+            if targets is None:
+                lines.append(f"- {name}（{description}）: 不需要目标")
+            else:
+                lines.append(f"- {name}（{description}）: {', '.join(targets)}")
+        return "\n".join(lines)
+    
+    def _parse_decision(self, response, actions):
+        """
+        解析并校验结构化决策
+        
+        Returns:
+            tuple: (决策, None) 或 (None, 不合法的原因)
+        """
+        start = response.find("{")
+        end = response.rfind("}")
+        if start == -1 or end < start:
+            return None, "没有找到JSON"
+        try:
+            data = json.loads(response[start:end + 1])
+        except ValueError:
+            return None, "JSON格式错误"
+        if not isinstance(data, dict):
+            return None, "JSON不是对象"
+        
+        legal_actions = {name: targets for name, _, targets in actions}
+        action = data.get("action")
+        if action is None and len(actions) == 1:
+            action = actions[0][0]
+        if action not in legal_actions:
+            return None, f"行动 {action} 不在可选范围内"
+        
+        targets = legal_actions[action]
+        target = data.get("target")
+        if targets is None:
+            target = None
+        elif not isinstance(target, str) or target.strip() not in targets:
+            return None, f"目标 {target} 不在可选范围内"
+        else:
+            target = target.strip()
+        
+        return {"action": action, "target": target, "reasoning": str(data.get("reasoning") or "")}, None
+    
+    def _get_retry_delay(self, error, errors):
+        """
+        记录一次失败的请求并计算重试前的等待时间
+        
+        Args:
+            error (Exception): 请求抛出的异常
+            errors (dict): 本次请求已经失败的次数，按普通错误和429分别计数
+        
+        Returns:
+            float: 重试前等待的秒数，重试次数用完时返回None
+        """
+        if isinstance(error, RateLimitError):
+            self._count("rate_limited_count")
+            errors["rate_limit"] += 1
+            attempt, limit = errors["rate_limit"], self.max_rate_limit_retries
+        else:
+            errors["error"] += 1
+            attempt, limit = errors["error"], self.max_retries
+        print(f"API请求失败 (尝试 {attempt}/{limit}): {error}")
+        if attempt >= limit:
+            return None
+        
+        delay = self.retry_delay * (2 ** (attempt - 1))  # 指数退避
+        if isinstance(error, RateLimitError):
+            if error.retry_after is not None:
+                delay = error.retry_after
+            if self.rate_limiter is not None:
+                # 所有共享限流器的调用方一起暂停，由限流器负责等待
+                self.rate_limiter.pause(delay)
+                return 0.0
+        return delay
+    
+    def _get_sampling_params(self, temperature, max_tokens):
+        """未指定的采样参数使用客户端的默认值"""
+        return (self.temperature if temperature is None else temperature,
+                self.max_tokens if max_tokens is None else max_tokens)
+    
+    def _estimate_tokens(self, prompt, max_tokens):
+        """估算一次请求最多消耗的token数，用于限流器预留配额"""
+        return estimate_tokens(get_prompt_text(prompt)) + max_tokens
+    
+    def _start_request(self, prompt, temperature, max_tokens, use_cache):
+        """
+        开始一次聊天请求，相同的模型、提示和采样参数直接返回缓存的响应
+        
+        Returns:
+            tuple: (请求状态, 缓存的响应)，没有命中缓存时缓存的响应为None
+        """
+        temperature, max_tokens = self._get_sampling_params(temperature, max_tokens)
+        request = _ChatRequest(prompt, temperature, max_tokens)
+        request.cache_key = self._get_cache_key(prompt, temperature, max_tokens, use_cache)
+        if request.cache_key is not None:
+            cached_response = self.cache.get(request.cache_key)
+            if cached_response is not None:
+                self._count("cache_hit_count")
+                self._record(prompt, request.start_time, cache_hit=True)
+                return request, cached_response
+        
+        if self.rate_limiter is not None:
+            request.estimated_tokens = self._estimate_tokens(prompt, max_tokens)
+        return request, None
+    
+    def _reserve(self, request, reserved):
+        """记下本次尝试向限流器预留的token配额，并计入实际发送的请求数"""
+        request.reserved = reserved
+        self._count("call_count")
+    
+    def _finish_request(self, request, response, first_chunk=None):
+        """请求成功后修正预留配额、记录指标并写入缓存，返回去掉首尾空白的响应文本"""
+        self._settle(request.reserved, response)
+        request.reserved = 0
+        self._record(request.prompt, request.start_time, response, sum(request.errors.values()), first_chunk=first_chunk)
+        content = response.text.strip()
+        if request.cache_key is not None:
+            self.cache.set(request.cache_key, content)
+        return content
+    
+    def _handle_failure(self, request, error, first_chunk=None):
+        """
+        处理一次失败的尝试，退还预留的token配额并计算重试前的等待时间
+        
+        Args:
+            request (_ChatRequest): 请求状态
+            error (Exception): 请求抛出的异常
+            first_chunk (float): 流式请求第一段文本到达的时间，返回过文本段后不再重试
+        
+        Returns:
+            float: 重试前等待的秒数，不再重试时返回None
+        """
+        if isinstance(error, ReplayDivergenceError):
+            # 回放与录制不一致时重试也无法得到回答，直接中止游戏
+            self._release(request)
+            raise error
+        if first_chunk is not None:
+            print(f"流式生成中断，保留已生成的文本: {error}")
+            self._count("failure_count")
+            self._record(request.prompt, request.start_time, retries=sum(request.errors.values()), failed=True,
+                         first_chunk=first_chunk)
+            return None
+        
+        # 第一段文本到达之前失败的请求没有消耗token
+        self._release(request)
+        delay = self._get_retry_delay(error, request.errors)
+        if delay is None:
+            print("所有重试都失败，返回默认响应")
+            self._count("failure_count")
+            self._record(request.prompt, request.start_time, retries=sum(request.errors.values()) - 1, failed=True)
+        return delay
+    
+    def _settle(self, reserved, response):
+        """请求成功后按实际消耗的token数修正限流器的预留配额"""
+        if self.rate_limiter is None:
+            return
+        used = response.prompt_tokens + response.completion_tokens
+        self.rate_limiter.settle(reserved, used or None)
+    
+    def _release(self, request):
+        """请求失败时退还预留的token配额，否则每次重试都会再占用一份配额，在服务端限流时使限流更严重"""
+        if self.rate_limiter is not None and request.reserved:
+            self.rate_limiter.settle(request.reserved, 0)
+        request.reserved = 0
+    
+    def _record(self, prompt, start_time, response=None, retries=0, cache_hit=False, failed=False, first_chunk=None):
+        """把一次调用的延迟、token数和重试次数交给指标记录器，first_chunk 为流式请求第一段文本到达的时间"""
+        if self.metrics is None:
+            return
+        self.metrics.record(
+            self.model_name,
+            time.perf_counter() - start_time,
+            response.prompt_tokens if response is not None else 0,
+            response.completion_tokens if response is not None else 0,
+            retries=retries,
+            cache_hit=cache_hit,
+            failed=failed,
+            cached_tokens=response.cached_tokens if response is not None else 0,
+            prompt_chars=len(get_prompt_text(prompt)),
+            first_chunk_latency=first_chunk - start_time if first_chunk is not None else None
+        )
+    
+    def _count(self, counter):
+        """线程安全地增加一个调用计数"""
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+    
+    def get_call_stats(self):
+        """返回调用统计"""
+        return {
+            "calls": self.call_count,
+            "cache_hits": self.cache_hit_count,
+            "failures": self.failure_count,
+            "rate_limited": self.rate_limited_count,
+            "decisions": self.decision_count,
+            "repairs": self.repair_count,
+            "invalid_decisions": self.invalid_decision_count
+        }
+    
+    def _get_cache_key(self, prompt, temperature, max_tokens, use_cache):
+        """返回本次请求的缓存键，不使用缓存时返回None"""
+        if self.cache is None or not use_cache or self.cache_bypass:
+            return None
+        return make_cache_key(self.model_name, prompt, temperature, max_tokens)
+    
+    def set_rate_limiter(self, rate_limiter):
+        """设置限流器，None表示不限流"""
+        self.rate_limiter = rate_limiter
+    
+    def set_cache(self, cache):
+        """设置响应缓存，None表示不缓存"""
+        self.cache = cache
+    
+    async def aclose(self):
+        """释放后端在当前事件循环上的连接池"""
+        await self.backend.aclose()
     
     def set_model(self, model_name):
         """设置使用的模型"""
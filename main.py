@@ -1,25 +1,153 @@
 import os
+import time
 import argparse
 from game import WerewolfGame
+from llm_cache import ResponseCache
+from llm_backends import OpenAIBackend, MockBackend, RecordingBackend, ReplayBackend, ReplayDivergenceError
+from events import ConsoleSink, JsonlSink, MultiSink
+from rate_limiter import get_rate_limiter
+from checkpoint import CheckpointWriter, load_checkpoint, find_latest_checkpoint
+from config import DEFAULT_CONFIG_PATH, load_config
+
+# 检查点文件所在的目录，每局游戏一个文件
+CHECKPOINT_DIR = os.path.join("game_records", "checkpoints")
+
+# 事件日志默认所在的目录，每局游戏一个JSONL文件
+EVENT_LOG_DIR = os.path.join("game_records", "events")
+
+# 会改变提示内容的命令行设置，录制时写入录制文件，回放时自动使用
+REPLAY_SETTINGS = ("memory_budget", "memory_strategy", "structured_decisions", "reflection", "reflection_interval",
+                   "prompt_layout", "concurrent_speech", "wolf_decision")
 
 def main():
     """主程序入口"""
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='狼人杀游戏')
     parser.add_argument('--api-key', help='OpenAI API密钥')
-    parser.add_argument('--model', default='gpt-3.5-turbo', help='使用的模型名称，默认为gpt-3.5-turbo')
+    parser.add_argument('--model', help='使用的模型名称，默认为配置文件中的 llm_settings.model 或gpt-3.5-turbo')
+    parser.add_argument('--config', nargs='?', const=DEFAULT_CONFIG_PATH, metavar='PATH',
+                        help='按配置文件设置玩家、角色、模型、最大天数和请求参数，不指定文件时使用 game_config.json')
     parser.add_argument('--create-templates', action='store_true', help='创建默认提示模板')
+    parser.add_argument('--parallel-voting', action='store_true', help='同时收集所有玩家的投票')
+    parser.add_argument('--concurrent-night', action='store_true', help='夜晚互不依赖的角色行动并发执行')
+    parser.add_argument('--pipelined-speech', action='store_true',
+                        help='白天发言使用流式请求，一段发言结束后立即开始下一名玩家的请求，同时输出上一段发言')
+    parser.add_argument('--concurrent-speech', action='store_true',
+                        help='白天所有玩家基于同一份游戏记录同时发言，看不到同一天前面玩家的发言，适合人数很多的对局')
+    parser.add_argument('--live-speech', action='store_true',
+                        help='发言生成过程中逐段输出到控制台，并作为 speech_delta 事件写入事件日志')
+    parser.add_argument('--reflection', choices=WerewolfGame.REFLECTION_POLICIES, default='each',
+                        help='村民、猎人和白痴的夜晚思考：每人一次请求(each)、同一模型合并为一次请求(batched)或不思考(off)')
+    parser.add_argument('--reflection-interval', type=int, default=1, metavar='N', help='每隔N个夜晚思考一次，默认每晚思考')
+    parser.add_argument('--prompt-layout', choices=WerewolfGame.PROMPT_LAYOUTS, default='inline',
+                        help='提示布局：每个提示一条消息(inline)，或固定说明和共享的游戏记录在前、每次调用不同的内容在后，使请求可以命中前缀缓存(prefix)')
+    parser.add_argument('--wolf-decision', choices=WerewolfGame.WOLF_DECISIONS, default='leader',
+                        help='狼人的夜晚决策：随机一名狼人独自决定(leader)，所有狼人同时提议后按票数决定(vote)，或提议不一致时由一名狼人综合所有提议再决定一次(aggregate)')
+    parser.add_argument('--memory-budget', type=int, help='每名玩家每类记忆的token上限，默认不限制')
+    parser.add_argument('--memory-strategy', choices=['window', 'summary'], default='window',
+                        help='记忆超出预算时丢弃最早的记忆(window)或压缩为摘要(summary)')
+    parser.add_argument('--response-cache', metavar='PATH', help='LLM响应缓存的SQLite文件路径，相同请求直接返回缓存结果')
+    parser.add_argument('--cache-ttl', type=float, help='缓存响应的有效期，单位秒，默认永不过期')
+    parser.add_argument('--mock', action='store_true', help='使用离线模拟后端，不需要API密钥')
+    parser.add_argument('--seed', type=int, help='游戏和模拟后端的随机种子，使用模拟后端时默认为0，否则随机生成')
+    parser.add_argument('--mock-latency', type=float, default=0.0, help='模拟后端每次请求的延迟，单位秒')
+    parser.add_argument('--structured-decisions', action='store_true',
+                        help='投票和夜晚行动要求模型返回JSON格式的决策，不合法时发送一次修正请求')
+    parser.add_argument('--rpm', type=float, help='每分钟最多发送的请求数，默认不限制')
+    parser.add_argument('--tpm', type=float, help='每分钟最多消耗的token数，默认不限制')
+    parser.add_argument('--metrics', metavar='PATH', help='游戏结束后把LLM调用的延迟、token和费用统计以JSON格式写入该文件')
+    parser.add_argument('--metrics-port', type=int, help='在该端口的 /metrics 路径提供Prometheus文本格式的调用指标')
+    parser.add_argument('--checkpoint', action='store_true', help=f'每个阶段结束后把游戏状态保存到 {CHECKPOINT_DIR} 目录')
+    parser.add_argument('--resume', nargs='?', const='', metavar='PATH',
+                        help='从检查点继续游戏，不指定文件时使用最近的检查点')
+    parser.add_argument('--event-log', metavar='PATH',
+                        help=f'把游戏事件以JSONL格式追加写入该文件，默认为 {EVENT_LOG_DIR}/<game_id>.jsonl，控制台输出不变')
+    parser.add_argument('--no-event-log', action='store_true', help='不把游戏事件写入文件')
+    parser.add_argument('--record', metavar='PATH', help='把每次LLM请求的提示和回答录制到该JSONL文件')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='按录制文件回放游戏，不访问网络，提示与录制不一致时报告第一处分歧')
     args = parser.parse_args()
     
-    # 获取API密钥（优先使用命令行参数，其次使用环境变量）
-    api_key = args.api_key or os.environ.get("OPENAI_API_KEY")
-    if not api_key:
+    if (args.record or args.replay) and args.resume is not None:
+        print("错误：--record 和 --replay 不能与 --resume 同时使用")
+        return
+    
+    # 读取并校验配置文件，不使用配置文件时按默认的9人局设置游戏
+    config = None
+    if args.config:
+        try:
+            config = load_config(args.config)
+        except (OSError, ValueError) as e:
+            print(f"错误：{e}")
+            return
+    
+    # 获取API密钥（优先使用命令行参数，其次使用配置文件，最后使用环境变量）
+    api_key = args.api_key or (config.api_key if config else None) or os.environ.get("OPENAI_API_KEY")
+    args.model = args.model or (config.model if config else None) or "gpt-3.5-turbo"
+    if not api_key and not args.mock and not args.replay:
         print("错误：未提供OpenAI API密钥，请使用--api-key参数或设置OPENAI_API_KEY环境变量")
         return
     
     try:
+        # 创建响应缓存，录制和回放时缓存命中的请求不会经过后端，因此不使用缓存
+        response_cache = None
+        if args.response_cache and not (args.record or args.replay):
+            response_cache = ResponseCache.create(args.response_cache, ttl=args.cache_ttl)
+        
+        # 使用模拟后端时不访问网络，默认使用固定的种子使游戏可以复现
+        backend = None
+        seed = args.seed if args.seed is not None else (config.seed if config else None)
+        max_rounds = config.max_rounds if config else None
+        llm_options = config.llm_options() if config else {}
+        if args.replay:
+            # 回放时使用录制时的种子、模型、最大天数和影响提示的设置
+            backend = ReplayBackend(args.replay)
+            meta = backend.meta
+            seed = meta["seed"]
+            args.model = meta["model"]
+            max_rounds = meta.get("max_rounds")
+            llm_options = meta.get("llm_options", {})
+            for name, value in meta.get("settings", {}).items():
+                setattr(args, name, value)
+        elif args.mock:
+            seed = 0 if seed is None else seed
+            backend = MockBackend(seed=seed, latency=args.mock_latency)
+        
+        recorder = None
+        if args.record and not args.create_templates:
+            if backend is None:
+                backend = OpenAIBackend(api_key, timeout=llm_options.get("timeout"), api_base=llm_options.get("api_base"))
+            recorder = RecordingBackend(backend, args.record)
+            backend = recorder
+        
+        # 同一个API密钥的所有请求共享一个限流器
+        rate_limiter = None
+        if (args.rpm or args.tpm) and not args.replay:
+            rate_limiter = get_rate_limiter(api_key or "mock", args.rpm, args.tpm)
+        
         # 创建游戏实例
-        game = WerewolfGame(api_key, args.model)
+        game = WerewolfGame(api_key, args.model, parallel_voting=args.parallel_voting,
+                            concurrent_night=args.concurrent_night,
+                            memory_token_budget=args.memory_budget,
+                            memory_strategy=args.memory_strategy,
+                            response_cache=response_cache,
+                            backend=backend,
+                            structured_decisions=args.structured_decisions,
+                            rate_limiter=rate_limiter,
+                            seed=seed,
+                            pipelined_speech=args.pipelined_speech,
+                            concurrent_speech=args.concurrent_speech,
+                            live_speech=args.live_speech,
+                            max_rounds=max_rounds,
+                            llm_options=llm_options,
+                            reflection=args.reflection,
+                            reflection_interval=args.reflection_interval,
+                            prompt_layout=args.prompt_layout,
+                            wolf_decision=args.wolf_decision)
+        
+        # 游戏运行期间可以通过HTTP抓取调用指标
+        if args.metrics_port:
+            game.metrics.serve_prometheus(args.metrics_port)
         
         # 如果需要创建模板
         if args.create_templates:
@@ -31,32 +159,119 @@ def main():
         print("=== 狼人杀游戏初始化 ===")
         print("使用模型:", args.model)
         
-        # 添加玩家
-        setup_game(game)
+        if args.resume is not None:
+            # 从检查点恢复玩家和游戏状态，并继续在同一个文件中保存检查点
+            checkpoint_path = args.resume or find_latest_checkpoint(CHECKPOINT_DIR)
+            if not checkpoint_path:
+                print("错误：没有找到可以恢复的检查点")
+                return
+            print(f"从检查点恢复: {checkpoint_path}")
+            state = load_checkpoint(checkpoint_path)
+            models = state["game"].get("models", {})
+            for name, role in state["game"]["players"]:
+                game.add_player(name, role, models.get(name))
+            game.restore(state)
+            game.set_checkpoint(CheckpointWriter(checkpoint_path))
+        elif args.replay:
+            # 按录制时的顺序添加玩家
+            print(f"回放录制: {args.replay}")
+            models = meta.get("models", {})
+            for name, role in meta["players"]:
+                game.add_player(name, role, models.get(name))
+        else:
+            # 添加玩家
+            setup_game(game, config)
+            if args.checkpoint:
+                game.set_checkpoint(CheckpointWriter(os.path.join(CHECKPOINT_DIR, f"{game.game_id}.jsonl")))
+        
+        # 游戏事件输出到控制台，同时默认写入每局一个的JSONL文件，文件名使用 game_id（恢复的游戏沿用原来的文件）
+        event_log_path = None
+        if not args.no_event_log:
+            event_log_path = args.event_log or os.path.join(EVENT_LOG_DIR, f"{game.game_id}.jsonl")
+            game.set_event_sink(MultiSink(ConsoleSink(live=args.live_speech), JsonlSink(event_log_path)))
+        elif args.live_speech:
+            game.set_event_sink(ConsoleSink(live=True))
+        
+        if recorder is not None:
+            recorder.write_meta(
+                seed=game.seed,
+                model=args.model,
+                players=list(game.roles_dict.items()),
+                models=dict(game.player_models),
+                max_rounds=game.max_rounds,
+                llm_options=game.llm_options,
+                settings={name: getattr(args, name) for name in REPLAY_SETTINGS}
+            )
         
         # 开始游戏
-        game.start_game()
+        start_time = time.perf_counter()
+        try:
+            game.start_game()
+        finally:
+            # 游戏出错时已经录制的请求也要写入文件
+            if recorder is not None:
+                recorder.close()
+        
+        if recorder is not None:
+            print(f"\n已录制 {recorder.call_count} 次请求到 {args.record}")
+        if event_log_path:
+            print(f"\n游戏事件已写入 {event_log_path}")
+        
+        if args.replay:
+            print(f"\n回放完成，用时 {time.perf_counter() - start_time:.2f} 秒，"
+                  f"剩余未回放的请求: {backend.remaining()}")
+        
+        if args.pipelined_speech or args.concurrent_speech:
+            print("\n发言阶段耗时:")
+            for day in game.get_speech_report()["days"]:
+                print(f"第 {day['day']} 天: {day['speakers']} 人发言，用时 {day['elapsed']:.3f} 秒，"
+                      f"比顺序发言节省 {day['saved']:.3f} 秒")
+        
+        if args.reflection != "each" or args.reflection_interval > 1:
+            total = game.get_reflection_report()["total"]
+            print(f"\n夜晚思考: {total['calls']} 次请求，消耗 {total['prompt_tokens'] + total['completion_tokens']} 个token，"
+                  f"用时 {total['latency']:.3f} 秒；比每人每晚思考少 {total['avoided_calls']} 次请求、"
+                  f"约 {total['avoided_prompt_tokens']} 个提示token、约 {total['avoided_seconds']:.3f} 秒")
+        
+        if args.prompt_layout == "prefix":
+            total = game.metrics.summary()["total"]
+            prompt_tokens = total.get("prompt_tokens", 0)
+            cached_tokens = total.get("cached_tokens", 0)
+            print(f"\n提示前缀缓存: {prompt_tokens} 个提示token中 {cached_tokens} 个命中"
+                  f"（{cached_tokens / prompt_tokens if prompt_tokens else 0:.1%}）")
+        
+        if rate_limiter is not None:
+            print(f"\n限流统计: {rate_limiter.stats()}")
+        
+        if args.metrics:
+            game.metrics.to_json(args.metrics)
+            print(f"\n调用统计已写入 {args.metrics}: {game.metrics.summary()['total']}")
         
+    except ReplayDivergenceError as e:
+        print(f"回放出现分歧: {e}")
     except Exception as e:
         print(f"游戏运行出错: {e}")
 
-def setup_game(game):
-    """设置游戏，添加玩家和角色"""
-    # 默认9人局配置
+def setup_game(game, config=None):
+    """设置游戏，按配置文件添加玩家和角色，没有配置文件时使用默认的9人局"""
     print("\n添加玩家中...")
     
-    # 添加玩家
-    game.add_player("张三", "werewolf")
-    game.add_player("李四", "werewolf")
-    game.add_player("王五", "werewolf")
-    game.add_player("赵六", "villager")
-    game.add_player("钱七", "seer")
-    game.add_player("孙八", "witch")
-    game.add_player("周九", "hunter")
-    game.add_player("吴十", "guard")
-    game.add_player("郑十一", "idiot")
+    if config is not None:
+        # 打乱角色时使用游戏的种子，相同的种子得到相同的座位
+        config.add_players(game, seed=game.seed)
+    else:
+        # 默认9人局配置
+        game.add_player("张三", "werewolf")
+        game.add_player("李四", "werewolf")
+        game.add_player("王五", "werewolf")
+        game.add_player("赵六", "villager")
+        game.add_player("钱七", "seer")
+        game.add_player("孙八", "witch")
+        game.add_player("周九", "hunter")
+        game.add_player("吴十", "guard")
+        game.add_player("郑十一", "idiot")
     
-    print("已添加9名玩家:")
+    print(f"已添加{len(game.players)}名玩家:")
     for name, role in game.roles_dict.items():
         print(f"- {name}: {role}")
 
@@ -0,0 +1,187 @@
+import math
+import threading
+from collections import deque
+
+# 摘要中保留的关键事件关键词
+SUMMARY_KEYWORDS = ("死亡", "被杀", "处决", "查验", "投票给", "解药", "毒药", "守护", "展示", "射杀", "狼人")
+
+def estimate_tokens(text):
+    """
+    粗略估算文本的token数量，不依赖具体的分词器
+    
+    中文等非ASCII字符大约每个字符一个token，ASCII字符大约每4个字符一个token
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + math.ceil((len(text) - non_ascii) / 4)
+
+def summarize_entries(entries, max_chars=40):
+    """默认的摘要方法：只保留包含关键事件的条目，每条截断到 max_chars 个字符"""
+    key_events = [entry[:max_chars] for entry in entries if any(word in entry for word in SUMMARY_KEYWORDS)]
+    return "；".join(key_events)
+
+class MemoryStore:
+    """玩家记忆存储，增量维护拼接后的文本，并可按token预算裁剪旧记忆，可以被多个玩家线程共享"""
+    
+    def __init__(self, token_budget=None, strategy="window", summarizer=None, separator="\n"):
+        """
+        Args:
+            token_budget (int): 记忆文本的token上限，None表示不限制
+            strategy (str): 超出预算时的处理方式，"window" 丢弃最早的记忆，"summary" 将最早的记忆压缩为摘要
+            summarizer (callable): 接收被压缩的条目列表并返回摘要文本，默认使用 summarize_entries
+            separator (str): 条目之间的分隔符
+        """
+        if strategy not in ("window", "summary"):
+            raise ValueError(f"不支持的记忆裁剪策略: {strategy}")
+        
+        self.token_budget = token_budget
+        self.strategy = strategy
+        self.summarizer = summarizer or summarize_entries
+        self.separator = separator
+        
+        self.pinned = []  # 固定保留的记忆，不会被裁剪（如自己的身份、狼人队友）
+        self.entries = deque()  # 可被裁剪的记忆条目
+        self.summary = ""  # 被压缩的早期记忆摘要
+        self._entry_tokens = deque()  # 与 entries 对应的token估算值
+        self._tokens = 0  # pinned、summary 和 entries 的token总数
+        
+        self._text = ""  # 已拼接好的文本
+        self._pending = []  # 尚未拼接进 _text 的新条目
+        self._lock = threading.RLock()
+        
+        # 统计信息
+        self.appended_count = 0
+        self.dropped_count = 0
+        self.summarized_count = 0
+    
+    def append(self, entry, pinned=False):
+        """追加一条记忆，超出预算时裁剪最早的记忆"""
+        tokens = estimate_tokens(entry)
+        with self._lock:
+            self.appended_count += 1
+            self._tokens += tokens
+            
+            if pinned:
+                # 固定记忆排在最前面，需要重新拼接文本
+                self.pinned.append(entry)
+                self._text = None
+                self._pending = []
+            else:
+                self.entries.append(entry)
+                self._entry_tokens.append(tokens)
+                self._pending.append(entry)
+            
+            if self.token_budget is not None and self._tokens > self.token_budget:
+                self._trim()
+    
+    def _trim(self):
+        """把记忆裁剪到预算的四分之三以内，避免每次追加都触发裁剪"""
+        target = self.token_budget * 3 // 4
+        removed = []
+        while self.entries and self._tokens > target:
+            removed.append(self.entries.popleft())
+            self._tokens -= self._entry_tokens.popleft()
+        
+        if not removed:
+            return
+        
+        if self.strategy == "summary":
+            self._tokens -= estimate_tokens(self.summary)
+            new_summary = self.summarizer(removed)
+            if self.summary and new_summary:
+                self.summary = f"{self.summary}；{new_summary}"
+            else:
+                self.summary = self.summary or new_summary
+            # 摘要本身也不能超过预算的四分之一，只保留最近的部分
+            max_tokens = max(self.token_budget // 4, 0)
+            events = self.summary.split("；")
+            while len(events) > 1 and estimate_tokens("；".join(events)) > max_tokens:
+                events.pop(0)
+            self.summary = "；".join(events)
+            if estimate_tokens(self.summary) > max_tokens:
+                # 每个字符至少算一个token，按字符截断即可落在预算内
+                self.summary = self.summary[-max_tokens:] if max_tokens else ""
+            self._tokens += estimate_tokens(self.summary)
+            self.summarized_count += len(removed)
+        else:
+            self.dropped_count += len(removed)
+        
+        # 保留的条目发生变化，下次读取时重新拼接
+        self._text = None
+        self._pending = []
+    
+    def get_text(self):
+        """返回拼接好的记忆文本，只有新增的条目才需要拼接"""
+        with self._lock:
+            if self._text is None:
+                parts = list(self.pinned)
+                if self.summary:
+                    parts.append(f"早期记忆摘要: {self.summary}")
+                parts.extend(self.entries)
+                self._text = self.separator.join(parts)
+                self._pending = []
+            elif self._pending:
+                if self._text:
+                    self._pending.insert(0, self._text)
+                self._text = self.separator.join(self._pending)
+                self._pending = []
+            return self._text
+    
+    def get_entries(self):
+        """返回当前保留的记忆条目列表（固定记忆在前）"""
+        with self._lock:
+            return self.pinned + list(self.entries)
+    
+    def set_budget(self, token_budget, strategy=None):
+        """修改token预算和裁剪策略，立即按新预算裁剪"""
+        if strategy is not None and strategy not in ("window", "summary"):
+            raise ValueError(f"不支持的记忆裁剪策略: {strategy}")
+        with self._lock:
+            if strategy is not None:
+                self.strategy = strategy
+            self.token_budget = token_budget
+            if self.token_budget is not None and self._tokens > self.token_budget:
+                self._trim()
+    
+    def snapshot(self):
+        """返回可以序列化为JSON的完整记忆状态，用于保存检查点"""
+        with self._lock:
+            return {
+                "pinned": list(self.pinned),
+                "entries": list(self.entries),
+                "summary": self.summary,
+                "counts": [self.appended_count, self.dropped_count, self.summarized_count]
+            }
+    
+    def restore(self, snapshot):
+        """从 snapshot 返回的状态恢复记忆，预算和裁剪策略保持不变"""
+        with self._lock:
+            self.pinned = list(snapshot["pinned"])
+            self.entries = deque(snapshot["entries"])
+            self.summary = snapshot["summary"]
+            self._entry_tokens = deque(estimate_tokens(entry) for entry in self.entries)
+            self._tokens = (sum(estimate_tokens(entry) for entry in self.pinned) + estimate_tokens(self.summary)
+                            + sum(self._entry_tokens))
+            self.appended_count, self.dropped_count, self.summarized_count = snapshot["counts"]
+            self._text = None
+            self._pending = []
+    
+    def get_token_count(self):
+        """返回当前记忆文本的估算token数"""
+        return self._tokens
+    
+    def stats(self):
+        """返回记忆大小统计"""
+        return {
+            "entries": len(self.pinned) + len(self.entries),
+            "tokens": self._tokens,
+            "chars": len(self.get_text()),
+            "appended": self.appended_count,
+            "dropped": self.dropped_count,
+            "summarized": self.summarized_count
+        }
+    
+    def __len__(self):
+        return len(self.pinned) + len(self.entries)
+    
+    def __iter__(self):
+        return iter(self.get_entries())
\ No newline at end of file
@@ -0,0 +1,318 @@
+import json
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 当前调用的标签（game_id、day、phase、role、player、action），由游戏在调用玩家方法前设置
+_call_tags = contextvars.ContextVar("llm_call_tags", default={})
+
+# 每1000个token的价格（美元），格式为 模型名称: (提示价格, 生成价格)，价格变化时按需修改
+DEFAULT_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+    "gpt-4": (0.03, 0.06),
+    "gpt-4o-mini": (0.00015, 0.0006)
+}
+
+@contextlib.contextmanager
+def tag_context(**tags):
+    """在 with 块内为LLM调用附加标签，嵌套时内层标签覆盖外层的同名标签"""
+    token = _call_tags.set({**_call_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _call_tags.reset(token)
+
+def current_tags():
+    """返回当前上下文的调用标签"""
+    return dict(_call_tags.get())
+
+def submit_with_context(executor, fn, *args):
+    """
+    把任务提交到线程池，任务在提交时上下文的副本中运行，从而继承调用标签
+    
+    每个任务使用独立的副本，同一个 Context 不能同时在多个线程中运行。
+    """
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+def _escape_label(value):
+    """按Prometheus文本格式转义标签值中的反斜杠、双引号和换行"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class Histogram:
+    """累积直方图，与Prometheus的histogram类型一致"""
+    
+    def __init__(self, buckets):
+        """
+        Args:
+            buckets (tuple): 升序排列的桶上限，最后自动追加 +Inf
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        """记录一个观测值"""
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self):
+        """返回 (桶上限, 累计数量) 列表，最后一项的上限为 "+Inf" """
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+    
+    def to_dict(self):
+        """转换为可以序列化为JSON的字典"""
+        return {
+            "buckets": {str(bound): count for bound, count in self.cumulative()},
+            "sum": round(self.sum, 6),
+            "count": self.count
+        }
+
+class MetricsRecorder:
+    """
+    记录每次LLM调用的延迟、token数、重试、缓存命中和命中服务端前缀缓存的token数，按调用标签汇总
+    
+    直方图按 (game_id, phase, role) 分组，汇总按 (game_id, phase, role, action) 统计，同一个记录器可以记录多局游戏。
+    消耗token最多的 (phase, role, action) 就是最值得优化的提示。
+    """
+    
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+    TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000)
+    
+    def __init__(self, prices=None, max_records=10000):
+        """
+        Args:
+            prices (dict): 每1000个token的价格，默认使用 DEFAULT_PRICES，未知的模型不计算费用
+            max_records (int): 最多保留的单次调用记录数量，汇总和直方图不受影响，统计报告应使用 totals 而不是单次记录
+        """
+        self.prices = DEFAULT_PRICES if prices is None else prices
+        self.records = deque(maxlen=max_records)
+        self._histograms = {}  # 键为 (指标名称, game_id, phase, role)
+        self._groups = {}  # 键为 (game_id, phase, role, action)，值为汇总计数
+        self._lock = threading.Lock()
+    
+    def record(self, model_name, latency, prompt_tokens=0, completion_tokens=0, retries=0,
+               cache_hit=False, failed=False, prompt_chars=0, first_chunk_latency=None, cached_tokens=0):
+        """
+        记录一次LLM调用，标签取自当前上下文
+        
+        Args:
+            model_name (str): 模型名称
+            latency (float): 调用耗时，单位秒，包括重试和限流等待
+            prompt_tokens (int): 提示消耗的token数
+            completion_tokens (int): 生成消耗的token数
+            retries (int): 重试次数
+            cache_hit (bool): 是否由缓存直接返回
+            failed (bool): 是否重试全部失败
+            prompt_chars (int): 提示的字符数
+            first_chunk_latency (float): 流式请求第一段文本到达的耗时，单位秒，非流式请求为None
+            cached_tokens (int): 提示中命中服务端前缀缓存的token数，包含在 prompt_tokens 中
+        """
+        tags = current_tags()
+        cost = self._get_cost(model_name, prompt_tokens, completion_tokens)
+        record = {
+            **tags,
+            "model": model_name,
+            "latency": round(latency, 6),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cached_tokens": cached_tokens,
+            "retries": retries,
+            "cache_hit": cache_hit,
+            "failed": failed,
+            "prompt_chars": prompt_chars,
+            "first_chunk_latency": round(first_chunk_latency, 6) if first_chunk_latency is not None else None,
+            "cost": cost
+        }
+        game_id = tags.get("game_id", "")
+        phase = tags.get("phase", "")
+        role = tags.get("role", "")
+        action = tags.get("action", "")
+        
+        with self._lock:
+            self.records.append(record)
+            labels = (game_id, phase, role)
+            self._observe("latency_seconds", labels, latency, self.LATENCY_BUCKETS)
+            if first_chunk_latency is not None:
+                self._observe("first_chunk_seconds", labels, first_chunk_latency, self.LATENCY_BUCKETS)
+            if not cache_hit:
+                self._observe("prompt_tokens", labels, prompt_tokens, self.TOKEN_BUCKETS)
+                self._observe("completion_tokens", labels, completion_tokens, self.TOKEN_BUCKETS)
+            
+            group = self._groups.get((game_id, phase, role, action))
+            if group is None:
+                group = self._new_group()
+                self._groups[(game_id, phase, role, action)] = group
+            group["calls"] += 1
+            group["cache_hits"] += int(cache_hit)
+            group["retries"] += retries
+            group["failures"] += int(failed)
+            group["prompt_tokens"] += prompt_tokens
+            group["completion_tokens"] += completion_tokens
+            group["cached_tokens"] += cached_tokens
+            group["latency"] += latency
+            group["cost"] += cost
+    
+    def _new_group(self):
+        """返回一组为0的汇总计数"""
+        return {"calls": 0, "cache_hits": 0, "retries": 0, "failures": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "cached_tokens": 0, "latency": 0.0, "cost": 0.0}
+    
+    def _observe(self, name, labels, value, buckets):
+        """记录一个直方图观测值，labels 为 (game_id, phase, role)，调用时需要持有锁"""
+        histogram = self._histograms.get((name, *labels))
+        if histogram is None:
+            histogram = Histogram(buckets)
+            self._histograms[(name, *labels)] = histogram
+        histogram.observe(value)
+    
+    def _get_cost(self, model_name, prompt_tokens, completion_tokens):
+        """按价格表估算费用，未知的模型返回0"""
+        price = self.prices.get(model_name)
+        if price is None:
+            return 0.0
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1000
+    
+    def summary(self, top=10):
+        """
+        返回汇总信息
+        
+        Args:
+            top (int): hot_prompts 中保留的分组数量
+        
+        Returns:
+            dict: 总计、按 game_id、phase 和 role 的汇总，以及按token消耗排序的 (phase, role, action) 分组
+        """
+        with self._lock:
+            groups = {key: dict(value) for key, value in self._groups.items()}
+        
+        def _merge(get_key):
+            merged = {}
+            for key, group in groups.items():
+                target = merged.setdefault(get_key(key), {})
+                for name, value in group.items():
+                    target[name] = target.get(name, 0) + value
+            return merged
+        
+        # 同一个提示在不同游戏中的消耗合并计算
+        hot = sorted(_merge(lambda key: key[1:]).items(),
+                     key=lambda item: item[1]["prompt_tokens"] + item[1]["completion_tokens"], reverse=True)
+        return {
+            "total": self._round(_merge(lambda key: "total").get("total", {})),
+            "by_game": {name: self._round(values) for name, values in _merge(lambda key: key[0]).items()},
+            "by_phase": {name: self._round(values) for name, values in _merge(lambda key: key[1]).items()},
+            "by_role": {name: self._round(values) for name, values in _merge(lambda key: key[2]).items()},
+            "hot_prompts": [
+                {"phase": phase, "role": role, "action": action, **self._round(group)}
+                for (phase, role, action), group in hot[:top]
+            ]
+        }
+    
+    def totals(self, game_id=None, action=None):
+        """
+        返回汇总计数的合计，与 records 不同，不会因为 max_records 丢弃旧的调用
+        
+        Args:
+            game_id (str): 只统计这局游戏的调用，None表示所有游戏
+            action (str): 只统计这种行动的调用，None表示所有行动
+        
+        Returns:
+            dict: 调用次数、缓存命中、重试、失败、token数、总耗时和费用
+        """
+        total = self._new_group()
+        with self._lock:
+            for (group_game, _, _, group_action), group in self._groups.items():
+                if (game_id is None or group_game == game_id) and (action is None or group_action == action):
+                    for name, value in group.items():
+                        total[name] += value
+        return self._round(total)
+    
+    def _round(self, values):
+        """统一浮点数的精度"""
+        return {name: round(value, 6) if isinstance(value, float) else value for name, value in values.items()}
+    
+    def to_dict(self):
+        """返回汇总信息和所有直方图"""
+        with self._lock:
+            histograms = [
+                {"name": name, "game_id": game_id, "phase": phase, "role": role, **histogram.to_dict()}
+                for (name, game_id, phase, role), histogram in self._histograms.items()
+            ]
+        return {"summary": self.summary(), "histograms": histograms}
+    
+    def to_json(self, path=None):
+        """导出为JSON字符串，path 不为None时同时写入文件"""
+        text = json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        return text
+    
+    def to_prometheus(self):
+        """导出为Prometheus文本格式"""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            groups = sorted(self._groups.items())
+        
+        current_name = None
+        for (name, game_id, phase, role), histogram in histograms:
+            metric = f"werewolf_llm_{name}"
+            if name != current_name:
+                lines.append(f"# TYPE {metric} histogram")
+                current_name = name
+            labels = f'game_id="{_escape_label(game_id)}",phase="{_escape_label(phase)}",role="{_escape_label(role)}"'
+            for bound, count in histogram.cumulative():
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+        
+        for counter in ("calls", "cache_hits", "retries", "failures", "cached_tokens"):
+            metric = f"werewolf_llm_{counter}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (game_id, phase, role, action), group in groups:
+                labels = (f'game_id="{_escape_label(game_id)}",phase="{_escape_label(phase)}",'
+                          f'role="{_escape_label(role)}",action="{_escape_label(action)}"')
+                lines.append(f"{metric}{{{labels}}} {group[counter]}")
+        return "\n".join(lines) + "\n"
+    
+    def serve_prometheus(self, port, host="127.0.0.1"):
+        """
+        在后台线程中启动HTTP服务，GET /metrics 返回Prometheus文本格式的指标
+        
+        Returns:
+            ThreadingHTTPServer: 调用 shutdown() 停止服务
+        """
+        recorder = self
+        
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = recorder.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        server = ThreadingHTTPServer((host, port), _Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
\ No newline at end of file
@@ -0,0 +1,112 @@
+import threading
+from collections import deque
+
+class NameMatcher:
+    """
+    基于Aho-Corasick自动机的玩家名称匹配器，每局游戏构建一次，由所有玩家共享
+    
+    扫描一遍模型回应就能找到所有玩家名称，重叠时取最左最长的匹配，
+    例如回应中的"郑十一"不会被误认为"十一"。
+    """
+    
+    def __init__(self, names):
+        """
+        Args:
+            names (iterable): 所有玩家名称
+        """
+        self.names = [name for name in dict.fromkeys(names) if name]
+        self._goto = [{}]  # 每个状态的转移表
+        self._fail = [0]  # 失配时跳转的状态
+        self._output = [None]  # 在该状态结束的最长名称
+        self._dict_link = [0]  # 沿失配链能到达的最近一个有输出的状态
+        self._build()
+        
+        # 统计信息
+        self._lock = threading.Lock()
+        self.match_count = 0
+        self.failure_count = 0
+    
+    def _build(self):
+        """构建字典树和失配链"""
+        for name in self.names:
+            state = 0
+            for ch in name:
+                next_state = self._goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                    self._dict_link.append(0)
+                    self._goto[state][ch] = next_state
+                state = next_state
+            self._output[state] = name
+        
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(ch, 0)
+                self._fail[next_state] = fail
+                self._dict_link[next_state] = fail if self._output[fail] is not None else self._dict_link[fail]
+    
+    def find_all(self, text):
+        """
+        找出文本中所有不重叠的玩家名称，重叠时取最左最长的匹配
+        
+        Returns:
+            list: 按出现位置排列的 (起始位置, 玩家名称) 列表
+        """
+        # 记录每个起始位置上最长的名称
+        longest = {}
+        state = 0
+        for end, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            
+            match_state = state if self._output[state] is not None else self._dict_link[state]
+            while match_state:
+                name = self._output[match_state]
+                start = end - len(name) + 1
+                if len(name) > len(longest.get(start, "")):
+                    longest[start] = name
+                match_state = self._dict_link[match_state]
+        
+        matches = []
+        covered_until = 0
+        for start in sorted(longest):
+            if start >= covered_until:
+                matches.append((start, longest[start]))
+                covered_until = start + len(longest[start])
+        return matches
+    
+    def match(self, text, candidates=None):
+        """
+        返回文本中最早出现的候选玩家名称，找不到时返回None并计入解析失败次数
+        
+        Args:
+            text (str): 模型的回应
+            candidates (iterable): 合法的候选玩家，None表示所有玩家
+        """
+        allowed = set(candidates) if candidates is not None else None
+        target = None
+        for _, name in self.find_all(text or ""):
+            if allowed is None or name in allowed:
+                target = name
+                break
+        
+        with self._lock:
+            if target is None:
+                self.failure_count += 1
+            else:
+                self.match_count += 1
+        return target
+    
+    def stats(self):
+        """返回匹配统计，failures 为没能从回应中解析出合法目标的次数"""
+        return {"matches": self.match_count, "failures": self.failure_count}
\ No newline at end of file
@@ -0,0 +1,62 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import submit_with_context
+
+class NightScheduler:
+    """夜晚行动调度器，按声明的依赖关系执行行动，互不依赖的行动可以并发执行"""
+    
+    def __init__(self, concurrent=True, max_workers=None):
+        self.concurrent = concurrent  # 为False时按声明顺序逐个执行
+        self.max_workers = max_workers  # 并发执行的最大线程数，None表示与行动数量相同
+        self.actions = {}  # 行动字典，键为行动名称，值为(行动函数, 依赖的行动名称列表)
+        self.results = {}  # 已完成行动的结果，键为行动名称
+    
+    def add_action(self, name, action, depends_on=None):
+        """
+        声明一个夜晚行动
+        
+        Args:
+            name (str): 行动名称，在同一个夜晚内唯一
+            action (callable): 行动函数，接收已完成行动的结果字典，返回该行动的结果
+            depends_on (list): 必须先完成的行动名称列表，只能引用已声明的行动
+        """
+        if name in self.actions:
+            raise ValueError(f"夜晚行动 {name} 重复声明")
+        
+        depends_on = list(depends_on or [])
+        for dependency in depends_on:
+            if dependency not in self.actions:
+                raise ValueError(f"夜晚行动 {name} 依赖了未声明的行动 {dependency}")
+        
+        self.actions[name] = (action, depends_on)
+    
+    def run(self):
+        """
+        执行所有已声明的行动
+        
+        Returns:
+            dict: 行动名称到行动结果的映射
+        """
+        if not self.concurrent or len(self.actions) <= 1:
+            # 依赖只能引用先声明的行动，所以声明顺序本身就是合法的执行顺序
+            for name, (action, _) in self.actions.items():
+                self.results[name] = action(self.results)
+            return self.results
+        
+        pending = dict(self.actions)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers or len(self.actions)) as executor:
+            while pending or running:
+                # 提交所有依赖已经完成的行动
+                for name, (action, depends_on) in list(pending.items()):
+                    if all(dependency in self.results for dependency in depends_on):
+                        # 行动在提交时上下文的副本中运行，继承LLM调用标签
+                        running[submit_with_context(executor, action, self.results)] = name
+                        del pending[name]
+                
+                # 等待任意一个行动完成后再检查是否有新的行动可以开始
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self.results[running.pop(future)] = future.result()
+        
+        return self.results
\ No newline at end of file
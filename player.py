@@ -1,21 +1,34 @@
-import os
+from memory import MemoryStore, estimate_tokens
+from prompt_templates import default_registry
+from name_matcher import NameMatcher
+
+# prefix 布局下模板中公共信息的位置改为引用前面的消息
+PUBLIC_MEMORY_REFERENCE = "（见前面的游戏公共信息）"
 
 class Player:
     """玩家基类，所有角色都继承自该类"""
     
+    # 需要保存到检查点的属性，子类追加自己的状态
+    STATE_FIELDS = ("is_alive",)
+    
     def __init__(self, name, llm_client, model_name="gpt-3.5-turbo"):
         self.name = name
         self.role = None
         self.is_alive = True
-        self.public_memory = []   # 公共记忆，用于存储游戏公开信息
-        self.private_memory = []  # 私有记忆，用于存储玩家个人信息
+        self.public_memory = MemoryStore()   # 公共记忆，用于存储游戏公开信息
+        self.private_memory = MemoryStore()  # 私有记忆，用于存储玩家个人信息
         self.llm_client = llm_client
         self.model_name = model_name
+        self.template_registry = default_registry  # 共享的提示模板注册表
+        self.name_matcher = None  # 游戏共享的玩家名称匹配器，由游戏开始时设置
+        self.structured_decisions = False  # 为True时投票和行动要求模型返回JSON格式的决策
+        self.prompt_layout = "inline"  # 提示布局，见 set_prompt_layout
     
     def set_role(self, role):
         """设置玩家角色"""
         self.role = role
-        self.add_private_memory(f"我是{role}角色")
+        # 自己的发言只出现在共享的游戏记录中（"名字 说：..."），玩家需要知道自己的名字才能认出自己的发言
+        self.add_private_memory(f"我是{self.name}，是{role}角色", pinned=True)
     
     def get_role(self):
         """获取玩家角色"""
@@ -25,21 +38,61 @@ class Player:
         """判断是否为狼人阵营"""
         return "狼" in self.role
     
+    def set_public_memory(self, store):
+        """使用共享的公共记忆（游戏记录），所有玩家引用同一个 MemoryStore"""
+        self.public_memory = store
+    
     def add_public_memory(self, memory):
-        """添加公共记忆"""
+        """添加公共记忆，使用共享的游戏记录时所有玩家都能看到"""
         self.public_memory.append(memory)
     
-    def add_private_memory(self, memory):
-        """添加私有记忆"""
-        self.private_memory.append(memory)
+    def add_private_memory(self, memory, pinned=False):
+        """添加私有记忆，pinned为True的记忆不会因超出token预算被裁剪"""
+        self.private_memory.append(memory, pinned=pinned)
     
     def get_public_memory(self):
         """获取公共记忆"""
-        return self.public_memory
+        return self.public_memory.get_entries()
     
     def get_private_memory(self):
         """获取私有记忆"""
-        return self.private_memory
+        return self.private_memory.get_entries()
+    
+    def get_public_memory_text(self):
+        """获取拼接好的公共记忆文本"""
+        return self.public_memory.get_text()
+    
+    def get_private_memory_text(self):
+        """获取拼接好的私有记忆文本"""
+        return self.private_memory.get_text()
+    
+    def set_memory_budget(self, token_budget, strategy="window"):
+        """
+        设置记忆的token预算，公共记忆和私有记忆各自独立计算
+        
+        Args:
+            token_budget (int): 每类记忆的token上限，None表示不限制
+            strategy (str): "window" 丢弃最早的记忆，"summary" 将最早的记忆压缩为摘要
+        """
+        self.public_memory.set_budget(token_budget, strategy)
+        self.private_memory.set_budget(token_budget, strategy)
+    
+    def get_memory_stats(self):
+        """获取公共记忆和私有记忆的大小统计"""
+        return {
+            "public": self.public_memory.stats(),
+            "private": self.private_memory.stats()
+        }
+    
+    def get_state(self):
+        """返回需要保存到检查点的玩家状态（不含记忆，记忆由检查点单独增量保存）"""
+        return {field: getattr(self, field) for field in self.STATE_FIELDS}
+    
+    def set_state(self, state):
+        """从检查点恢复玩家状态"""
+        for field in self.STATE_FIELDS:
+            if field in state:
+                setattr(self, field, state[field])
     
     def get_name(self):
         """获取玩家名称"""
@@ -60,14 +113,12 @@ class Player:
         白天投票选择要放逐的玩家
         """
         # 读取投票提示模板
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
+        prompt_template = self._get_prompt_template(prompt_template_path)
         
         if prompt_template:
             # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
+            public_memory = self.get_public_memory_text()
+            private_memory = self.get_private_memory_text()
             
             # 从living_players中移除自己，只能投票给其他玩家
             vote_options = [player for player in living_players if player != self.name]
@@ -77,7 +128,8 @@ class Player:
                 return None
             
             # 生成提示，让玩家决定投票
-            prompt = prompt_template.format(
+            prompt = self._format_prompt(
+                prompt_template,
                 player_name=self.name,
                 role=self.role,
                 public_memory=public_memory,
@@ -86,15 +138,8 @@ class Player:
                 vote_options=", ".join(vote_options)
             )
             
-            # 请求模型回应进行投票
-            vote_response = self.llm_client.chat(prompt)
-            
-            # 提取投票目标
-            vote_target = None
-            for player in vote_options:
-                if player in vote_response:
-                    vote_target = player
-                    break
+            # 请求模型选择投票目标
+            vote_target = self._choose_target(prompt, vote_options, "投票放逐该玩家")
             
             # 记录投票行为
             if vote_target:
@@ -104,22 +149,27 @@ class Player:
         # 如果无法进行投票，返回None
         return None
     
-    def speak(self, speaking_context, prompt_template_path):
+    def speak(self, speaking_context, prompt_template_path, stream=False, on_chunk=None):
         """
         玩家发言
+        
+        Args:
+            speaking_context (str): 发言的背景，如"第 1 天白天"
+            prompt_template_path (str): 发言提示模板的路径
+            stream (bool): 是否使用流式请求，发言内容与非流式请求相同
+            on_chunk (callable): 每收到一段生成的文本就以该文本调用一次，用于实时转发发言，传入时总是使用流式请求
         """
         # 读取发言提示模板
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
+        prompt_template = self._get_prompt_template(prompt_template_path)
         
         if prompt_template:
             # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
+            public_memory = self.get_public_memory_text()
+            private_memory = self.get_private_memory_text()
             
             # 生成提示，让玩家进行发言
-            prompt = prompt_template.format(
+            prompt = self._format_prompt(
+                prompt_template,
                 player_name=self.name,
                 role=self.role,
                 public_memory=public_memory,
@@ -128,10 +178,15 @@ class Player:
             )
             
             # 请求模型回应进行发言
-            speech = self.llm_client.chat(prompt)
-            
-            # 记录发言内容
-            self.add_private_memory(f"我的发言: {speech}")
+            if stream or on_chunk is not None:
+                chunks = []
+                for chunk in self.llm_client.chat_stream(prompt):
+                    chunks.append(chunk)
+                    if on_chunk is not None:
+                        on_chunk(chunk)
+                speech = "".join(chunks).strip()
+            else:
+                speech = self.llm_client.chat(prompt)
             
             return speech
         
@@ -153,11 +208,110 @@ class Player:
         # 基类不实现任何行动
         return None
     
-    def _read_file(self, file_path):
-        """读取文件内容的辅助方法"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        except Exception as e:
-            print(f"读取文件 {file_path} 时出错: {e}")
-            return None
\ No newline at end of file
+    def reflect(self, game_state, living_players, prompt_template_path):
+        """
+        夜晚没有特殊行动的角色思考游戏局势，思考内容写入私有记忆
+        
+        Returns:
+            str: 思考内容，模板不存在时返回None
+        """
+        prompt = self.format_reflection_prompt(game_state, living_players, prompt_template_path)
+        if prompt is None:
+            return None
+        
+        reflection = self.llm_client.chat(prompt)
+        self.add_reflection(reflection)
+        return reflection
+    
+    def format_reflection_prompt(self, game_state, living_players, prompt_template_path):
+        """生成夜晚思考的提示，模板不存在时返回None"""
+        prompt_template = self._get_prompt_template(prompt_template_path)
+        if not prompt_template:
+            return None
+        
+        return self._format_prompt(
+            prompt_template,
+            player_name=self.name,
+            role=self.role,
+            game_state=game_state,
+            public_memory=self.get_public_memory_text(),
+            private_memory=self.get_private_memory_text(),
+            living_players=", ".join(living_players)
+        )
+    
+    def estimate_reflection_tokens(self, game_state, living_players, prompt_template_path):
+        """按记忆的token数估算夜晚思考提示的token数，不拼接提示，模板不存在时返回None"""
+        prompt_template = self._get_prompt_template(prompt_template_path)
+        if not prompt_template:
+            return None
+        
+        tokens = estimate_tokens(prompt_template.text) + estimate_tokens(game_state) + estimate_tokens(", ".join(living_players))
+        if "public_memory" in prompt_template.fields:
+            tokens += self.public_memory.get_token_count()
+        if "private_memory" in prompt_template.fields:
+            tokens += self.private_memory.get_token_count()
+        return tokens
+    
+    def add_reflection(self, reflection):
+        """把夜晚思考添加到私有记忆"""
+        self.add_private_memory(f"夜晚思考: {reflection}")
+    
+    def set_name_matcher(self, name_matcher):
+        """设置游戏共享的玩家名称匹配器"""
+        self.name_matcher = name_matcher
+    
+    def set_structured_decisions(self, enabled):
+        """设置是否使用结构化决策模式"""
+        self.structured_decisions = enabled
+    
+    def set_template_registry(self, registry):
+        """使用游戏的提示模板注册表（prompt_templates.PromptTemplateRegistry）"""
+        self.template_registry = registry
+    
+    def set_prompt_layout(self, layout):
+        """
+        设置提示布局
+        
+        Args:
+            layout (str): "inline" 公共信息留在模板中的位置，整个提示作为一条消息；
+                "prefix" 公共信息移到模板之前单独作为一条消息，同一阶段所有玩家的提示共享相同的前缀
+        """
+        self.prompt_layout = layout
+    
+    def _format_prompt(self, prompt_template, **fields):
+        """按提示布局渲染模板，prefix 布局返回 LLMClient.build_messages 组装的消息列表"""
+        if self.prompt_layout != "prefix" or "public_memory" not in fields:
+            return prompt_template.format(**fields)
+        
+        public_memory = fields["public_memory"]
+        fields["public_memory"] = PUBLIC_MEMORY_REFERENCE
+        return self.llm_client.build_messages(prompt_template.format(**fields), context=f"游戏公共信息：\n{public_memory}")
+    
+    def _choose_target(self, prompt, candidates, description):
+        """
+        请求模型从候选玩家中选择一名
+        
+        Args:
+            prompt (str|list): 输入提示或消息列表
+            candidates (list): 合法的候选玩家
+            description (str): 行动说明，结构化决策模式下告诉模型选择的含义
+        
+        Returns:
+            str: 选中的玩家，无法解析出合法目标时返回None
+        """
+        if self.structured_decisions:
+            decision = self.llm_client.decide(prompt, [("choose", description, candidates)])
+            return decision["target"] if decision else None
+        response = self.llm_client.chat(prompt)
+        return self._match_target(response, candidates)
+    
+    def _match_target(self, response, candidates):
+        """从模型回应中提取最早出现的候选玩家，找不到时返回None"""
+        if self.name_matcher is None:
+            # 不在游戏中使用时，临时为候选玩家构建匹配器
+            return NameMatcher(candidates).match(response, candidates)
+        return self.name_matcher.match(response, candidates)
+    
+    def _get_prompt_template(self, prompt_template_path):
+        """从共享的模板注册表获取提示模板，模板只会从磁盘读取一次"""
+        return self.template_registry.get(prompt_template_path)
\ No newline at end of file
@@ -0,0 +1,118 @@
+import os
+import string
+import threading
+
+class PromptTemplate:
+    """预解析的提示模板，渲染时直接拼接文本片段，不再重复解析格式串"""
+    
+    def __init__(self, path, text, mtime=None):
+        self.path = path
+        self.text = text
+        self.mtime = mtime  # 读取时文件的修改时间，用于热加载判断
+        self.segments = []  # (字面文本, 字段名) 列表，字段名为None表示没有字段
+        self.simple = True  # 所有字段都不带转换和格式说明时可以直接拼接
+        
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(text):
+            if field_name is not None and (format_spec or conversion or not field_name.isidentifier()):
+                self.simple = False
+            self.segments.append((literal, field_name))
+        
+        self.fields = {field for _, field in self.segments if field}
+    
+    def __bool__(self):
+        """空模板视为无效模板"""
+        return bool(self.text)
+    
+    def format(self, **kwargs):
+        """用给定的字段值渲染模板，多余的字段会被忽略"""
+        if not self.simple:
+            return self.text.format(**kwargs)
+        
+        parts = []
+        for literal, field_name in self.segments:
+            parts.append(literal)
+            if field_name is not None:
+                parts.append(str(kwargs[field_name]))
+        return "".join(parts)
+
+class PromptTemplateRegistry:
+    """提示模板注册表，每个模板只从磁盘读取一次，所有角色共享"""
+    
+    def __init__(self, base_dir=None, auto_reload=False):
+        # 模板路径相对于项目根目录
+        self.base_dir = base_dir or os.path.dirname(os.path.abspath(__file__))
+        self.auto_reload = auto_reload  # 为True时每次获取模板都检查文件修改时间
+        self._templates = {}  # 模板字典，键为模板相对路径，值为PromptTemplate
+        self._lock = threading.Lock()
+        
+        # 统计信息
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+    
+    def get(self, template_path):
+        """
+        获取模板，第一次使用时从磁盘加载
+        
+        Args:
+            template_path (str): 相对于项目根目录的模板路径
+        
+        Returns:
+            PromptTemplate: 解析后的模板，文件不存在或读取失败时返回None
+        """
+        full_path = os.path.join(self.base_dir, template_path)
+        with self._lock:
+            template = self._templates.get(template_path)
+            if template is not None:
+                if not self.auto_reload or self._get_mtime(full_path) == template.mtime:
+                    self.hits += 1
+                    return template
+                # 文件在上次加载后被修改过，重新加载
+                self.reloads += 1
+            
+            self.misses += 1
+            try:
+                with open(full_path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                mtime = os.path.getmtime(full_path)
+            except Exception as e:
+                print(f"读取文件 {full_path} 时出错: {e}")
+                self._templates.pop(template_path, None)
+                return None
+            
+            template = PromptTemplate(template_path, text, mtime)
+            self._templates[template_path] = template
+            return template
+    
+    def _get_mtime(self, full_path):
+        """获取文件修改时间，文件不存在时返回None"""
+        try:
+            return os.path.getmtime(full_path)
+        except OSError:
+            return None
+    
+    def exists(self, template_path):
+        """判断模板是否存在，已缓存的模板不会再访问磁盘"""
+        if template_path in self._templates and not self.auto_reload:
+            return True
+        return os.path.exists(os.path.join(self.base_dir, template_path))
+    
+    def invalidate(self, template_path=None):
+        """丢弃缓存的模板，不指定路径时清空全部缓存"""
+        with self._lock:
+            if template_path is None:
+                self._templates.clear()
+            else:
+                self._templates.pop(template_path, None)
+    
+    def stats(self):
+        """返回缓存命中统计"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "cached_templates": len(self._templates)
+        }
+
+# 进程内共享的默认模板注册表
+default_registry = PromptTemplateRegistry()
\ No newline at end of file
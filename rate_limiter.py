@@ -0,0 +1,202 @@
+import time
+import asyncio
+import threading
+
+class TokenBucket:
+    """令牌桶，容量为每分钟的配额，按固定速率补充"""
+    
+    def __init__(self, per_minute):
+        """
+        Args:
+            per_minute (float): 每分钟的配额，同时也是桶的容量
+        """
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0  # 每秒补充的数量
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+    
+    def refill(self, now):
+        """按经过的时间补充令牌"""
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+    
+    def wait_time(self, amount):
+        """返回还需要等待多久才有足够的令牌，调用前需要先 refill"""
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+class RateLimiter:
+    """
+    客户端限流器，同时限制每分钟请求数和每分钟token数
+    
+    调用方按到达顺序排队（先到先得），线程和asyncio任务可以共享同一个限流器。
+    收到429时调用 pause 让所有调用方一起等待 Retry-After 指定的时间。
+    """
+    
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        """
+        Args:
+            requests_per_minute (float): 每分钟最多发送的请求数，None表示不限制
+            tokens_per_minute (float): 每分钟最多消耗的token数，None表示不限制
+        """
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._next_ticket = 0  # 下一个到达的调用方拿到的排队号
+        self._serving = 0  # 当前可以获取配额的排队号
+        self._abandoned = set()  # 排队期间被取消的排队号
+        self._paused_until = 0.0  # 收到429后暂停发送直到该时间
+        
+        # 统计信息
+        self.acquired_count = 0
+        self.pause_count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+    
+    def acquire(self, tokens=0):
+        """
+        阻塞当前线程直到可以发送一个请求
+        
+        Args:
+            tokens (int): 本次请求预计消耗的token数
+        
+        Returns:
+            int: 实际预留的token数，请求完成后传给 settle
+        """
+        start = time.monotonic()
+        with self._condition:
+            ticket = self._take_ticket()
+            try:
+                while True:
+                    wait = self._try_acquire(ticket, tokens)
+                    if wait is None:
+                        break
+                    self._condition.wait(wait)
+            except BaseException:
+                self._abandon(ticket)
+                raise
+            reserved = self._finish(ticket, tokens, start)
+        return reserved
+    
+    async def aacquire(self, tokens=0):
+        """acquire 的异步版本，等待期间不会阻塞事件循环"""
+        start = time.monotonic()
+        with self._lock:
+            ticket = self._take_ticket()
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_acquire(ticket, tokens)
+                    if wait is None:
+                        return self._finish(ticket, tokens, start)
+                # 没有轮到自己时无法得知前面的调用方何时完成，只能短暂等待后重试
+                await asyncio.sleep(min(wait, 0.05))
+        except BaseException:
+            with self._lock:
+                self._abandon(ticket)
+            raise
+    
+    def settle(self, reserved, actual):
+        """请求完成后按实际消耗的token数多退少补"""
+        if self.tokens is None or actual is None:
+            return
+        with self._condition:
+            self.tokens.level = min(self.tokens.capacity, self.tokens.level + reserved - actual)
+            self._condition.notify_all()
+    
+    def pause(self, seconds):
+        """收到429时暂停所有调用方，seconds 通常来自 Retry-After"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self.pause_count += 1
+            self._condition.notify_all()
+    
+    def _take_ticket(self):
+        """领取排队号，调用时需要持有锁"""
+        ticket = self._next_ticket
+        self._next_ticket += 1
+        self.max_queue_depth = max(self.max_queue_depth, self._next_ticket - self._serving)
+        return ticket
+    
+    def _try_acquire(self, ticket, tokens):
+        """轮到自己且配额足够时返回None，否则返回建议的等待时间，调用时需要持有锁"""
+        if ticket != self._serving:
+            return 0.05
+        
+        now = time.monotonic()
+        wait = self._paused_until - now
+        for bucket, amount in ((self.requests, 1), (self.tokens, tokens)):
+            if bucket is not None:
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(min(amount, bucket.capacity)))
+        return wait if wait > 0 else None
+    
+    def _finish(self, ticket, tokens, start):
+        """扣除配额并让下一个调用方排到队首，调用时需要持有锁"""
+        reserved = 0
+        if self.requests is not None:
+            self.requests.level -= 1
+        if self.tokens is not None:
+            reserved = min(tokens, self.tokens.capacity)
+            self.tokens.level -= reserved
+        self._advance(ticket)
+        
+        waited = time.monotonic() - start
+        self.acquired_count += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        return reserved
+    
+    def _advance(self, ticket):
+        """让排在 ticket 之后的调用方排到队首，跳过已取消的排队号，调用时需要持有锁"""
+        self._serving = ticket + 1
+        while self._serving in self._abandoned:
+            self._abandoned.remove(self._serving)
+            self._serving += 1
+        self._condition.notify_all()
+    
+    def _abandon(self, ticket):
+        """调用方在排队期间被取消（如任务取消或Ctrl+C），不能让后面的调用方一直等待"""
+        if ticket == self._serving:
+            self._advance(ticket)
+        else:
+            self._abandoned.add(ticket)
+    
+    def stats(self):
+        """返回排队统计，queue_depth 为当前正在排队的调用方数量"""
+        with self._lock:
+            return {
+                "acquired": self.acquired_count,
+                "queue_depth": self._next_ticket - self._serving,
+                "max_queue_depth": self.max_queue_depth,
+                "total_wait": round(self.total_wait, 3),
+                "avg_wait": round(self.total_wait / self.acquired_count, 3) if self.acquired_count else 0.0,
+                "max_wait": round(self.max_wait, 3),
+                "pauses": self.pause_count
+            }
+
+# 进程内共享的限流器，同一个键（通常是API密钥）的所有客户端共用一个
+_registry = {}
+_registry_lock = threading.Lock()
+
+def get_rate_limiter(key, requests_per_minute=None, tokens_per_minute=None):
+    """
+    获取进程内共享的限流器，不存在时按给定的配额创建
+    
+    Args:
+        key (str): 共享限流器的键，使用同一个API密钥的游戏应该传入相同的键
+        requests_per_minute (float): 每分钟最多发送的请求数
+        tokens_per_minute (float): 每分钟最多消耗的token数
+    
+    Returns:
+        RateLimiter: 共享的限流器
+    """
+    with _registry_lock:
+        limiter = _registry.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _registry[key] = limiter
+        return limiter
\ No newline at end of file
@@ -1,9 +1,10 @@
-import os
 from player import Player
 
 class Guard(Player):
     """守卫角色类"""
     
+    STATE_FIELDS = Player.STATE_FIELDS + ("last_protected",)
+    
     def __init__(self, name, llm_client, model_name="gpt-3.5-turbo"):
         super().__init__(name, llm_client, model_name)
         self.set_role("守卫")
@@ -13,14 +14,12 @@ class Guard(Player):
         """
         守卫夜晚行动 - 选择一名玩家进行守护
         """
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
+        prompt_template = self._get_prompt_template(prompt_template_path)
         
         if prompt_template:
             # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
+            public_memory = self.get_public_memory_text()
+            private_memory = self.get_private_memory_text()
             
             # 筛选可守护的玩家，不能连续两晚守护同一个人
             protectable_players = [player for player in living_players if player != self.last_protected]
@@ -31,7 +30,8 @@ class Guard(Player):
                 return None
             
             # 生成提示，让守卫选择守护目标
-            prompt = prompt_template.format(
+            prompt = self._format_prompt(
+                prompt_template,
                 player_name=self.name,
                 role=self.role,
                 game_state=game_state,
@@ -42,15 +42,8 @@ class Guard(Player):
                 last_protected=self.last_protected if self.last_protected else "无"
             )
             
-            # 请求模型回应选择守护目标
-            target_response = self.llm_client.chat(prompt)
-            
-            # 提取模型回应中的目标玩家名称
-            target_player = None
-            for player in protectable_players:
-                if player in target_response:
-                    target_player = player
-                    break
+            # 请求模型选择守护目标
+            target_player = self._choose_target(prompt, protectable_players, "今晚守护该玩家")
             
             # 如果成功提取到目标玩家，记录守护行动
             if target_player:
@@ -1,9 +1,10 @@
-import os
 from player import Player
 
 class Hunter(Player):
     """猎人角色类"""
     
+    STATE_FIELDS = Player.STATE_FIELDS + ("can_shoot", "is_dying")
+    
     def __init__(self, name, llm_client, model_name="gpt-3.5-turbo"):
         super().__init__(name, llm_client, model_name)
         self.set_role("猎人")
@@ -15,30 +16,8 @@ class Hunter(Player):
         猎人夜晚行动 - 猎人在夜晚没有特殊行动
         但我们添加一些思考分析
         """
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
-        
-        if prompt_template:
-            # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
-            
-            # 生成提示，让猎人在夜晚进行思考
-            prompt = prompt_template.format(
-                player_name=self.name,
-                role=self.role,
-                game_state=game_state,
-                public_memory=public_memory,
-                private_memory=private_memory,
-                living_players=", ".join(living_players)
-            )
-            
-            # 请求模型回应进行思考，但不会实际执行任何行动
-            thinking_response = self.llm_client.chat(prompt)
-            
-            # 将思考内容添加到私有记忆
-            self.add_private_memory(f"夜晚思考: {thinking_response}")
+        # 思考内容只写入私有记忆，不会实际执行任何行动
+        self.reflect(game_state, living_players, prompt_template_path)
         
         # 猎人没有夜晚行动，返回None
         return None
@@ -51,14 +30,12 @@ class Hunter(Player):
         if not self.can_shoot or not self.is_dying:
             return None
         
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
+        prompt_template = self._get_prompt_template(prompt_template_path)
         
         if prompt_template:
             # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
+            public_memory = self.get_public_memory_text()
+            private_memory = self.get_private_memory_text()
             
             # 从living_players中移除自己，只能射击其他玩家
             target_options = [player for player in living_players if player != self.name]
@@ -69,7 +46,8 @@ class Hunter(Player):
                 return None
             
             # 生成提示，让猎人选择射击目标
-            prompt = prompt_template.format(
+            prompt = self._format_prompt(
+                prompt_template,
                 player_name=self.name,
                 role=self.role,
                 public_memory=public_memory,
@@ -78,15 +56,8 @@ class Hunter(Player):
                 target_options=", ".join(target_options)
             )
             
-            # 请求模型回应选择射击目标
-            target_response = self.llm_client.chat(prompt)
-            
-            # 提取模型回应中的目标玩家名称
-            target_player = None
-            for player in target_options:
-                if player in target_response:
-                    target_player = player
-                    break
+            # 请求模型选择射击目标
+            target_player = self._choose_target(prompt, target_options, "开枪带走该玩家")
             
             # 如果成功提取到目标玩家，记录射击行动
             if target_player:
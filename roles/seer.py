@@ -1,9 +1,10 @@
-import os
 from player import Player
 
 class Seer(Player):
     """预言家角色类"""
     
+    STATE_FIELDS = Player.STATE_FIELDS + ("checked_players",)
+    
     def __init__(self, name, llm_client, model_name="gpt-3.5-turbo"):
         super().__init__(name, llm_client, model_name)
         self.set_role("预言家")
@@ -13,14 +14,12 @@ class Seer(Player):
         """
         预言家夜晚行动 - 查验一名玩家的身份
         """
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
+        prompt_template = self._get_prompt_template(prompt_template_path)
         
         if prompt_template and roles_dict:
             # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
+            public_memory = self.get_public_memory_text()
+            private_memory = self.get_private_memory_text()
             
             # 构建已查验玩家信息
             checked_info = ""
@@ -36,7 +35,8 @@ class Seer(Player):
                 return None
             
             # 生成提示，让预言家选择查验目标
-            prompt = prompt_template.format(
+            prompt = self._format_prompt(
+                prompt_template,
                 player_name=self.name,
                 role=self.role,
                 game_state=game_state,
@@ -47,15 +47,8 @@ class Seer(Player):
                 unchecked_players=", ".join(unchecked_players)
             )
             
-            # 请求模型回应选择查验目标
-            target_response = self.llm_client.chat(prompt)
-            
-            # 提取模型回应中的目标玩家名称
-            target_player = None
-            for player in unchecked_players:
-                if player in target_response:
-                    target_player = player
-                    break
+            # 请求模型选择查验目标
+            target_player = self._choose_target(prompt, unchecked_players, "查验该玩家的身份")
             
             # 如果成功提取到目标玩家，进行查验并记录结果
             if target_player and target_player in roles_dict:
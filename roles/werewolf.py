@@ -1,4 +1,3 @@
-import os
 from player import Player
 
 class Werewolf(Player):
@@ -12,14 +11,30 @@ class Werewolf(Player):
         """
         狼人夜晚行动 - 选择一名玩家进行袭击
         """
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
+        target_player = self.propose_target(game_state, living_players, prompt_template_path)
+        
+        # 如果成功提取到目标玩家，记录行动
+        if target_player:
+            action_info = f"决定袭击 {target_player}"
+            self.add_private_memory(f"夜晚行动: {action_info}")
+            return target_player
+        
+        # 如果未能成功执行操作，返回None
+        return None
+    
+    def propose_target(self, game_state, living_players, prompt_template_path):
+        """
+        选择一名想要袭击的玩家，不记录行动，狼队共同决策时作为自己的提议
+        
+        Returns:
+            str: 目标玩家，模板不存在或无法解析出合法目标时返回None
+        """
+        prompt_template = self._get_prompt_template(prompt_template_path)
         
         if prompt_template:
             # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
+            public_memory = self.get_public_memory_text()
+            private_memory = self.get_private_memory_text()
             
             # 从living_players中移除自己和其他狼人，只能袭击非狼人玩家
             target_options = living_players.copy()
@@ -30,7 +45,8 @@ class Werewolf(Player):
                 return None
             
             # 生成提示，让狼人选择袭击目标
-            prompt = prompt_template.format(
+            prompt = self._format_prompt(
+                prompt_template,
                 player_name=self.name,
                 role=self.role,
                 game_state=game_state,
@@ -40,21 +56,34 @@ class Werewolf(Player):
                 target_options=", ".join(target_options)
             )
             
-            # 请求模型回应选择袭击目标
-            target_response = self.llm_client.chat(prompt)
-            
-            # 提取模型回应中的目标玩家名称
-            target_player = None
-            for player in target_options:
-                if player in target_response and player != self.name:
-                    target_player = player
-                    break
-            
-            # 如果成功提取到目标玩家，记录行动
-            if target_player:
-                action_info = f"决定袭击 {target_player}"
-                self.add_private_memory(f"夜晚行动: {action_info}")
-                return target_player
+            # 请求模型选择袭击目标
+            return self._choose_target(prompt, [p for p in target_options if p != self.name], "今晚袭击该玩家")
         
-        # 如果未能成功执行操作，返回None
-        return None
\ No newline at end of file
+        return None
+    
+    def decide_pack_target(self, game_state, living_players, proposals, prompt_template_path):
+        """
+        根据所有狼人的提议做出狼队的最终决定，提示只包含提议和自己的私有信息，不包含公共记录
+        
+        Args:
+            proposals (dict): 键为狼人名称，值为该狼人提议的目标
+        
+        Returns:
+            str: 从被提议的目标中选出的玩家，模板不存在或无法解析出合法目标时返回None
+        """
+        prompt_template = self._get_prompt_template(prompt_template_path)
+        if not prompt_template:
+            return None
+        
+        target_options = list(dict.fromkeys(target for target in proposals.values() if target))
+        prompt = self._format_prompt(
+            prompt_template,
+            player_name=self.name,
+            role=self.role,
+            game_state=game_state,
+            private_memory=self.get_private_memory_text(),
+            living_players=", ".join(living_players),
+            proposals="\n".join(f"{wolf} 提议袭击 {target or '（没有提议）'}" for wolf, target in proposals.items()),
+            target_options=", ".join(target_options)
+        )
+        return self._choose_target(prompt, target_options, "狼队今晚袭击该玩家")
\ No newline at end of file
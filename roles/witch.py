@@ -1,9 +1,10 @@
-import os
 from player import Player
 
 class Witch(Player):
     """女巫角色类"""
     
+    STATE_FIELDS = Player.STATE_FIELDS + ("poison_potion", "save_potion")
+    
     def __init__(self, name, llm_client, model_name="gpt-3.5-turbo"):
         super().__init__(name, llm_client, model_name)
         self.set_role("女巫")
@@ -14,14 +15,12 @@ class Witch(Player):
         """
         女巫夜晚行动 - 可以选择使用解药救人或使用毒药杀人
         """
-        current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        template_path = os.path.join(current_dir, prompt_template_path)
-        prompt_template = self._read_file(template_path)
+        prompt_template = self._get_prompt_template(prompt_template_path)
         
         if prompt_template:
             # 提取玩家相关信息
-            public_memory = "\n".join(self.get_public_memory())
-            private_memory = "\n".join(self.get_private_memory())
+            public_memory = self.get_public_memory_text()
+            private_memory = self.get_private_memory_text()
             
             # 构建女巫可用药剂信息
             potion_info = f"解药: {'可用' if self.save_potion > 0 else '已用完'}, 毒药: {'可用' if self.poison_potion > 0 else '已用完'}"
@@ -30,7 +29,8 @@ class Witch(Player):
             victim_info = f"今晚的受害者是: {victim}" if victim else "今晚没有人被狼人袭击"
             
             # 生成提示，让女巫决定是否使用药剂
-            prompt = prompt_template.format(
+            prompt = self._format_prompt(
+                prompt_template,
                 player_name=self.name,
                 role=self.role,
                 game_state=game_state,
@@ -41,36 +41,58 @@ class Witch(Player):
                 victim_info=victim_info
             )
             
-            # 请求模型回应决定使用哪种药剂
-            action_response = self.llm_client.chat(prompt)
-            
-            # 解析女巫的行动
-            action = None
-            target = None
+            # 请求模型决定使用哪种药剂，action 为 "save"、"poison" 或None
+            if self.structured_decisions:
+                action, target = self._decide_potion(prompt, living_players, victim)
+            else:
+                action_response = self.llm_client.chat(prompt)
+                action, target = self._parse_potion_response(action_response, living_players, victim)
             
-            # 检查是否使用解药
-            if "使用解药" in action_response and self.save_potion > 0 and victim:
+            # 使用解药
+            if action == "save":
                 self.save_potion -= 1
-                action = "解药"
-                target = victim
-                self.add_private_memory(f"夜晚行动: 使用解药救了 {victim}")
-                return ("save", victim)
+                self.add_private_memory(f"夜晚行动: 使用解药救了 {target}")
+                return ("save", target)
             
-            # 检查是否使用毒药
-            elif "使用毒药" in action_response and self.poison_potion > 0:
-                # 从回应中提取目标玩家
-                for player in living_players:
-                    # 避免毒害自己
-                    if player != self.name and player in action_response:
-                        self.poison_potion -= 1
-                        action = "毒药"
-                        target = player
-                        self.add_private_memory(f"夜晚行动: 使用毒药毒死了 {player}")
-                        return ("poison", player)
+            # 使用毒药
+            if action == "poison":
+                self.poison_potion -= 1
+                self.add_private_memory(f"夜晚行动: 使用毒药毒死了 {target}")
+                return ("poison", target)
             
             # 如果女巫选择不使用任何药剂
-            if action is None:
-                self.add_private_memory("夜晚行动: 决定不使用任何药剂")
+            self.add_private_memory("夜晚行动: 决定不使用任何药剂")
         
         # 如果未能成功执行操作，返回None
-        return None
\ No newline at end of file
+        return None
+    
+    def _parse_potion_response(self, action_response, living_players, victim):
+        """从自由文本回应中解析女巫的行动，返回 (行动, 目标)"""
+        # 检查是否使用解药
+        if "使用解药" in action_response and self.save_potion > 0 and victim:
+            return "save", victim
+        
+        # 检查是否使用毒药
+        if "使用毒药" in action_response and self.poison_potion > 0:
+            # 从回应中提取目标玩家，避免毒害自己
+            player = self._match_target(action_response, [p for p in living_players if p != self.name])
+            if player:
+                return "poison", player
+        
+        return None, None
+    
+    def _decide_potion(self, prompt, living_players, victim):
+        """结构化决策模式下请求女巫的行动，只提供当前可用的药剂，返回 (行动, 目标)"""
+        actions = []
+        if self.save_potion > 0 and victim:
+            actions.append(("save", "使用解药救活今晚的受害者", None))
+        if self.poison_potion > 0:
+            actions.append(("poison", "使用毒药毒死该玩家", [p for p in living_players if p != self.name]))
+        actions.append(("none", "不使用任何药剂", None))
+        
+        decision = self.llm_client.decide(prompt, actions)
+        if not decision or decision["action"] == "none":
+            return None, None
+        if decision["action"] == "save":
+            return "save", victim
+        return "poison", decision["target"]
\ No newline at end of file
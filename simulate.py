@@ -0,0 +1,366 @@
+import os
+import sys
+import json
+import time
+import random
+import signal
+import argparse
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from game import WerewolfGame
+from llm_backends import MockBackend
+from events import NullSink
+from rate_limiter import get_rate_limiter
+from config import DEFAULT_CONFIG_PATH, load_config
+
+# 默认9人局角色配置，与 main.setup_game 相同
+DEFAULT_ROLES = ["werewolf", "werewolf", "werewolf", "villager", "seer", "witch", "hunter", "guard", "idiot"]
+
+def build_role_setup(roles, seed, shuffle=False):
+    """
+    生成一局游戏的座位和角色
+    
+    Args:
+        roles (list): 角色列表
+        seed (int): 本局的随机种子，shuffle为True时用于打乱座位
+        shuffle (bool): 是否随机分配角色到座位
+    
+    Returns:
+        list: (玩家名称, 角色) 列表
+    """
+    roles = list(roles)
+    if shuffle:
+        random.Random(seed).shuffle(roles)
+    return [(f"玩家{i + 1}", role) for i, role in enumerate(roles)]
+
+def new_result(game_index, seed, role_setup, error=None):
+    """返回一局尚未运行的对局结果，各项统计为0"""
+    return {
+        "game_index": game_index,
+        "seed": seed,
+        "roles": dict(role_setup),
+        "models": {},
+        "winner": None,
+        "days": 0,
+        "deaths": [],
+        "calls": 0,
+        "cache_hits": 0,
+        "failures": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "llm_latency": 0.0,
+        "parse_failures": 0,
+        "rate_limited": 0,
+        "repairs": 0,
+        "invalid_decisions": 0,
+        "reflection": None,
+        "elapsed": 0.0,
+        "error": error
+    }
+
+def run_single_game(game_index, seed, role_setup, options, player_models=None):
+    """
+    在工作进程中运行一局完整的游戏，返回对局结果
+    
+    Args:
+        game_index (int): 对局序号
+        seed (int): 本局的随机种子
+        role_setup (list): (玩家名称, 角色) 列表
+        options (dict): 游戏和后端选项
+        player_models (dict): 键为玩家名称，值为该玩家使用的模型，未指定的玩家使用 options["model"]
+    
+    Returns:
+        dict: 对局结果
+    """
+    result = new_result(game_index, seed, role_setup)
+    
+    start_time = time.time()
+    game = None
+    # 批量模拟时不输出游戏过程
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            backend = None
+            if options["backend"] == "mock":
+                backend = MockBackend(seed=seed, latency=options["mock_latency"],
+                                      invalid_rate=options.get("mock_invalid_rate", 0.0))
+            
+            game = WerewolfGame(
+                options.get("api_key"),
+                options["model"],
+                parallel_voting=options["parallel_voting"],
+                concurrent_night=options["concurrent_night"],
+                concurrent_speech=options.get("concurrent_speech", False),
+                backend=backend,
+                max_rounds=options["max_rounds"],
+                event_sink=NullSink(),  # 结果只需要汇总信息，不生成游戏事件
+                structured_decisions=options.get("structured_decisions", False),
+                seed=seed,
+                llm_options=options.get("llm_options"),
+                reflection=options.get("reflection", "each"),
+                reflection_interval=options.get("reflection_interval", 1),
+                prompt_layout=options.get("prompt_layout", "inline"),
+                wolf_decision=options.get("wolf_decision", "leader")
+            )
+            player_models = player_models or {}
+            for name, role in role_setup:
+                game.add_player(name, role, player_models.get(name))
+            
+            # 同一个工作进程中使用同一个模型的对局共享一个限流器，服务端的配额按模型分别计算
+            if options.get("rpm") or options.get("tpm"):
+                for model_name in game.llm_clients:
+                    rate_limiter = get_rate_limiter(f"simulate:{model_name}", options.get("rpm"), options.get("tpm"))
+                    game.set_rate_limiter(rate_limiter, model_name)
+            game.start_game()
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+    
+    if game is not None:
+        call_stats = game.get_call_stats()
+        totals = game.metrics.summary()["total"]
+        result.update({
+            "winner": game.winner,
+            "models": dict(game.player_models),
+            "days": game.day_count,
+            "deaths": game.deaths,
+            "calls": call_stats["calls"],
+            "cache_hits": call_stats["cache_hits"],
+            "failures": call_stats["failures"],
+            "prompt_tokens": totals.get("prompt_tokens", 0),
+            "completion_tokens": totals.get("completion_tokens", 0),
+            "cached_tokens": totals.get("cached_tokens", 0),
+            "llm_latency": totals.get("latency", 0.0),
+            "parse_failures": game.name_matcher.stats()["failures"] if game.name_matcher else 0,
+            "rate_limited": call_stats["rate_limited"],
+            "repairs": call_stats["repairs"],
+            "invalid_decisions": call_stats["invalid_decisions"],
+            "reflection": game.get_reflection_report()["total"]
+        })
+    result["elapsed"] = round(time.time() - start_time, 4)
+    return result
+
+def _ignore_sigint():
+    """工作进程忽略Ctrl+C，由主进程统一处理取消"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def _raise_keyboard_interrupt(signum, frame):
+    """把SIGTERM转换为KeyboardInterrupt，走同样的取消流程"""
+    raise KeyboardInterrupt
+
+def run_games(tasks, output_path, workers=None, options=None, on_result=None):
+    """
+    使用进程池并行运行给定的对局，每完成一局就把结果写入JSONL文件
+    
+    Args:
+        tasks (list): 每项为 (对局序号, 种子, 座位和角色, 玩家模型)，玩家模型可以为None
+        output_path (str): 结果文件路径，每行一局的JSON结果
+        workers (int): 工作进程数量，None表示使用CPU核数
+        options (dict): 传给 run_single_game 的游戏和后端选项
+        on_result (callable): 每完成一局就以对局结果调用一次，可以在写入文件前向结果中添加字段
+    
+    Returns:
+        dict: 汇总信息，包括完成的局数、是否被取消以及各阵营胜场
+    """
+    summary = {"completed": 0, "errors": 0, "cancelled": False, "winners": {}}
+    
+    def _write_result(f, result):
+        if on_result is not None:
+            on_result(result)
+        f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        f.flush()
+        
+        summary["completed"] += 1
+        if result["error"]:
+            summary["errors"] += 1
+        winner = result["winner"] or "平局"
+        summary["winners"][winner] = summary["winners"].get(winner, 0) + 1
+    
+    directory = os.path.dirname(os.path.abspath(output_path))
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    
+    previous_sigterm = signal.signal(signal.SIGTERM, _raise_keyboard_interrupt)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_ignore_sigint)
+    try:
+        with open(output_path, "a", encoding="utf-8") as f:
+            futures = {}
+            for game_index, seed, role_setup, player_models in tasks:
+                future = executor.submit(run_single_game, game_index, seed, role_setup, options, player_models)
+                futures[future] = (game_index, seed, role_setup)
+            
+            try:
+                written = set()
+                for future in as_completed(futures):
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        # 工作进程异常退出（如内存不足）后进程池不能再使用，已完成的对局照常写入，其余对局记为出错
+                        for other, (game_index, seed, role_setup) in futures.items():
+                            if other in written:
+                                continue
+                            if other.done() and not other.cancelled() and other.exception() is None:
+                                _write_result(f, other.result())
+                            else:
+                                _write_result(f, new_result(game_index, seed, role_setup, f"{type(e).__name__}: {e}"))
+                        break
+                    written.add(future)
+                    _write_result(f, result)
+            except KeyboardInterrupt:
+                # 取消尚未开始的对局，已开始的对局不再等待
+                summary["cancelled"] = True
+                for future in futures:
+                    future.cancel()
+    finally:
+        executor.shutdown(wait=not summary["cancelled"], cancel_futures=True)
+        signal.signal(signal.SIGTERM, previous_sigterm)
+    
+    return summary
+
+def simulate(games, output_path, workers=None, base_seed=0, roles=None, shuffle_roles=False, options=None):
+    """
+    使用进程池并行运行多局独立的游戏，每完成一局就把结果写入JSONL文件
+    
+    Args:
+        games (int): 对局数量
+        output_path (str): 结果文件路径，每行一局的JSON结果
+        workers (int): 工作进程数量，None表示使用CPU核数
+        base_seed (int): 第i局使用 base_seed + i 作为随机种子
+        roles (list): 角色列表，默认使用 DEFAULT_ROLES
+        shuffle_roles (bool): 是否每局随机分配座位
+        options (dict): 传给 run_single_game 的游戏和后端选项
+    
+    Returns:
+        dict: 汇总信息，包括完成的局数、是否被取消以及各阵营胜场
+    """
+    roles = roles or DEFAULT_ROLES
+    tasks = []
+    for game_index in range(games):
+        seed = base_seed + game_index
+        tasks.append((game_index, seed, build_role_setup(roles, seed, shuffle_roles), None))
+    return run_games(tasks, output_path, workers, options)
+
+def ensure_prompt_templates():
+    """工作进程从 prompts 目录读取模板，只创建缺失的模板，不覆盖已有的模板"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        WerewolfGame(backend=MockBackend()).create_default_prompt_templates(overwrite=False)
+
+def simulate_config(config, args, options):
+    """按配置文件模拟，sweeps 中的每种组合依次模拟 args.games 局，结果中的 setup 字段为组合名称"""
+    variants, skipped = config.expand_sweeps()
+    for label, error in skipped:
+        print(f"跳过不合法的组合 {label}: {'; '.join(error.errors)}", file=sys.stderr)
+    
+    cancelled = False
+    for label, variant in variants:
+        variant_options = dict(options, llm_options=variant.llm_options())
+        if variant.max_rounds is not None:
+            variant_options["max_rounds"] = variant.max_rounds
+        if variant.model:
+            variant_options["model"] = variant.model
+        
+        tasks = []
+        for game_index in range(args.games):
+            seed = args.seed + game_index
+            setup = variant.role_setup(seed)
+            tasks.append((game_index, seed, [(name, role) for name, role, _ in setup],
+                          {name: model for name, _, model in setup if model}))
+        
+        start_time = time.time()
+        summary = run_games(tasks, args.output, args.workers, variant_options,
+                            on_result=lambda result, label=label: result.update(setup=label))
+        elapsed = time.time() - start_time
+        
+        status = "已取消" if summary["cancelled"] else "完成"
+        print(
+            f"[{label}] {status}: {summary['completed']}/{args.games} 局，错误 {summary['errors']} 局，"
+            f"耗时 {elapsed:.1f} 秒，胜场 {summary['winners']}",
+            file=sys.stderr
+        )
+        if summary["cancelled"]:
+            cancelled = True
+            break
+    return 130 if cancelled else 0
+
+def main():
+    """批量模拟入口"""
+    parser = argparse.ArgumentParser(description='狼人杀批量模拟')
+    parser.add_argument('--games', type=int, default=100, help='模拟的对局数量')
+    parser.add_argument('--output', default=os.path.join('game_records', 'simulations.jsonl'), help='结果JSONL文件路径')
+    parser.add_argument('--workers', type=int, help='工作进程数量，默认为CPU核数')
+    parser.add_argument('--seed', type=int, default=0, help='起始随机种子，第i局使用 seed + i')
+    parser.add_argument('--roles', help='逗号分隔的角色列表，默认为9人局配置')
+    parser.add_argument('--shuffle-roles', action='store_true', help='每局随机分配座位')
+    parser.add_argument('--backend', choices=['mock', 'openai'], default='mock', help='模型后端，默认为离线模拟后端')
+    parser.add_argument('--api-key', help='OpenAI API密钥，使用openai后端时需要')
+    parser.add_argument('--model', default='gpt-3.5-turbo', help='使用的模型名称')
+    parser.add_argument('--mock-latency', type=float, default=0.0, help='模拟后端每次请求的延迟，单位秒')
+    parser.add_argument('--mock-invalid-rate', type=float, default=0.0, help='模拟后端结构化决策首次回答不合法的概率')
+    parser.add_argument('--structured-decisions', action='store_true', help='投票和夜晚行动使用JSON格式的结构化决策')
+    parser.add_argument('--rpm', type=float, help='每个模型所有工作进程合计每分钟最多发送的请求数')
+    parser.add_argument('--tpm', type=float, help='每个模型所有工作进程合计每分钟最多消耗的token数')
+    parser.add_argument('--max-rounds', type=int, default=20, help='每局的最大天数')
+    parser.add_argument('--parallel-voting', action='store_true', help='同时收集所有玩家的投票')
+    parser.add_argument('--concurrent-night', action='store_true', help='夜晚互不依赖的角色行动并发执行')
+    parser.add_argument('--concurrent-speech', action='store_true', help='白天所有玩家基于同一份游戏记录同时发言')
+    parser.add_argument('--reflection', choices=WerewolfGame.REFLECTION_POLICIES, default='each',
+                        help='村民、猎人和白痴的夜晚思考：每人一次请求(each)、同一模型合并为一次请求(batched)或不思考(off)')
+    parser.add_argument('--reflection-interval', type=int, default=1, metavar='N', help='每隔N个夜晚思考一次')
+    parser.add_argument('--prompt-layout', choices=WerewolfGame.PROMPT_LAYOUTS, default='inline',
+                        help='提示布局：每个提示一条消息(inline)，或固定说明和共享的游戏记录在前、每次调用不同的内容在后，使请求可以命中前缀缓存(prefix)')
+    parser.add_argument('--wolf-decision', choices=WerewolfGame.WOLF_DECISIONS, default='leader',
+                        help='狼人的夜晚决策：随机一名狼人独自决定(leader)，所有狼人同时提议后按票数决定(vote)，或提议不一致时由一名狼人综合所有提议再决定一次(aggregate)')
+    parser.add_argument('--config', nargs='?', const=DEFAULT_CONFIG_PATH, metavar='PATH',
+                        help='按配置文件设置角色、玩家模型、最大天数和请求参数，配置中的 sweeps 的每种组合各模拟 --games 局')
+    args = parser.parse_args()
+    
+    workers = args.workers or os.cpu_count() or 1
+    options = {
+        "backend": args.backend,
+        "api_key": args.api_key or os.environ.get("OPENAI_API_KEY"),
+        "model": args.model,
+        "mock_latency": args.mock_latency,
+        "mock_invalid_rate": args.mock_invalid_rate,
+        "structured_decisions": args.structured_decisions,
+        # 每个工作进程有自己的限流器，总配额平均分给各个进程
+        "rpm": args.rpm / workers if args.rpm else None,
+        "tpm": args.tpm / workers if args.tpm else None,
+        "max_rounds": args.max_rounds,
+        "parallel_voting": args.parallel_voting,
+        "concurrent_night": args.concurrent_night,
+        "concurrent_speech": args.concurrent_speech,
+        "reflection": args.reflection,
+        "reflection_interval": args.reflection_interval,
+        "prompt_layout": args.prompt_layout,
+        "wolf_decision": args.wolf_decision
+    }
+    if args.backend == "openai" and not options["api_key"]:
+        print("错误：使用openai后端需要--api-key参数或OPENAI_API_KEY环境变量", file=sys.stderr)
+        return 1
+    
+    ensure_prompt_templates()
+    
+    if args.config:
+        try:
+            config = load_config(args.config)
+        except (OSError, ValueError) as e:
+            print(f"错误：{e}", file=sys.stderr)
+            return 1
+        return simulate_config(config, args, options)
+    
+    roles = [role.strip() for role in args.roles.split(",")] if args.roles else None
+    start_time = time.time()
+    summary = simulate(args.games, args.output, args.workers, args.seed, roles, args.shuffle_roles, options)
+    elapsed = time.time() - start_time
+    
+    status = "已取消" if summary["cancelled"] else "完成"
+    print(
+        f"{status}: {summary['completed']}/{args.games} 局，错误 {summary['errors']} 局，"
+        f"耗时 {elapsed:.1f} 秒，胜场 {summary['winners']}",
+        file=sys.stderr
+    )
+    return 130 if summary["cancelled"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
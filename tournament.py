@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+
+from game import WerewolfGame
+from simulate import DEFAULT_ROLES, build_role_setup, run_games, ensure_prompt_templates
+from config import DEFAULT_CONFIG_PATH, load_config
+
+WEREWOLF_FACTION = "狼人阵营"
+GOOD_FACTION = "好人阵营"
+
+class EloRatings:
+    """
+    模型的Elo评分，每局游戏视为狼人阵营的模型与好人阵营的模型之间的一场对局
+    
+    平局（达到最大天数）双方各得0.5分。评分与对局的处理顺序有关，应按对局序号依次更新。
+    """
+    
+    def __init__(self, models, k_factor=32, initial_rating=1500):
+        """
+        Args:
+            models (list): 参赛的模型名称
+            k_factor (float): 每局评分变化的最大值
+            initial_rating (float): 初始评分
+        """
+        self.k_factor = k_factor
+        self.ratings = {model: float(initial_rating) for model in models}
+        self.records = {model: {"games": 0, "wins": 0, "losses": 0, "draws": 0,
+                                "werewolf_wins": 0, "good_wins": 0} for model in models}
+    
+    def expected(self, model, opponent):
+        """返回 model 对 opponent 的期望得分"""
+        return 1 / (1 + 10 ** ((self.ratings[opponent] - self.ratings[model]) / 400))
+    
+    def update(self, werewolf_model, good_model, winner):
+        """
+        按一局的结果更新双方评分
+        
+        Args:
+            werewolf_model (str): 狼人阵营使用的模型
+            good_model (str): 好人阵营使用的模型
+            winner (str): 胜利阵营，None表示平局
+        """
+        if winner == WEREWOLF_FACTION:
+            score = 1.0
+        elif winner == GOOD_FACTION:
+            score = 0.0
+        else:
+            score = 0.5
+        
+        expected = self.expected(werewolf_model, good_model)
+        change = self.k_factor * (score - expected)
+        self.ratings[werewolf_model] += change
+        self.ratings[good_model] -= change
+        
+        for model, model_score, faction_key in ((werewolf_model, score, "werewolf_wins"),
+                                                (good_model, 1 - score, "good_wins")):
+            record = self.records[model]
+            record["games"] += 1
+            if model_score == 1.0:
+                record["wins"] += 1
+                record[faction_key] += 1
+            elif model_score == 0.0:
+                record["losses"] += 1
+            else:
+                record["draws"] += 1
+    
+    def table(self):
+        """返回按评分从高到低排列的评分表"""
+        return [
+            {"model": model, "rating": round(rating, 1), **self.records[model]}
+            for model, rating in sorted(self.ratings.items(), key=lambda item: item[1], reverse=True)
+        ]
+
+def build_matchups(models, games_per_matchup, base_seed=0, roles=None):
+    """
+    生成循环赛的所有对局：每两个模型互换阵营各进行 games_per_matchup 局，每局随机分配座位
+    
+    同一阵营的所有玩家使用同一个模型，狼人阵营的模型控制所有狼人，另一个模型控制其余玩家。
+    
+    Returns:
+        list: 每项为 (对局序号, 种子, 座位和角色, 玩家模型, 狼人阵营模型, 好人阵营模型)
+    """
+    roles = roles or DEFAULT_ROLES
+    matchups = []
+    for werewolf_model, good_model in itertools.permutations(models, 2):
+        for _ in range(games_per_matchup):
+            game_index = len(matchups)
+            seed = base_seed + game_index
+            role_setup = build_role_setup(roles, seed, shuffle=True)
+            player_models = {
+                name: werewolf_model if role == "werewolf" else good_model
+                for name, role in role_setup
+            }
+            matchups.append((game_index, seed, role_setup, player_models, werewolf_model, good_model))
+    return matchups
+
+def run_tournament(models, games_per_matchup, output_path, workers=None, base_seed=0, roles=None, options=None,
+                   k_factor=32, initial_rating=1500):
+    """
+    运行循环赛并计算每个模型的Elo评分，对局结果逐行写入JSONL文件
+    
+    Args:
+        models (list): 参赛的模型名称，至少两个
+        games_per_matchup (int): 每两个模型在每种阵营分配下的对局数
+        output_path (str): 对局结果文件路径
+        workers (int): 工作进程数量，None表示使用CPU核数
+        base_seed (int): 第i局使用 base_seed + i 作为随机种子
+        roles (list): 角色列表，默认使用 DEFAULT_ROLES
+        options (dict): 传给 simulate.run_single_game 的游戏和后端选项
+        k_factor (float): Elo评分每局变化的最大值
+        initial_rating (float): 初始评分
+    
+    Returns:
+        dict: summary 为 simulate.run_games 的汇总信息，ratings 为评分表
+    """
+    matchups = build_matchups(models, games_per_matchup, base_seed, roles)
+    factions = {game_index: (werewolf_model, good_model)
+                for game_index, _, _, _, werewolf_model, good_model in matchups}
+    
+    results = []
+    tasks = [(game_index, seed, role_setup, player_models)
+             for game_index, seed, role_setup, player_models, _, _ in matchups]
+    summary = run_games(tasks, output_path, workers, options, on_result=results.append)
+    
+    # 对局完成的顺序不固定，按对局序号更新评分使结果可以复现，出错的对局不计入评分
+    ratings = EloRatings(models, k_factor, initial_rating)
+    for result in sorted(results, key=lambda result: result["game_index"]):
+        if result["error"]:
+            continue
+        werewolf_model, good_model = factions[result["game_index"]]
+        ratings.update(werewolf_model, good_model, result["winner"])
+    return {"summary": summary, "ratings": ratings.table()}
+
+def load_available_models(path=DEFAULT_CONFIG_PATH):
+    """读取配置文件中 llm_settings.available_models 列出的模型，文件不存在时返回空列表"""
+    if not os.path.exists(path):
+        return []
+    return list(load_config(path).available_models)
+
+def main():
+    """循环赛入口"""
+    parser = argparse.ArgumentParser(description='狼人杀模型循环赛')
+    parser.add_argument('--models', help='逗号分隔的参赛模型，默认使用 game_config.json 中的 available_models')
+    parser.add_argument('--games-per-matchup', type=int, default=10, help='每两个模型在每种阵营分配下的对局数')
+    parser.add_argument('--output', default=os.path.join('game_records', 'tournament.jsonl'), help='对局结果JSONL文件路径')
+    parser.add_argument('--ratings', metavar='PATH', help='把评分表以JSON格式写入该文件')
+    parser.add_argument('--workers', type=int, help='工作进程数量，默认为CPU核数')
+    parser.add_argument('--seed', type=int, default=0, help='起始随机种子，第i局使用 seed + i')
+    parser.add_argument('--roles', help='逗号分隔的角色列表，默认为9人局配置')
+    parser.add_argument('--backend', choices=['mock', 'openai'], default='mock', help='模型后端，默认为离线模拟后端')
+    parser.add_argument('--api-key', help='OpenAI API密钥，使用openai后端时需要')
+    parser.add_argument('--mock-latency', type=float, default=0.0, help='模拟后端每次请求的延迟，单位秒')
+    parser.add_argument('--structured-decisions', action='store_true', help='投票和夜晚行动使用JSON格式的结构化决策')
+    parser.add_argument('--rpm', type=float, help='每个模型所有工作进程合计每分钟最多发送的请求数')
+    parser.add_argument('--tpm', type=float, help='每个模型所有工作进程合计每分钟最多消耗的token数')
+    parser.add_argument('--max-rounds', type=int, default=20, help='每局的最大天数')
+    parser.add_argument('--parallel-voting', action='store_true', help='同时收集所有玩家的投票')
+    parser.add_argument('--concurrent-night', action='store_true', help='夜晚互不依赖的角色行动并发执行')
+    parser.add_argument('--concurrent-speech', action='store_true', help='白天所有玩家基于同一份游戏记录同时发言')
+    parser.add_argument('--reflection', choices=WerewolfGame.REFLECTION_POLICIES, default='each',
+                        help='村民、猎人和白痴的夜晚思考：每人一次请求(each)、同一模型合并为一次请求(batched)或不思考(off)')
+    parser.add_argument('--reflection-interval', type=int, default=1, metavar='N', help='每隔N个夜晚思考一次')
+    parser.add_argument('--prompt-layout', choices=WerewolfGame.PROMPT_LAYOUTS, default='inline',
+                        help='提示布局：每个提示一条消息(inline)，或固定说明和共享的游戏记录在前、每次调用不同的内容在后，使请求可以命中前缀缓存(prefix)')
+    parser.add_argument('--wolf-decision', choices=WerewolfGame.WOLF_DECISIONS, default='leader',
+                        help='狼人的夜晚决策：随机一名狼人独自决定(leader)，所有狼人同时提议后按票数决定(vote)，或提议不一致时由一名狼人综合所有提议再决定一次(aggregate)')
+    parser.add_argument('--k-factor', type=float, default=32, help='Elo评分每局变化的最大值')
+    args = parser.parse_args()
+    
+    try:
+        models = [model.strip() for model in args.models.split(",")] if args.models else load_available_models()
+    except (OSError, ValueError) as e:
+        print(f"错误：{e}", file=sys.stderr)
+        return 1
+    models = list(dict.fromkeys(model for model in models if model))
+    if len(models) < 2:
+        print("错误：循环赛至少需要两个模型", file=sys.stderr)
+        return 1
+    
+    workers = args.workers or os.cpu_count() or 1
+    options = {
+        "backend": args.backend,
+        "api_key": args.api_key or os.environ.get("OPENAI_API_KEY"),
+        "model": models[0],
+        "mock_latency": args.mock_latency,
+        "structured_decisions": args.structured_decisions,
+        # 每个工作进程中每个模型有自己的限流器，每个模型的总配额平均分给各个进程
+        "rpm": args.rpm / workers if args.rpm else None,
+        "tpm": args.tpm / workers if args.tpm else None,
+        "max_rounds": args.max_rounds,
+        "parallel_voting": args.parallel_voting,
+        "concurrent_night": args.concurrent_night,
+        "concurrent_speech": args.concurrent_speech,
+        "reflection": args.reflection,
+        "reflection_interval": args.reflection_interval,
+        "prompt_layout": args.prompt_layout,
+        "wolf_decision": args.wolf_decision
+    }
+    if args.backend == "openai" and not options["api_key"]:
+        print("错误：使用openai后端需要--api-key参数或OPENAI_API_KEY环境变量", file=sys.stderr)
+        return 1
+    
+    ensure_prompt_templates()
+    
+    roles = [role.strip() for role in args.roles.split(",")] if args.roles else None
+    start_time = time.time()
+    result = run_tournament(models, args.games_per_matchup, args.output, args.workers, args.seed, roles, options,
+                            k_factor=args.k_factor)
+    elapsed = time.time() - start_time
+    
+    summary = result["summary"]
+    status = "已取消" if summary["cancelled"] else "完成"
+    print(f"{status}: {summary['completed']} 局，错误 {summary['errors']} 局，耗时 {elapsed:.1f} 秒", file=sys.stderr)
+    print("\n模型评分:")
+    for rank, row in enumerate(result["ratings"], 1):
+        print(f"{rank}. {row['model']}: {row['rating']}（{row['games']} 局，胜 {row['wins']} 负 {row['losses']} "
+              f"平 {row['draws']}，狼人阵营胜 {row['werewolf_wins']}，好人阵营胜 {row['good_wins']}）")
+    
+    if args.ratings:
+        with open(args.ratings, "w", encoding="utf-8") as f:
+            json.dump(result["ratings"], f, ensure_ascii=False, indent=2)
+    return 130 if summary["cancelled"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file